@@ -7,6 +7,7 @@ st.set_page_config(layout="wide")
 
 import leafmap.foliumap as leafmap
 import utils_ee
+from utils_trace import trace_panel
 
 # Now safe to call Streamlit functions
 utils_ee.initialize_earth_engine()
@@ -126,3 +127,6 @@ current_time = amsterdam_time.strftime("%H:%M:%S")
 st.sidebar.markdown(f"**Last Updated:** {last_updated}")
 # st.sidebar.markdown(f"**Local Time (Amsterdam):** {current_time}")
 
+
+# Earth Engine calls of this run, when tracing is enabled (EE_TRACE=1)
+trace_panel()
@@ -0,0 +1,158 @@
+"""
+Offline page benchmark against recorded Earth Engine responses.
+
+Record the Earth Engine traffic of the pages once (needs live credentials),
+then benchmark them without network access:
+
+    python benchmark.py record
+    python benchmark.py run [--update-baseline]
+
+Each page is rendered with streamlit.testing.v1.AppTest under the replay
+stand-in. The run reports render time, Earth Engine calls and peak Python
+memory per page, and exits non-zero when a page regressed past the baseline.
+"""
+
+import argparse
+import gc
+import json
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+import ee
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import standin_ee
+from config import DATABASE_PATH
+
+RECORDINGS_PATH = DATABASE_PATH / "ee_recordings"
+BASELINE_PATH = RECORDINGS_PATH / "baseline.json"
+
+PAGES = [
+    "Home.py",
+    "pages/1_📷_Land_Use_Habitats.py",
+    "pages/1_🪟_Step_1_Know_your_Landscapes.py",
+    "pages/3_🌲_Step_2_CRics.py",
+    "pages/4_🏘️_Step_3_Ecosystem_Services.py",
+    "pages/6_📁_Explore_EU_Datasets.py",
+]
+
+# Allowed slowdown / memory growth over the baseline before a run fails
+THRESHOLD = 0.25
+TIMEOUT = 600
+
+
+def recording_path(page):
+    """Recording file of a page, named by its ASCII part."""
+    name = re.sub(r"[^A-Za-z0-9]+", "_", page.rsplit("/", 1)[-1][:-3]).strip("_")
+    return RECORDINGS_PATH / f"{name}.json"
+
+
+def record_page(page):
+    """Render a page against live Earth Engine and store its responses."""
+    from utils_ee import initialize_earth_engine
+
+    ee.Reset()
+    with standin_ee.record(recording_path(page)) as recording:
+        initialize_earth_engine()
+        at = AppTest.from_file(page, default_timeout=TIMEOUT).run()
+    return len(recording), at.exception
+
+
+def _clear_caches():
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    gc.collect()
+
+
+def run_page(page, repeat=3):
+    """
+    Render a page offline ``repeat`` times, each with cold Streamlit caches.
+
+    Returns the median render time, the Earth Engine calls of one render,
+    calls missing from the recording, the peak Python memory (from a separate
+    traced render, as tracing slows rendering down) and exceptions.
+    """
+    times = []
+    with standin_ee.replay(recording_path(page)) as stats:
+        for _ in range(repeat):
+            _clear_caches()
+            started = time.perf_counter()
+            AppTest.from_file(page, default_timeout=TIMEOUT).run()
+            times.append(time.perf_counter() - started)
+
+        _clear_caches()
+        stats.update(calls=0, missing=0)
+        tracemalloc.start()
+        at = AppTest.from_file(page, default_timeout=TIMEOUT).run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "seconds": statistics.median(times),
+        "calls": stats["calls"],
+        "missing": stats["missing"],
+        "peak_mb": peak / 2**20,
+        "errors": [e.message for e in at.exception],
+    }
+
+
+def regressions(result, baseline, threshold=THRESHOLD):
+    """Reasons a page result is worse than its baseline."""
+    if baseline is None:
+        return []
+    reasons = []
+    if result["seconds"] > baseline["seconds"] * (1 + threshold):
+        reasons.append(
+            f"render {result['seconds']:.2f} s vs {baseline['seconds']:.2f} s"
+        )
+    if result["calls"] > baseline["calls"]:
+        reasons.append(f"{result['calls']} Earth Engine calls vs {baseline['calls']}")
+    if result["peak_mb"] > baseline["peak_mb"] * (1 + threshold):
+        reasons.append(
+            f"peak {result['peak_mb']:.0f} MB vs {baseline['peak_mb']:.0f} MB"
+        )
+    if result["errors"] and not baseline.get("errors"):
+        reasons.append("page raised: " + "; ".join(result["errors"]))
+    return reasons
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("mode", choices=["record", "run"])
+    parser.add_argument("pages", nargs="*", default=PAGES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="store this run as the baseline"
+    )
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        for page in args.pages:
+            count, errors = record_page(page)
+            print(
+                f"{page}: {count} responses recorded"
+                + (f", errors: {errors}" if errors else "")
+            )
+        sys.exit(0)
+
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    results, failed = {}, False
+    print(f"{'page':50} {'render s':>9} {'calls':>6} {'missing':>8} {'peak MB':>8}")
+    for page in args.pages:
+        result = results[page] = run_page(page, args.repeat)
+        print(
+            f"{page:50} {result['seconds']:9.2f} {result['calls']:6d} "
+            f"{result['missing']:8d} {result['peak_mb']:8.1f}"
+        )
+        for reason in regressions(result, baseline.get(page), args.threshold):
+            failed = True
+            print(f"  REGRESSION: {reason}")
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps({**baseline, **results}, indent=2))
+        print(f"Baseline written to {BASELINE_PATH}")
+    sys.exit(1 if failed and not args.update_baseline else 0)
@@ -1,7 +1,38 @@
 # config.py
+import os
 import tempfile
 from pathlib import Path
 
 # Safe, cross-platform downloads directory
 DOWNLOADS_PATH = Path(tempfile.gettempdir()) / "streamlit_downloads"
 DOWNLOADS_PATH.mkdir(parents=True, exist_ok=True)
+
+# Bundled data and precomputed products shipped with the app
+DATABASE_PATH = Path(__file__).resolve().parent / "database"
+RISK_CUBE_PATH = DATABASE_PATH / "risk_cube.parquet"
+COUNTRY_INDEX_PATH = DATABASE_PATH / "country_index.csv"
+
+# Local state shared between sessions (export registry, caches, logs)
+CACHE_PATH = Path(tempfile.gettempdir()) / "streamlit_cache"
+CACHE_PATH.mkdir(parents=True, exist_ok=True)
+
+# Earth Engine folder that holds materialized (hash-named) derived rasters
+MATERIALIZE_ROOT = "projects/ee-desmond/assets/desirmed/materialized"
+
+# Case-study regions (west, south, east, north); also used for precomputed composites
+REGIONS = {
+    "Split": (16.0, 42.8, 17.0, 43.7),
+}
+
+# Send every EcoChat request to this OpenAI-compatible endpoint instead of the
+# configured providers, e.g. the local stand-in (python standin_llm.py)
+LLM_BASE_URL = os.environ.get("ECOCHAT_BASE_URL")
+
+# Record every Earth Engine round trip (page, code location, latency, sizes)
+# to CACHE_PATH/ee_trace.jsonl and show a per-rerun debug panel on the pages
+EE_TRACE = os.environ.get("EE_TRACE") == "1"
+
+# Port of the Prometheus metrics endpoint started by serve.py, and the address
+# it listens on; set METRICS_HOST=0.0.0.0 to expose it beyond this machine
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9464))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
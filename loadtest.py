@@ -0,0 +1,206 @@
+"""
+Concurrent-session load test against the Earth Engine and LLM stand-ins.
+
+Each simulated session opens a page with streamlit.testing.v1.AppTest and
+clicks through a path (Step 1 region selection, CRICS scenario switching,
+EcoChat turns); sessions run on threads, like the sessions of one server
+process. Earth Engine is replayed from the benchmark recordings and chat
+goes to the local LLM stand-in, both with a configurable latency:
+
+    python benchmark.py record                # once, with live credentials
+    python loadtest.py --sessions 20 --processes 2 --ee-latency 0.2
+
+Reports throughput, p50/p95/p99 rerun latency per path and the CPU time and
+peak RSS of every process.
+"""
+
+import argparse
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+try:
+    import resource
+except ImportError:  # Windows: no CPU / RSS figures
+    resource = None
+
+TIMEOUT = 300
+LLM_PORT = 8870
+
+
+def _select(at, label, rng):
+    widget = next(w for w in at.selectbox if w.label == label)
+    options = [o for o in widget.options if o != widget.value] or widget.options
+    return widget.set_value(rng.choice(options)).run()
+
+
+def _step1(at, rng):
+    yield "NUTS1", lambda: _select(at, "Select NUTS1", rng)
+    yield "NUTS2", lambda: _select(at, "Select NUTS2", rng)
+    yield "NUTS3", lambda: _select(at, "Select NUTS3", rng)
+    yield "CORINE year", lambda: _select(at, "Select CORINE Year", rng)
+
+
+def _crics(at, rng):
+    for _ in range(3):
+        yield "scenario", lambda: _select(at, "Select Flood Scenario for Exposure", rng)
+    yield "indicator", lambda: _select(at, "Select Exposure Indicator", rng)
+
+
+def _ecochat(at, rng):
+    # own token: sessions are limited per session, not by the shared-key queue
+    yield "client", lambda: at.selectbox[0].set_value("HF-Token").run()
+    yield "token", lambda: at.text_input[0].set_value("hf_standin").run()
+    for turn in range(3):
+        topic = rng.choice(["floods", "wildfires", "erosion", "heat", "drought"])
+        question = f"Which habitats reduce {topic} risk? ({rng.random():.6f})"
+        yield "turn", lambda q=question: at.chat_input[0].set_value(q).run()
+
+
+# name: (page, steps)
+PATHS = {
+    "step1": ("pages/1_🪟_Step_1_Know_your_Landscapes.py", _step1),
+    "crics": ("pages/3_🌲_Step_2_CRics.py", _crics),
+    "ecochat": ("pages/5_🧠_EcoChat.py", _ecochat),
+}
+
+
+def run_session(name, seed, think_time=0.0):
+    """Walk one session through a path; returns ``(path, step, seconds, ok)`` rows."""
+    page, steps = PATHS[name]
+    rng = random.Random(seed)
+    at = AppTest.from_file(page, default_timeout=TIMEOUT)
+    at.secrets["GROQ_API_KEY"] = "standin"
+
+    rows = []
+    started = time.perf_counter()
+    try:
+        at.run()
+        rows.append((name, "open", time.perf_counter() - started, not at.exception))
+        for step, action in steps(at, rng):
+            time.sleep(rng.uniform(0, 2 * think_time))
+            started = time.perf_counter()
+            at = action()
+            rows.append((name, step, time.perf_counter() - started, not at.exception))
+    except Exception:  # a step whose widget never rendered, a timeout, ...
+        rows.append((name, "failed", time.perf_counter() - started, False))
+    return rows
+
+
+def _usage():
+    if resource is None:
+        return 0.0, 0.0
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in kB on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss * scale / 2**20
+
+
+def run_process(index, args):
+    """Run this process's share of the sessions behind its own stand-ins."""
+    import config
+    import standin_ee
+    import standin_llm
+    from benchmark import recording_path
+
+    llm = standin_llm.serve(
+        LLM_PORT + index, latency=args.llm_latency, token_delay=args.token_delay
+    )
+    config.LLM_BASE_URL = f"http://127.0.0.1:{LLM_PORT + index}/v1"
+    recordings = [
+        recording_path(page)
+        for page, _ in PATHS.values()
+        if recording_path(page).exists()
+    ]
+
+    names = [args.paths[i % len(args.paths)] for i in range(args.sessions)]
+    cpu_before, _ = _usage()
+    started = time.perf_counter()
+    with standin_ee.replay(recordings, latency=args.ee_latency) as stats:
+        with ThreadPoolExecutor(args.sessions) as pool:
+            futures = [
+                pool.submit(run_session, name, f"{index}-{i}", args.think_time)
+                for i, name in enumerate(names)
+            ]
+            rows = [row for future in futures for row in future.result()]
+    wall = time.perf_counter() - started
+    cpu_after, rss = _usage()
+    llm.shutdown()
+    return {
+        "process": index,
+        "rows": rows,
+        "wall": wall,
+        "cpu": cpu_after - cpu_before,
+        "rss_mb": rss,
+        "ee_calls": stats["calls"],
+        "ee_missing": stats["missing"],
+        "llm_requests": llm.stats["requests"],
+    }
+
+
+def report(results):
+    """Print throughput, latency percentiles and per-process resources."""
+    rows = [row for result in results for row in result["rows"]]
+    wall = max(result["wall"] for result in results)
+    print(
+        f"{len(rows)} reruns in {wall:.1f} s: {len(rows) / wall:.2f} reruns/s, "
+        f"{sum(not ok for *_, ok in rows)} failed\n"
+    )
+    print(f"{'path':10} {'step':12} {'n':>5} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7}")
+    groups = {}
+    for name, step, seconds, _ in rows:
+        groups.setdefault((name, step), []).append(seconds)
+        groups.setdefault((name, "all"), []).append(seconds)
+        groups.setdefault(("all", ""), []).append(seconds)
+    for (name, step), seconds in sorted(groups.items()):
+        p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+        print(f"{name:10} {step:12} {len(seconds):5d} {p50:7.2f} {p95:7.2f} {p99:7.2f}")
+
+    print(
+        f"\n{'process':>7} {'CPU s':>7} {'CPU %':>6} {'peak RSS MB':>12} {'EE calls':>9}"
+        f" {'missing':>8} {'LLM calls':>9}"
+    )
+    for r in results:
+        print(
+            f"{r['process']:7d} {r['cpu']:7.1f} {100 * r['cpu'] / r['wall']:6.0f} "
+            f"{r['rss_mb']:12.0f} {r['ee_calls']:9d} {r['ee_missing']:8d} "
+            f"{r['llm_requests']:9d}"
+        )
+    if any(r["ee_missing"] for r in results):
+        print("\nSome Earth Engine calls had no recording; record the pages first.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10, help="sessions per process")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--paths", nargs="+", choices=list(PATHS), default=list(PATHS))
+    parser.add_argument(
+        "--think-time", type=float, default=0.5, help="mean seconds between clicks"
+    )
+    parser.add_argument(
+        "--ee-latency", type=float, default=0.2, help="seconds per Earth Engine call"
+    )
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.5, help="seconds to the first token"
+    )
+    parser.add_argument(
+        "--token-delay", type=float, default=0.02, help="seconds per streamed word"
+    )
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        results = [run_process(0, args)]
+    else:
+        with ProcessPoolExecutor(
+            args.processes, mp_context=get_context("spawn")
+        ) as pool:
+            results = list(
+                pool.map(run_process, range(args.processes), [args] * args.processes)
+            )
+    report(results)
@@ -1,5 +1,6 @@
 import streamlit as st
 import ee
+from utils_trace import trace_panel
 import folium
 import leafmap.foliumap as leafmap
 from utils_ee import initialize_earth_engine  #  Auth from secret config
@@ -403,4 +404,7 @@ last_updated = amsterdam_time.strftime("%B %d, %Y")
 current_time = amsterdam_time.strftime("%H:%M:%S")
 
 st.sidebar.markdown(f"**Last Updated:** {last_updated}")
-# st.sidebar.markdown(f"**Local Time (Amsterdam):** {current_time}")
\ No newline at end of file
+# st.sidebar.markdown(f"**Local Time (Amsterdam):** {current_time}")
+
+# Earth Engine calls of this run, when tracing is enabled (EE_TRACE=1)
+trace_panel()
@@ -1,8 +1,13 @@
 import streamlit as st
 import ee
+from utils_trace import trace_panel
 import folium
 import geemap.foliumap as geemap 
-from utils_ee import initialize_earth_engine  #  Auth from secret config
+from utils_ee import initialize_earth_engine, expression_hash  #  Auth from secret config
+from utils_dag import session_graph
+from utils_ee_cache import cached_info  # getInfo shared across sessions
+from utils_landcover import transition_matrix, transition_sankey
+from utils_classes import corine_to_eunis, corine_classes, landscape_archetypes, eunis_labels
 import zipfile
 import os
 import geopandas as gpd
@@ -19,15 +24,15 @@ admin2 = ee.FeatureCollection("projects/sat-io/open-datasets/geoboundaries/CGAZ_
 st.title("Know your landscapes") 
 
 # Step 1: AOI selection via dropdowns
-countries = admin0.aggregate_array('shapeName').getInfo()
+countries = cached_info(admin0.aggregate_array('shapeName'))
 selected_country = st.selectbox("Select NUTS1", sorted(countries))
 country_geom = admin0.filter(ee.Filter.eq('shapeName', selected_country)).geometry()
 
-regions = admin1.filterBounds(country_geom).aggregate_array('shapeName').getInfo()
+regions = cached_info(admin1.filterBounds(country_geom).aggregate_array('shapeName'))
 selected_region = st.selectbox("Select NUTS2", sorted(regions))
 region_geom = admin1.filter(ee.Filter.eq('shapeName', selected_region)).geometry()
 
-subregions = admin2.filterBounds(region_geom).aggregate_array('shapeName').getInfo()
+subregions = cached_info(admin2.filterBounds(region_geom).aggregate_array('shapeName'))
 selected_subregion = st.selectbox("Select NUTS3", sorted(subregions))
 aoi = admin2.filter(ee.Filter.eq('shapeName', selected_subregion))
 
@@ -72,15 +77,6 @@ CORINE_YEARS = {
     '2018': ee.Image('COPERNICUS/CORINE/V20/100m/2018').select('landcover')
 }
 
-# Crosswalk mapping from CORINE classes to EUNIS numeric codes
-corine_to_eunis = {
-    111: 1, 112: 2, 121: 3, 122: 4, 123: 5, 124: 6, 131: 7, 132: 8, 133: 9,
-    141: 10, 142: 1, 211: 11, 212: 12, 213: 13, 221: 14, 222: 15, 223: 16,
-    231: 17, 241: 18, 242: 19, 243: 20, 244: 21, 311: 22, 312: 23, 313: 24,
-    321: 25, 322: 26, 323: 27, 324: 28, 331: 29, 332: 30, 333: 31, 334: 32,
-    335: 33, 411: 34, 412: 35, 421: 36, 422: 37, 423: 38, 511: 39, 512: 40,
-    521: 41, 522: 42, 523: 43
-}
 
 # EUNIS color palette (43 classes)
 eunis_palette = [
@@ -93,13 +89,6 @@ eunis_palette = [
     '#87cefa'
 ]
 
-# Clip both CORINE layers immediately to final AOI
-CLIPPED_CORINE = {
-    '2012': CORINE_YEARS['2012'].clip(final_aoi),
-    '2018': CORINE_YEARS['2018'].clip(final_aoi)
-}
-
-
 # Year selection + retrieval of clipped image --> we can choose this or the other....full corine or only clipped to AOI
 # selected_year = st.selectbox("Select CORINE Year", ['2012', '2018'])
 # corine_img = CLIPPED_CORINE[selected_year]
@@ -116,53 +105,6 @@ corine_img = (
 )
 
 
-# Full CORINE class (44 values)
-corine_classes = {
-    111: 'Continuous Urban Fabric',
-    112: 'Discontinuous Urban Fabric',
-    121: 'Industrial/Commercial Units',
-    122: 'Road/rail networks',
-    123: 'Port areas',
-    124: 'Airports',
-    131: 'Mineral extraction sites',
-    132: 'Dump sites',
-    133: 'Construction sites',
-    141: 'Green urban areas',
-    142: 'Sport/leisure facilities',
-    211: 'Non-irrigated arable land',
-    212: 'Permanently irrigated land',
-    213: 'Rice fields',
-    221: 'Vineyards',
-    222: 'Fruit trees',
-    223: 'Olive groves',
-    231: 'Pastures',
-    241: 'Annual crops associated with permanent crops',
-    242: 'Complex cultivation patterns',
-    243: 'Agro-forestry',
-    244: 'Agro-natural mosaic',
-    311: 'Broad-leaved forest',
-    312: 'Coniferous forest',
-    313: 'Mixed forest',
-    321: 'Natural grasslands',
-    322: 'Moors/heathland',
-    323: 'Sclerophyllous vegetation',
-    324: 'Transitional woodland-shrub',
-    331: 'Beaches/dunes/sands',
-    332: 'Bare rocks',
-    333: 'Sparsely vegetated areas',
-    334: 'Burnt areas',
-    335: 'Glaciers and perpetual snow',
-    411: 'Inland marshes',
-    412: 'Peat bogs',
-    421: 'Salt marshes',
-    422: 'Salines',
-    423: 'Intertidal flats',
-    511: 'Water courses',
-    512: 'Water bodies',
-    521: 'Coastal lagoons',
-    522: 'Estuaries',
-    523: 'Sea and ocean'
-}
 
 corine_palette = [
     "#ff0000", "#e6004d", "#cc4d00", "#cc0000", "#e6b3b3", "#a64d79",
@@ -176,25 +118,6 @@ corine_palette = [
 ]
 
 
-# Reclassification logics
-landscape_archetypes = {
-    '1': {'classes': [111,112,121,122], 'color': '#636363', 'description': 'Urban'},
-    '2': {'classes': [123,124], 'color': '#969696', 'description': 'Coastal Urban'},
-    '3': {'classes': [131,132,133], 'color': '#cccccc', 'description': 'Industrial'},
-    '4': {'classes': [141,142], 'color': '#91d700', 'description': 'Recreational'},
-    '5': {'classes': [211,212,213], 'color': '#91d700', 'description': 'Rural (Flat)'},
-    '6': {'classes': [221,222,223,231], 'color': '#df9f00', 'description': 'Rural (Hilly)'},
-    '7': {'classes': [311,312,313,321,322,323,324], 'color': '#80ff00', 'description': 'Forested'},
-    '8': {'classes': [332,333,334,335], 'color': '#a63603', 'description': 'Mountainous'},
-    '9': {'classes': [241,242,243,244], 'color': '#78c679', 'description': 'Rural'},
-    '10': {'classes': [331], 'color': '#ffcc99', 'description': 'Coastal (Beach)'},
-    '11': {'classes': [421,422,423], 'color': '#7fff00', 'description': 'Coastal Rural'},
-    '12': {'classes': [411,412], 'color': '#a6e6ff', 'description': 'Wetlands'},
-    '13': {'classes': [511,512], 'color': '#4da6ff', 'description': 'Inland Water'},
-    '14': {'classes': [521,522,523], 'color': '#00bfff', 'description': 'Marine'}
-}
-
-
 from_list, to_list, palette = [], [], []
 legend_dict = {}
 
@@ -209,18 +132,25 @@ def reclassify_to_eunis(image):
     to_list = list(corine_to_eunis.values())
     return image.remap(from_list, to_list).rename("eunis")
 
-CLIPPED_EUNIS = {
-    '2012': reclassify_to_eunis(CORINE_YEARS['2012']).clip(final_aoi),
-    '2018': reclassify_to_eunis(CORINE_YEARS['2018']).clip(final_aoi)
-}
-
 def reclassify(img):
     remapped = img.remap(from_list, to_list).rename('archetype')
     return remapped.updateMask(remapped.neq(0))
 
-corine_img = CLIPPED_CORINE[selected_year]
+# AOI products (clipped CORINE, EUNIS and archetypes per year, centroid, region)
+# are built lazily for this session and reused until the AOI changes
+graph = session_graph("step1")
+graph.input("aoi", final_aoi, key=expression_hash(final_aoi))
+graph.node("aoi_geometry", ["aoi"], lambda aoi: aoi if isinstance(aoi, ee.Geometry) else aoi.geometry())
+for year, image in CORINE_YEARS.items():
+    graph.node(f"corine_{year}", ["aoi"], lambda aoi, image=image: image.clip(aoi))
+    graph.node(f"eunis_{year}", ["aoi"], lambda aoi, image=image: reclassify_to_eunis(image).clip(aoi))
+    graph.node(f"archetype_{year}", [f"corine_{year}"], lambda corine: reclassify(corine))
+graph.node("centroid", ["aoi_geometry"], lambda geom: cached_info(geom.centroid().coordinates()))
+graph.node("region", ["aoi_geometry"], lambda geom: cached_info(geom))
 
-archetype_img = reclassify(corine_img).clip(final_aoi)
+corine_img = graph[f"corine_{selected_year}"]
+
+archetype_img = graph[f"archetype_{selected_year}"]
 
 # Map Display
 st.subheader(f"Check out and inspect Biophysical archetypes ({selected_year})")
@@ -228,8 +158,7 @@ st.subheader(f"Check out and inspect Biophysical archetypes ({selected_year})")
 
 
 # Handle both ee.Geometry and ee.FeatureCollection for centroid
-aoi_geom_for_centroid = final_aoi if isinstance(final_aoi, ee.Geometry) else final_aoi.geometry()
-aoi_centroid = aoi_geom_for_centroid.centroid().coordinates().getInfo()
+aoi_centroid = graph["centroid"]
 
 # populations
 ghs_years = [2015, 2020, 2025, 2030]
@@ -262,7 +191,7 @@ Map.addLayer(
 )
 
 Map.addLayer(
-    CLIPPED_EUNIS[selected_year],
+    graph[f"eunis_{selected_year}"],
     {"min": 1, "max": 43, "palette": eunis_palette},
     f"EUNIS {selected_year}"
 )
@@ -349,23 +278,6 @@ with st.expander("CORINE Legend (44 classes)"):
 
 with st.expander("EUNIS Legend (43 classes)"):
 
-    eunis_labels = {
-        1: "Urban buildings", 2: "Suburban housing", 3: "Low density build",
-        4: "Transport", 5: "Ports", 6: "Airports", 7: "Extractive industry",
-        8: "Waste deposits", 9: "Construction", 10: "Parks", 11: "Arable land",
-        12: "Crops (intensive)", 13: "Rice fields", 14: "Vineyards",
-        15: "Fruit shrubs", 16: "Olive trees", 17: "Grassland",
-        18: "Mixed crops", 19: "Garden crops", 20: "Low-intensity crops",
-        21: "Wooded grassland", 22: "Broadleaf forest", 23: "Conifer forest",
-        24: "Mixed woodland", 25: "Dry grasslands", 26: "Shrub heath",
-        27: "Medit. brush", 28: "Fringes/clearings", 29: "Beaches/dunes",
-        30: "Littoral rock", 31: "Sparse inland", 32: "Burnt land",
-        33: "Snow/Ice", 34: "Inland shore", 35: "Peat bogs",
-        36: "Salt marshes", 37: "Saline artificial", 38: "Littoral sand",
-        39: "Rivers", 40: "Lakes", 41: "Lagoons", 42: "Estuaries",
-        43: "Marine sand"
-    }
-
     eunis_palette = [
         "#a50026", "#d73027", "#f46d43", "#fdae61", "#fee08b", "#ffffbf",
         "#d9ef8b", "#a6d96a", "#66bd63", "#1a9850", "#006837", "#d4eeff",
@@ -453,22 +365,71 @@ Map.add_child(legend_layer)
 Map.add_child(folium.LayerControl())
 Map.to_streamlit(height=600)
 
+# --- Land Cover Change (2012 → 2018) ---
+# A fragment: switching the level reruns only this section, not the map above
+@st.fragment
+def land_cover_change(graph):
+    st.subheader("🔄 Land Cover Change (2012 → 2018)")
+
+    change_level = st.radio("Change analysis level", ["Archetypes", "EUNIS"], horizontal=True)
+
+    if change_level == "Archetypes":
+        change_from = graph['archetype_2012']
+        change_to = graph['archetype_2018']
+        change_labels = {int(k): v['description'] for k, v in landscape_archetypes.items()}
+        change_colors = {int(k): v['color'] for k, v in landscape_archetypes.items()}
+    else:
+        change_from = graph['eunis_2012']
+        change_to = graph['eunis_2018']
+        change_labels = eunis_labels
+        change_colors = {i: eunis_palette[i - 1] for i in eunis_labels}
+
+    try:
+        with st.spinner("Computing transition matrix..."):
+            change_df = transition_matrix(
+                graph.key("aoi"), change_level, change_from, change_to, graph["aoi"]
+            )
+
+        if change_df.empty:
+            st.info("No land cover data found inside the AOI.")
+        else:
+            changed_ha = change_df.loc[change_df["from"] != change_df["to"], "area_ha"].sum()
+            st.metric("Area changed 2012 → 2018", f"{changed_ha:,.1f} ha",
+                      f"{changed_ha / change_df['area_ha'].sum() * 100:.2f}% of AOI")
+
+            change_table = change_df.assign(
+                From=change_df["from"].map(lambda c: change_labels.get(c, c)),
+                To=change_df["to"].map(lambda c: change_labels.get(c, c)),
+            ).pivot_table(index="From", columns="To", values="area_ha", aggfunc="sum", fill_value=0)
+
+            with st.expander("Transition matrix (ha)"):
+                st.dataframe(change_table.round(1), use_container_width=True)
+
+            st.plotly_chart(
+                transition_sankey(change_df, change_labels, "2012", "2018", change_colors),
+                use_container_width=True
+            )
+    except Exception as e:
+        st.error(f" Could not compute land cover change: {e}")
+
+
+land_cover_change(graph)
+
 # --- Download Section for Displayed Layers ---
 st.subheader("🧷 Quick Download")
 
-# Use current AOI
-download_region = final_aoi if isinstance(final_aoi, ee.Geometry) else final_aoi.geometry()
-region_json = download_region.getInfo()  # Move to client-side for download
+# Helper: Generate download URL (the region is moved client-side once per AOI)
+def download_url(image, region_json):
+    return image.getDownloadURL({
+        'scale': 100,
+        'crs': 'EPSG:3857',
+        'region': region_json,
+        'format': 'GeoTIFF'
+    })
 
-# Helper: Generate download URL
-def get_download_url(image, label):
+def get_download_url(node, label):
     try:
-        url = image.getDownloadURL({
-            'scale': 100,
-            'crs': 'EPSG:3857',
-            'region': region_json,
-            'format': 'GeoTIFF'
-        })
+        url = graph[node]
         st.markdown(
             f"[ Download {label} ({selected_year}) as GeoTIFF]({url})",
             unsafe_allow_html=True
@@ -477,31 +438,26 @@ def get_download_url(image, label):
         st.error(f" Could not generate download for {label}: {e}")
 
 # 1. CORINE (raw)
-corine_raw = CLIPPED_CORINE[selected_year].toInt()
-get_download_url(corine_raw, "CORINE Raw")
+graph.node(
+    f"download_corine_{selected_year}", [f"corine_{selected_year}", "region"],
+    lambda corine, region: download_url(corine.toInt(), region)
+)
+get_download_url(f"download_corine_{selected_year}", "CORINE Raw")
 
 # 2. Archetypes (reclassified)
-archetype_img = reclassify(corine_raw).clip(download_region).toInt()
-get_download_url(archetype_img, "Landscape Archetypes")
+graph.node(
+    f"download_archetype_{selected_year}", [f"archetype_{selected_year}", "region"],
+    lambda archetype, region: download_url(archetype.toInt(), region)
+)
+get_download_url(f"download_archetype_{selected_year}", "Landscape Archetypes")
 
 # 3. EUNIS (reclassified)
 try:
-    def corine_to_eunis(image):
-        landCoverToEunisNumeric = {
-            111: 1, 112: 2, 121: 3, 122: 4, 123: 5, 124: 6,
-            131: 7, 132: 8, 133: 9, 141: 10, 142: 1, 211: 11, 212: 12, 213: 13,
-            221: 14, 222: 15, 223: 16, 231: 17, 241: 18, 242: 19, 243: 20,
-            244: 21, 311: 22, 312: 23, 313: 24, 321: 25, 322: 26, 323: 27,
-            324: 28, 331: 29, 332: 30, 333: 31, 334: 32, 335: 33, 411: 34,
-            412: 35, 421: 36, 422: 37, 423: 38, 511: 39, 512: 40, 521: 41,
-            522: 42, 523: 43
-        }
-        from_list = list(landCoverToEunisNumeric.keys())
-        to_list = list(landCoverToEunisNumeric.values())
-        return image.remap(from_list, to_list).rename('eunis')
-
-    eunis_img = corine_to_eunis(corine_raw).clip(download_region).toInt()
-    get_download_url(eunis_img, "EUNIS Reclassified")
+    graph.node(
+        f"download_eunis_{selected_year}", [f"eunis_{selected_year}", "region"],
+        lambda eunis, region: download_url(eunis.toInt(), region)
+    )
+    get_download_url(f"download_eunis_{selected_year}", "EUNIS Reclassified")
 except Exception:
     st.info(" EUNIS layer not configured or skipped.")
 
@@ -523,14 +479,8 @@ with st.expander("Check this Population out!"):
 
 
 # -------------------- Export Options --------------------
-st.subheader(" Export Options")
-
-export_format = st.radio("Select Export Format", ["GeoTIFF", "SHP"])
-selected_years = st.multiselect("Select CORINE Year(s)", ['2012', '2018'], default=['2012'])
-
-export_folder = st.text_input("Drive folder name", value="desirmed")
-custom_prefix = st.text_input("File name prefix (base)", value="Archetypes")
-
+# A form inside a fragment: editing the options reruns nothing, and submitting
+# reruns only this section instead of the map and its Earth Engine calls
 def vectorize(image, geom, year):
     vectors = image.reduceToVectors(
         geometry=geom,
@@ -541,32 +491,24 @@ def vectorize(image, geom, year):
     )
     return vectors.map(lambda f: f.set('year', year))
 
-# Export to EE Asset
-col1, col2 = st.columns(2)
-export_base_name = f"{custom_prefix}_{selected_subregion}_{selected_year}"
-region = final_aoi if isinstance(final_aoi, ee.Geometry) else final_aoi.geometry()
-
-# with col1:
-#     if st.button("Export to EE Asset"):
-#         asset_id = f"projects/ee-desmond/assets/{export_base_name}"
-#         task = ee.batch.Export.image.toAsset(
-#             image=archetype_img,
-#             description=export_base_name + "_Asset",
-#             assetId=asset_id,
-#             region=region,
-#             scale=100,
-#             maxPixels=1e13
-#         )
-#         task.start()
-#         st.success(f" Export to EE Asset started.\n Asset ID: `{asset_id}`")
-
-# Export to Drive
-with col2:
-    if st.button("Export Selected Years to Drive"):
+@st.fragment
+def export_options(graph, subregion):
+    st.subheader(" Export Options")
+
+    with st.form("export_options"):
+        export_format = st.radio("Select Export Format", ["GeoTIFF", "SHP"])
+        selected_years = st.multiselect("Select CORINE Year(s)", ['2012', '2018'], default=['2012'])
+
+        export_folder = st.text_input("Drive folder name", value="desirmed")
+        custom_prefix = st.text_input("File name prefix (base)", value="Archetypes")
+
+        region = graph["aoi_geometry"]
+        submitted = st.form_submit_button("Export Selected Years to Drive")
+
+    if submitted:
         for year in selected_years:
-            corine_img = CLIPPED_CORINE[year]
-            archetype_img = reclassify(corine_img).clip(final_aoi)
-            file_prefix = f"{custom_prefix}_{selected_subregion}_{year}"
+            archetype_img = graph[f"archetype_{year}"]
+            file_prefix = f"{custom_prefix}_{subregion}_{year}"
 
             if export_format == "GeoTIFF":
                 task = ee.batch.Export.image.toDrive(
@@ -593,7 +535,10 @@ with col2:
                 task.start()
                 st.success(f" SHP export for {year} started to Drive/{export_folder}/{file_prefix}_Vector.zip")
 
-st.info(" To check export progress, go to the [Earth Engine Code Editor](https://code.earthengine.google.com/) and click on the 'Tasks' tab.")
+    st.info(" To check export progress, go to the [Earth Engine Code Editor](https://code.earthengine.google.com/) and click on the 'Tasks' tab.")
+
+
+export_options(graph, selected_subregion)
 
 
 import datetime
@@ -627,4 +572,7 @@ last_updated = amsterdam_time.strftime("%B %d, %Y")
 current_time = amsterdam_time.strftime("%H:%M:%S")
 
 st.sidebar.markdown(f"**Last Updated:** {last_updated}")
-# st.sidebar.markdown(f"**Local Time (Amsterdam):** {current_time}")
\ No newline at end of file
+# st.sidebar.markdown(f"**Local Time (Amsterdam):** {current_time}")
+
+# Earth Engine calls of this run, when tracing is enabled (EE_TRACE=1)
+trace_panel()
@@ -1,7 +1,19 @@
 import datetime
 import ee
+from utils_trace import trace_panel
 import streamlit as st
 from utils_ee import initialize_earth_engine
+from utils_risk import (
+    POPULATION_ASSET, ECO_ASSET, BUILDINGS_ASSET, ROADS_ASSET,
+    POP_YEARS, CHILDREN_PROPS, ELDERLY_PROPS,
+    density_image, exposure_by_depth, summarize_exposure, load_risk_cube, cube_lookup,
+    flood_raster, population_raster, case_study_assets,
+)
+from utils_ee_cache import cached_info  # getInfo shared across sessions
+from utils_landcover import dynamic_world_layer, month_bucket
+from utils_layers import FOOTPRINT_MIN_ZOOM, DENSITY_VIS, map_view, view_center, render_map, buildings_layer, roads_layer, cached_tile_layer
+from utils_countries import load_country_index, region_info, region_bbox
+from config import RISK_CUBE_PATH, REGIONS
 import geemap.foliumap as geemap
 import pandas as pd
 import plotly.express as px
@@ -15,24 +27,16 @@ st.set_page_config(layout="wide")
 # Initialize Earth Engine
 initialize_earth_engine()
 
-# Load Flood FeatureCollections
-floods_HP = ee.FeatureCollection("projects/ee-desmond/assets/desirmed/floods_HP_2019")
-floods_MP = ee.FeatureCollection("projects/ee-desmond/assets/desirmed/floods_MP_2019")
-floods_LP = ee.FeatureCollection("projects/ee-desmond/assets/desirmed/floods_LP_2019")
-
 # Load Ecosystem Services raster to extract CRS and scale
-eco_img = ee.Image("projects/ee-desmond/assets/desirmed/Ecosystem_Services_2018_Raster_Asset")
+eco_img = ee.Image(ECO_ASSET)
 eco_crs = eco_img.projection()
 eco_scale = eco_img.projection().nominalScale()
 
-# Function to rasterize floods
-def rasterize_floods(fc, property_name='M_KL_DUB', scale=eco_scale, crs=eco_crs):
-    return fc.reduceToImage(properties=[property_name], reducer=ee.Reducer.first()).reproject(crs=crs, scale=scale)
-
-# Rasterized flood hazard layers
-floods_hp_img = rasterize_floods(floods_HP)
-floods_mp_img = rasterize_floods(floods_MP)
-floods_lp_img = rasterize_floods(floods_LP)
+# Rasterized flood hazard layers, served from their assets once exported
+# (`python utils_risk.py --materialize`)
+floods_hp_img = flood_raster("High Probability")
+floods_mp_img = flood_raster("Medium Probability")
+floods_lp_img = flood_raster("Low Probability")
 
 flood_depth_classes = {
     1: "< 0.5 m",
@@ -47,42 +51,23 @@ flood_palette = ['blue', 'cyan', 'yellow', 'orange', 'red']
 flood_palette = ['blue', 'cyan', 'yellow', 'orange', 'red']
 flood_vis = {"min": 1, "max": 5, "palette": flood_palette}
 
-# Create tile layers for floods
-hp_layer = geemap.ee_tile_layer(floods_hp_img, flood_vis, "Floods HP")
-mp_layer = geemap.ee_tile_layer(floods_mp_img, flood_vis, "Floods MP")
-lp_layer = geemap.ee_tile_layer(floods_lp_img, flood_vis, "Floods LP")
-
-
-# Load Microsoft Buildings for Croatia
-ms_buildings_hr = ee.FeatureCollection('projects/sat-io/open-datasets/MSBuildings/Croatia')
-
-# Optional: Filter to your region (e.g., Split)
-split_bbox = ee.Geometry.BBox(16.3, 43.4, 16.6, 43.6)
-ms_buildings_split = ms_buildings_hr.filterBounds(split_bbox)
-
-# Style the layer (outline only, transparent fill)
-ms_building_vis = ms_buildings_split.style(
-    color='FF5500',
-    fillColor='00000000',
-    width=1
-)
-
-# Create tile layer
-ms_building_layer = geemap.ee_tile_layer(ms_building_vis, {}, "Buildings (Microsoft)")
-
-
-# Load GRIP4 Europe roads
-grip4_europe = ee.FeatureCollection("projects/sat-io/open-datasets/GRIP4/Europe")
+# Flood layers as (image, vis); tiles are only requested for layers put on the map
+flood_layers = {
+    "Floods HP": (floods_hp_img, flood_vis),
+    "Floods MP": (floods_mp_img, flood_vis),
+    "Floods LP": (floods_lp_img, flood_vis),
+}
 
-# Filter to the Split region
-split_bbox = ee.Geometry.BBox(16.0, 42.8, 17.0, 43.7)
-split_roads = grip4_europe.filterBounds(split_bbox)
 
-# Style the roads (thin red lines)
-road_style = split_roads.style(color='FF5500', width=1)
+# Load Microsoft Buildings for Croatia and GRIP4 Europe roads. Both are only
+# drawn for the visible map extent (see utils_layers)
+ms_buildings_hr = ee.FeatureCollection(BUILDINGS_ASSET)
+grip4_europe = ee.FeatureCollection(ROADS_ASSET)
 
-# Convert to tile layer
-roads_layer = geemap.ee_tile_layer(road_style, {}, "Roads (GRIP4)")
+# Buildings and roads counted by the exposure and risk panels, limited to the
+# case-study extents (the same ones the risk cube uses)
+split_buildings, split_roads = case_study_assets()
+MAP_KEY = "crics_map"
 
 
 # Load other base datasets
@@ -100,10 +85,20 @@ esri_vis = {
 }
 
 # Load the FeatureCollection once
-population_fc = ee.FeatureCollection("projects/ee-desmond/assets/desirmed/settlements_population_with_gender_age")
+population_fc = ee.FeatureCollection(POPULATION_ASSET)
 
 # Define years to visualize
-pop_years = ["2011", "2021", "2025", "2030"]
+pop_years = POP_YEARS
+
+
+# Precomputed scenario × year × indicator cube (build with `python utils_risk.py`).
+# Panels read from it when present and fall back to live Earth Engine otherwise.
+@st.cache_data
+def read_risk_cube(modified):
+    return load_risk_cube()
+
+
+risk_cube = read_risk_cube(RISK_CUBE_PATH.stat().st_mtime) if RISK_CUBE_PATH.exists() else None
 
 # Define visualization settings
 pop_vis = {
@@ -113,11 +108,7 @@ pop_vis = {
 }
 
 pop_tile_layers = {
-    f"Population {year}": geemap.ee_tile_layer(
-        population_fc.reduceToImage([f"pop_{year}"], ee.Reducer.first()).reproject(crs=eco_crs, scale=eco_scale),
-        pop_vis,
-        f"Population {year}"
-    )
+    f"Population {year}": (population_raster(year), pop_vis)
     for year in pop_years
 }
 
@@ -142,13 +133,6 @@ st.sidebar.info(
 # Main title
 st.title("Climate Risk Impact Assessment")
 
-# Layout
-col1, col2 = st.columns([4, 1])
-Map = geemap.Map()
-Map.add_basemap("ESA WorldCover 2020 S2 FCC")
-Map.add_basemap("ESA WorldCover 2020 S2 TCC")
-Map.add_basemap("HYBRID")
-
 
 # CORINE Land Cover
 CORINE_YEARS = {
@@ -217,439 +201,487 @@ corine_palette = [
     "#a6ffe6", "#e6f2ff"]
 
 
-# Sidebar controls
-with col2:
-    # Fixed location center and zoom (Split, Croatia)
-    longitude = 16.4402
-    latitude = 43.5081
-    zoom = 11
-    Map.setCenter(longitude, latitude, zoom)
-
-    # Dynamic World time range
-    start = st.date_input("Start Date for Dynamic World", datetime.date(2020, 1, 1))
-    end = st.date_input("End Date for Dynamic World", datetime.date(2021, 1, 1))
-    start_date = start.strftime("%Y-%m-%d")
-    end_date = end.strftime("%Y-%m-%d")
-
-
-    # Set region for Dynamic World globally (you can later restrict this if needed)
-    region = ee.Geometry.BBox(-179, -89, 179, 89)
-    dw = geemap.dynamic_world(region, start_date, end_date, return_type="hillshade")
-
-
-    # Layer toggle and split map interface
-    # Add CORINE 2012 and 2018 directly to selectable layers
-    corine_2012 = geemap.ee_tile_layer(
-        CORINE_YEARS["2012"], {"min": 111, "max": 523, "palette": corine_palette}, "CORINE 2012"
-    )
-    corine_2018 = geemap.ee_tile_layer(
-        CORINE_YEARS["2018"], {"min": 111, "max": 523, "palette": corine_palette}, "CORINE 2018"
-    )
-
-    layers = {
-    "Floods HP": hp_layer,
-    "ESA Land Cover": geemap.ee_tile_layer(esa, esa_vis, "ESA Land Cover"),
-    "Dynamic World": geemap.ee_tile_layer(dw, {}, "Dynamic World Land Cover"),
-    "ESRI Land Cover": geemap.ee_tile_layer(esri, esri_vis, "ESRI Land Cover"),
-    "Floods MP": mp_layer,
-    "Floods LP": lp_layer,
-    "CORINE 2012": corine_2012,
-    "CORINE 2018": corine_2018,
-    **pop_tile_layers,  # Unpack population layers
+# ---------------------- Map ----------------------
+# A fragment: layer, legend and date choices and map pans rerun only the map,
+# not the settlement panels and their Earth Engine reductions below
+@st.fragment
+def map_panel():
+    # Layout
+    col1, col2 = st.columns([4, 1])
+    Map = geemap.Map()
+    Map.add_basemap("ESA WorldCover 2020 S2 FCC")
+    Map.add_basemap("ESA WorldCover 2020 S2 TCC")
+    Map.add_basemap("HYBRID")
+
+    # Sidebar controls
+    with col2:
+        # Start on Split, Croatia, then follow the view reported by the map
+        longitude = 16.4402
+        latitude = 43.5081
+        zoom = 11
+        view_bounds = REGIONS["Split"]
+        view = map_view(MAP_KEY)
+        if view is not None:
+            view_bounds, zoom = view
+            longitude, latitude = view_center(view_bounds)
+        Map.setCenter(longitude, latitude, zoom)
+
+        # Dynamic World time range
+        start = st.date_input("Start Date for Dynamic World", datetime.date(2020, 1, 1))
+        end = st.date_input("End Date for Dynamic World", datetime.date(2021, 1, 1))
+        # Composites are scoped to the Split case study and snapped to whole months so
+        # sessions share cached tiles (single months precomputed with
+        # `python utils_landcover.py` come from their assets)
+        dw_start, dw_end = month_bucket(start, end)
+        st.caption(f"Dynamic World composite: {dw_start:%b %Y} – {dw_end - datetime.timedelta(days=1):%b %Y}")
+
+
+        # Layer toggle and split map interface
+        # Add CORINE 2012 and 2018 directly to selectable layers
+        corine_vis = {"min": 111, "max": 523, "palette": corine_palette}
+        corine_2012 = (CORINE_YEARS["2012"], corine_vis)
+        corine_2018 = (CORINE_YEARS["2018"], corine_vis)
+
+        layers = {
+        "Floods HP": flood_layers["Floods HP"],
+        "ESA Land Cover": (esa, esa_vis),
+        "Dynamic World": "DYNAMIC_WORLD",
+        "ESRI Land Cover": (esri, esri_vis),
+        "Floods MP": flood_layers["Floods MP"],
+        "Floods LP": flood_layers["Floods LP"],
+        "CORINE 2012": corine_2012,
+        "CORINE 2018": corine_2018,
+        **pop_tile_layers,  # Unpack population layers
     
 
     
-}
-    layers["Buildings (Microsoft)"] = ms_building_layer
-    layers["Roads (GRIP4)"] = roads_layer
+    }
+        layers["Buildings (Microsoft)"] = "BUILDINGS"
+        layers["Roads (GRIP4)"] = "ROADS"
 
 
     
-    options = list(layers.keys())
-    left = st.selectbox("Select a left layer", options, index=1)
-    right = st.selectbox("Select a right layer", options, index=0)
-
-    def get_layer(layer_key):
-        if layer_key not in layers:
-            return None
-        layer_obj = layers[layer_key]
-        if layer_obj == "PMTILES_BUILDINGS":
-            return geemap.EmptyTileLayer(name="Buildings (Overture)")
-        elif layer_obj == "PMTILES_ROADS":
-            return geemap.EmptyTileLayer(name="Roads (Overture)")
-        else:
-            return layer_obj
-
-    Map.split_map(get_layer(left), get_layer(right))
-
-
-    # Dynamic legend for selected right layer
-    legend = st.selectbox("Select a legend", options, index=options.index(right))
-    if legend == "Dynamic World":
-        Map.add_legend(title="Dynamic World Land Cover", builtin_legend="Dynamic_World")
-    elif legend == "ESA Land Cover":
-        Map.add_legend(title="ESA Land Cover", builtin_legend="ESA_WorldCover")
-    elif legend == "ESRI Land Cover":
-        Map.add_legend(title="ESRI Land Cover", builtin_legend="ESRI_LandCover")
-    elif legend.startswith("CORINE"):
-        legend_dict = {f"{k} - {v}": corine_palette[i] for i, (k, v) in enumerate(corine_classes.items())}
-        Map.add_legend(title=f"CORINE Land Cover {corine_year}", legend_dict=legend_dict)
-    elif legend.startswith("Floods"):
-        legend_dict = {
-            f"{k} - {v}": flood_palette[i]
-            for i, (k, v) in enumerate(flood_depth_classes.items())
-        }
-        Map.add_legend(title=f"{legend} Depth Categories", legend_dict=legend_dict)
-    elif legend.startswith("Population"):
-        pop_legend_dict = {
-            "0–400": "#ffffcc",
-            "400–800": "#a1dab4",
-            "800–1200": "#41b6c4",
-            "1200–1600": "#2c7fb8",
-            ">1600": "#253494"
-        }
-        Map.add_legend(title=f"{legend}", legend_dict=pop_legend_dict)
-
-    elif legend == "Buildings (Microsoft)":
-        Map.add_legend(
-            title="Microsoft Buildings",
-            legend_dict={
-                "Building Footprint": "#FF5500"
+        options = list(layers.keys())
+        left = st.selectbox("Select a left layer", options, index=1)
+        right = st.selectbox("Select a right layer", options, index=0)
+
+        def get_layer(layer_key):
+            if layer_key not in layers:
+                return None
+            layer_obj = layers[layer_key]
+            if layer_obj == "DYNAMIC_WORLD":
+                return dynamic_world_layer("Split", start, end)
+            elif layer_obj == "BUILDINGS":
+                croatia = ee.Geometry.BBox(*region_bbox(region_info(load_country_index(), "Croatia")))
+                return buildings_layer(ms_buildings_hr, view_bounds, zoom, "msb_Croatia", croatia)
+            elif layer_obj == "ROADS":
+                return roads_layer(grip4_europe, view_bounds, zoom)
+            elif layer_obj == "PMTILES_BUILDINGS":
+                return geemap.EmptyTileLayer(name="Buildings (Overture)")
+            elif layer_obj == "PMTILES_ROADS":
+                return geemap.EmptyTileLayer(name="Roads (Overture)")
+            else:
+                image, vis = layer_obj
+                # map ids are cached, so pans and legend changes make no new request
+                return cached_tile_layer(image, vis, layer_key)
+
+        Map.split_map(get_layer(left), get_layer(right))
+
+
+        # Dynamic legend for selected right layer
+        legend = st.selectbox("Select a legend", options, index=options.index(right))
+        if legend == "Dynamic World":
+            Map.add_legend(title="Dynamic World Land Cover", builtin_legend="Dynamic_World")
+        elif legend == "ESA Land Cover":
+            Map.add_legend(title="ESA Land Cover", builtin_legend="ESA_WorldCover")
+        elif legend == "ESRI Land Cover":
+            Map.add_legend(title="ESRI Land Cover", builtin_legend="ESRI_LandCover")
+        elif legend.startswith("CORINE"):
+            legend_dict = {f"{k} - {v}": corine_palette[i] for i, (k, v) in enumerate(corine_classes.items())}
+            Map.add_legend(title=f"{legend} Land Cover", legend_dict=legend_dict)
+        elif legend.startswith("Floods"):
+            legend_dict = {
+                f"{k} - {v}": flood_palette[i]
+                for i, (k, v) in enumerate(flood_depth_classes.items())
             }
-        )
-    elif legend == "Roads (GRIP4)":
-        Map.add_legend(
-            title="GRIP4 Roads",
-            legend_dict={"Roads": "#FF5500"}
-        )
-
-
-
-    # Data Sources
-    with st.expander("Data sources"):
-        st.markdown("""
-        - [Dynamic World Land Cover](https://developers.google.com/earth-engine/datasets/catalog/GOOGLE_DYNAMICWORLD_V1?hl=en)
-        - [ESA Global Land Cover](https://developers.google.com/earth-engine/datasets/catalog/ESA_WorldCover_v100)
-        - [ESRI Global Land Cover](https://samapriya.github.io/awesome-gee-community-datasets/projects/esrilc2020)
-        """)
+            Map.add_legend(title=f"{legend} Depth Categories", legend_dict=legend_dict)
+        elif legend.startswith("Population"):
+            pop_legend_dict = {
+                "0–400": "#ffffcc",
+                "400–800": "#a1dab4",
+                "800–1200": "#41b6c4",
+                "1200–1600": "#2c7fb8",
+                ">1600": "#253494"
+            }
+            Map.add_legend(title=f"{legend}", legend_dict=pop_legend_dict)
+
+        elif legend == "Buildings (Microsoft)" and zoom < FOOTPRINT_MIN_ZOOM:
+            Map.add_legend(
+                title="Buildings per hectare (zoom in for footprints)",
+                legend_dict={
+                    f"{DENSITY_VIS['max'] * i // 4}": color
+                    for i, color in enumerate(DENSITY_VIS["palette"])
+                }
+            )
+        elif legend == "Buildings (Microsoft)":
+            Map.add_legend(
+                title="Microsoft Buildings",
+                legend_dict={
+                    "Building Footprint": "#FF5500"
+                }
+            )
+        elif legend == "Roads (GRIP4)":
+            Map.add_legend(
+                title="GRIP4 Roads",
+                legend_dict={"Roads": "#FF5500"}
+            )
+
+
+
+        # Data Sources
+        with st.expander("Data sources"):
+            st.markdown("""
+            - [Dynamic World Land Cover](https://developers.google.com/earth-engine/datasets/catalog/GOOGLE_DYNAMICWORLD_V1?hl=en)
+            - [ESA Global Land Cover](https://developers.google.com/earth-engine/datasets/catalog/ESA_WorldCover_v100)
+            - [ESRI Global Land Cover](https://samapriya.github.io/awesome-gee-community-datasets/projects/esrilc2020)
+            """)
+
+    # Show map in main panel
+    with col1:
+        Map.add_layer_control()
+        render_map(Map, MAP_KEY, height=750)
 
-# Show map in main panel
-with col1:
-    Map.add_layer_control()
-    Map.to_streamlit(height=750)
 
-
-# ---------------------- Settlement Selection ----------------------
-with st.expander("📍 Select Settlement", expanded=True):
-    settlement_names = population_fc.aggregate_array("NA_IME").distinct().sort().getInfo()
-    settlement_name = st.selectbox("Select a Settlement", ["All Settlements"] + settlement_names)
-
-    if settlement_name != "All Settlements":
-        settlement_fc = population_fc.filter(ee.Filter.eq("NA_IME", settlement_name))
-        settlement_geom = settlement_fc.first().geometry()
-        filtered_buildings = ms_buildings_split.filterBounds(settlement_geom)
-        filtered_roads = split_roads.filterBounds(settlement_geom)
-    else:
-        settlement_fc = population_fc
-        settlement_geom = settlement_fc.geometry()
-        filtered_buildings = ms_buildings_split
-        filtered_roads = split_roads
+map_panel()
 
 
 # ---------------------- Exposure Analysis Panel ----------------------
-with st.expander("📊 Step 2- CRICS - Exposure", expanded=True):
-    scenario = st.selectbox("Select Flood Scenario for Exposure", ["High Probability", "Medium Probability", "Low Probability"])
-    flood_geom = {
-        "High Probability": floods_hp_img.geometry(),
-        "Medium Probability": floods_mp_img.geometry(),
-        "Low Probability": floods_lp_img.geometry()
-    }[scenario]
-
-    filtered_fc = settlement_fc.filterBounds(flood_geom)
-
-    indicator = st.selectbox("Select Exposure Indicator", ["Population", "Roads", "Buildings"])
-
-    if indicator == "Population":
-        selected_year = st.selectbox("Select Year", ["2025", "2030"])
-        selected_property = f"pop_{selected_year}"
-        try:
-            total_pop = settlement_fc.aggregate_sum(selected_property).getInfo()
-            st.metric(f"Total Population Exposed ({selected_year})", f"{int(total_pop):,}")
-        except Exception:
-            st.error("Population data not available or aggregation failed.")
+# Exposure and vulnerability share a fragment: both read the cube values of
+# the exposure scenario
+@st.fragment
+def exposure_panels(settlement_name, settlement_fc, filtered_roads, filtered_buildings):
+    with st.expander("📊 Step 2- CRICS - Exposure", expanded=True):
+        scenario = st.selectbox("Select Flood Scenario for Exposure", ["High Probability", "Medium Probability", "Low Probability"])
+        flood_geom = {
+            "High Probability": floods_hp_img.geometry(),
+            "Medium Probability": floods_mp_img.geometry(),
+            "Low Probability": floods_lp_img.geometry()
+        }[scenario]
 
-    elif indicator == "Roads":
-        try:
-            total_length = filtered_roads.geometry().length().divide(1000).getInfo()  # in km
-            st.metric("Total Road Length Exposed (GRIP4)", f"{total_length:.2f} km")
-        except Exception:
-            st.error("Road data could not be computed.")
+        filtered_fc = settlement_fc.filterBounds(flood_geom)
+
+        indicator = st.selectbox("Select Exposure Indicator", ["Population", "Roads", "Buildings"])
+        cube_values = cube_lookup(risk_cube, settlement_name, scenario, "2025") if risk_cube is not None else None
+
+        if indicator == "Population":
+            selected_year = st.selectbox("Select Year", ["2025", "2030"])
+            selected_property = f"pop_{selected_year}"
+            try:
+                if cube_values is not None:
+                    total_pop = cube_lookup(risk_cube, settlement_name, scenario, selected_year)["population"][0]
+                else:
+                    total_pop = cached_info(settlement_fc.aggregate_sum(selected_property))
+                st.metric(f"Total Population Exposed ({selected_year})", f"{int(total_pop):,}")
+            except Exception:
+                st.error("Population data not available or aggregation failed.")
+
+        elif indicator == "Roads":
+            try:
+                if cube_values is not None:
+                    total_length = cube_values["roads_km"][0]
+                else:
+                    total_length = cached_info(filtered_roads.geometry().length().divide(1000))  # in km
+                st.metric("Total Road Length Exposed (GRIP4)", f"{total_length:.2f} km")
+            except Exception:
+                st.error("Road data could not be computed.")
+
+        elif indicator == "Buildings":
+            try:
+                if cube_values is not None:
+                    building_count = int(cube_values["buildings"][0])
+                else:
+                    building_count = cached_info(filtered_buildings.size())
+                st.metric("Total Building Count (Microsoft)", f"{building_count:,}")
+            except Exception:
+                st.error("Building count computation failed.")
+
+
+    # ---------------------- Vulnerability Analysis Panel ----------------------
+    with st.expander("⚠️ Step 2- CRICS - Vulnerability", expanded=True):
+        vuln_option = st.selectbox(
+            "Select Vulnerability Group",
+            ["Children (0–10)", "Elderly (65+)", "Female Total", "Male Total"]
+        )
 
-    elif indicator == "Buildings":
         try:
-            building_count = filtered_buildings.size().getInfo()
-            st.metric("Total Building Count (Microsoft)", f"{building_count:,}")
+            if vuln_option == "Children (0–10)":
+                if cube_values is not None:
+                    total_children = cube_values["children"][0]
+                else:
+                    total_children = sum(cached_info(settlement_fc.aggregate_sum(p)) for p in CHILDREN_PROPS)
+                st.metric("Children Exposed (0–10)", f"{int(total_children):,}")
+            elif vuln_option == "Elderly (65+)":
+                if cube_values is not None:
+                    total_elderly = cube_values["elderly"][0]
+                else:
+                    total_elderly = sum(cached_info(settlement_fc.aggregate_sum(p)) for p in ELDERLY_PROPS)
+                st.metric("Elderly (65+) Exposed", f"{int(total_elderly):,}")
+            elif vuln_option == "Female Total":
+                female_props = [p for p in cached_info(settlement_fc.first().propertyNames()) if p.startswith("female_")]
+                total_females = sum(cached_info(settlement_fc.aggregate_sum(p)) for p in female_props)
+                st.metric("Female Population Exposed", f"{int(total_females):,}")
+            elif vuln_option == "Male Total":
+                male_props = [p for p in cached_info(settlement_fc.first().propertyNames()) if p.startswith("male_")]
+                total_males = sum(cached_info(settlement_fc.aggregate_sum(p)) for p in male_props)
+                st.metric("Male Population Exposed", f"{int(total_males):,}")
         except Exception:
-            st.error("Building count computation failed.")
-
-
-# ---------------------- Vulnerability Analysis Panel ----------------------
-with st.expander("⚠️ Step 2- CRICS - Vulnerability", expanded=True):
-    vuln_option = st.selectbox(
-        "Select Vulnerability Group",
-        ["Children (0–10)", "Elderly (65+)", "Female Total", "Male Total"]
-    )
-
-    children_props = [
-        "female_F_0_2020", "female_F_5_2020", "female_F_10_2020",
-        "male_M_0_2020", "male_M_5_2020", "male_M_10_2020"
-    ]
-
-    elderly_props = [
-        "female_F_65_2020", "female_F_70_2020", "female_F_75_2020", "female_F_80_2020",
-        "male_M_65_2020", "male_M_70_2020", "male_M_75_2020", "male_M_80_2020"
-    ]
-
-    try:
-        if vuln_option == "Children (0–10)":
-            total_children = sum(settlement_fc.aggregate_sum(p).getInfo() for p in children_props)
-            st.metric("Children Exposed (0–10)", f"{int(total_children):,}")
-        elif vuln_option == "Elderly (65+)":
-            total_elderly = sum(settlement_fc.aggregate_sum(p).getInfo() for p in elderly_props)
-            st.metric("Elderly (65+) Exposed", f"{int(total_elderly):,}")
-        elif vuln_option == "Female Total":
-            female_props = [p for p in settlement_fc.first().propertyNames().getInfo() if p.startswith("female_")]
-            total_females = sum(settlement_fc.aggregate_sum(p).getInfo() for p in female_props)
-            st.metric("Female Population Exposed", f"{int(total_females):,}")
-        elif vuln_option == "Male Total":
-            male_props = [p for p in settlement_fc.first().propertyNames().getInfo() if p.startswith("male_")]
-            total_males = sum(settlement_fc.aggregate_sum(p).getInfo() for p in male_props)
-            st.metric("Male Population Exposed", f"{int(total_males):,}")
-    except Exception:
-        st.error("⚠️ Could not compute vulnerability statistics. Please check property names and data availability.")
-
-
-# Rasterized total population with explicit band names
-pop_img_2025 = population_fc.reduceToImage(["pop_2025"], ee.Reducer.first()) \
-    .rename("pop_2025").reproject(crs=eco_crs, scale=eco_scale)
-
-pop_img_2030 = population_fc.reduceToImage(["pop_2030"], ee.Reducer.first()) \
-    .rename("pop_2030").reproject(crs=eco_crs, scale=eco_scale)
-
-# Rasterize demographic groups with consistent band names
-def rasterize_demographic(props, band_name):
-    image = population_fc.reduceToImage([props[0]], ee.Reducer.first())
-    for p in props[1:]:
-        image = image.add(population_fc.reduceToImage([p], ee.Reducer.first()))
-    return image.rename(band_name).reproject(crs=eco_crs, scale=eco_scale)
-
-children_img = rasterize_demographic([
-    "female_F_0_2020", "female_F_5_2020", "female_F_10_2020",
-    "male_M_0_2020", "male_M_5_2020", "male_M_10_2020"
-], "children")
-
-elderly_img = rasterize_demographic([
-    "female_F_65_2020", "female_F_70_2020", "female_F_75_2020", "female_F_80_2020",
-    "male_M_65_2020", "male_M_70_2020", "male_M_75_2020", "male_M_80_2020"
-], "elderly")
-
-# Define clipped images to match the selected settlement geometry
-pop_img_2025_clipped = pop_img_2025.clip(settlement_geom).unmask(0)
-pop_img_2030_clipped = pop_img_2030.clip(settlement_geom).unmask(0)
-children_img_clipped = children_img.clip(settlement_geom).unmask(0)
-elderly_img_clipped = elderly_img.clip(settlement_geom).unmask(0)
+            st.error("⚠️ Could not compute vulnerability statistics. Please check property names and data availability.")
 
 
 # ---------------------- Risk Assessment Panel ----------------------
-with st.expander("📉 Risk Assessment", expanded=True):
-    st.markdown("This panel estimates at-risk exposure using flood raster pixel coverage inside the selected settlement.")
-
-    selected_year = st.selectbox("Select Population Year", ["2025", "2030"])
-    selected_property = f"pop_{selected_year}"
-    scenario = st.selectbox("Select Flood Scenario", ["High Probability", "Medium Probability", "Low Probability"])
-
-    try:
-        # Step 1: Get flood raster image based on selected scenario
-        flood_raster = {
-            "High Probability": floods_hp_img,
-            "Medium Probability": floods_mp_img,
-            "Low Probability": floods_lp_img
-        }[scenario]
-
-        # Step 2: Count flood pixels within the selected settlement
-        flood_pixel_count_dict = flood_raster.reduceRegion(
-            reducer=ee.Reducer.sum(),
-            geometry=settlement_geom,
-            scale=30,
-            maxPixels=1e13
-        ).getInfo()
-
-        flood_pixels = list(flood_pixel_count_dict.values())[0] or 0
-        flood_area = flood_pixels * 30 * 30  # pixel area = 900 m²
-        settlement_area = settlement_geom.area().getInfo()  # m²
-
-        proportion_affected = flood_area / settlement_area if settlement_area else 0
-
-        # Step 3: Total values from the full settlement
-        total_pop = settlement_fc.aggregate_sum(selected_property).getInfo()
-        total_children = sum(settlement_fc.aggregate_sum(p).getInfo() for p in children_props)
-        total_elderly = sum(settlement_fc.aggregate_sum(p).getInfo() for p in elderly_props)
-        total_road_km = filtered_roads.geometry().length().divide(1000).getInfo()
-        total_buildings = filtered_buildings.size().getInfo()
-
-        # Step 4: Compute affected using flood proportion
-        exposed_pop = total_pop * proportion_affected # exposed population
-        exposed_children = total_children * proportion_affected # exposed children
-        exposed_elderly = total_elderly * proportion_affected # exposed elderly
-        exposed_roads_km = total_road_km * proportion_affected # exposed roads in km
-        exposed_buildings_count = total_buildings * proportion_affected # exposed buildings
-
-        # Step 5: Percentages
-        pct_pop = (exposed_pop / total_pop * 100) if total_pop else 0
-        pct_children = (exposed_children / total_children * 100) if total_children else 0
-        pct_elderly = (exposed_elderly / total_elderly * 100) if total_elderly else 0
-        pct_roads = (exposed_roads_km / total_road_km * 100) if total_road_km else 0
-        pct_buildings = (exposed_buildings_count / total_buildings * 100) if total_buildings else 0
-
-        # Step 6: Display results
-        st.metric(f"Population at Risk ({selected_year})", f"{int(exposed_pop):,}", f"{pct_pop:.1f}%")
-        st.metric("Children (0–10) at Risk", f"{int(exposed_children):,}", f"{pct_children:.1f}%")
-        st.metric("Elderly at Risk (65+)", f"{int(exposed_elderly):,}", f"{pct_elderly:.1f}%")
-        st.metric("Roads at Risk", f"{exposed_roads_km:.2f} km", f"{pct_roads:.1f}%")
-        st.metric("Buildings at Risk", f"{int(exposed_buildings_count):,}", f"{pct_buildings:.1f}%")
-
-        st.success(f"✔ Risk assessment for {scenario} flood scenario using {selected_year} population and 2020 vulnerability data completed.")
-    except Exception as e:
-        st.error(f"⚠️ Error during risk summary: {str(e)}")
-
-
-
-with st.expander(" Risk Summary", expanded=True):
-    st.markdown("Visual breakdown of exposure indicators, actual values at risk, and composite risk index dynamics.")
-
-    # Data prep
-    indicators = ['Exposed Population', 'Vulnerable Children (0–10)', 'Vulnerable Elderly (65+)', 'Roads at Risk', 'Buildings at Risk']
-    raw_values = [exposed_pop, exposed_children, exposed_elderly, exposed_roads_km, exposed_buildings_count]
-    percentages = [pct_pop, pct_children, pct_elderly, pct_roads, pct_buildings]
-    weights = [0.3, 0.2, 0.2, 0.15, 0.15]
-    weighted_contrib = [p * w for p, w in zip(percentages, weights)]
-    risk_index = sum(weighted_contrib)
-
-    df = pd.DataFrame({
-        "Indicator": indicators,
-        "Exposed Value": raw_values,
-        "Exposure (%)": percentages,
-        "Weight": weights,
-        "Weighted Contribution": weighted_contrib
-    })
-
-    # Row 1: Bar of exposed values and Pie
-    col1, col2 = st.columns(2)
-
-    with col1:
-        st.markdown("** Actual Values at Risk**")
-        fig_val = px.bar(df, x="Indicator", y="Exposed Value", color="Indicator",
-                         title="Quantity of Assets/People at Risk", text_auto='.2s')
-        st.plotly_chart(fig_val, use_container_width=True)
+@st.fragment
+def risk_panels(settlement_name, settlement_geom, filtered_roads, filtered_buildings):
+    with st.expander("📉 Risk Assessment", expanded=True):
+        st.markdown("This panel estimates at-risk exposure by overlaying population rasters with flood depth classes inside the selected settlement.")
 
-    with col2:
-        st.markdown("** Contribution to Risk Index**")
-        fig_pie = px.pie(df, names="Indicator", values="Weighted Contribution",
-                         title="Weighted Share of Composite Risk Index")
-        st.plotly_chart(fig_pie, use_container_width=True)
-
-    # Row 2: Violin and new Total vs At-Risk comparison
-    col3, col4 = st.columns(2)
-
-    with col3:
-        st.markdown("** Risk Distribution by Indicator**")
-
-        # Simulate data for violin plot
-        noise_scale = 0.4
-        num_points = 50
-        use_facet = False
-
-        violin_data = []
-        for i, indicator in enumerate(indicators):
-            raw_sim = np.random.normal(loc=percentages[i], scale=noise_scale, size=num_points)
-            weighted_sim = np.random.normal(loc=weighted_contrib[i], scale=noise_scale, size=num_points)
-
-            for val in raw_sim:
-                violin_data.append({
-                    "Indicator": indicator,
-                    "Risk Type": "Raw %",
-                    "Value": val,
-                    "Settlement": settlement_name,
-                    "Flood Scenario": scenario,
-                    "Year": selected_year
-                })
-            for val in weighted_sim:
-                violin_data.append({
-                    "Indicator": indicator,
-                    "Risk Type": "Weighted %",
-                    "Value": val,
-                    "Settlement": settlement_name,
-                    "Flood Scenario": scenario,
-                    "Year": selected_year
-                })
-
-        violin_df = pd.DataFrame(violin_data)
-
-        fig_violin = px.violin(
-            violin_df,
-            x="Indicator",
-            y="Value",
-            color="Risk Type",
-            box=True,
-            points="all",
-            hover_data=["Settlement", "Flood Scenario", "Year"],
-            facet_col="Risk Type" if use_facet else None,
-            title="Distribution of Raw vs Weighted Risk per Indicator",
-            color_discrete_map={
-                "Raw %": "orange",
-                "Weighted %": "crimson"
-            }
-        )
-
-        st.plotly_chart(fig_violin, use_container_width=True)
+        selected_year = st.selectbox("Select Population Year", ["2025", "2030"])
+        selected_property = f"pop_{selected_year}"
+        scenario = st.selectbox("Select Flood Scenario", ["High Probability", "Medium Probability", "Low Probability"])
 
-    with col4:
-        st.markdown("** People/Assets at Risk**")
+        try:
+            # Step 1: Get flood raster image based on selected scenario
+            flood_raster = {
+                "High Probability": floods_hp_img,
+                "Medium Probability": floods_mp_img,
+                "Low Probability": floods_lp_img
+            }[scenario]
+
+            exposure = {}
+            risk_values = cube_lookup(risk_cube, settlement_name, scenario, selected_year) if risk_cube is not None else None
+
+            if risk_values is not None:
+                # Step 2-4: Totals and exposure straight from the precomputed cube
+                total_pop, exposed_pop = risk_values["population"]
+                total_children, exposed_children = risk_values["children"]
+                total_elderly, exposed_elderly = risk_values["elderly"]
+                total_road_km, exposed_roads_km = risk_values["roads_km"]
+                total_buildings, exposed_buildings_count = risk_values["buildings"]
+            else:
+                # Step 2: Stack people rasters with the flood depth classes and reduce once
+                exposure_layers = {
+                    "population": density_image(population_fc, [selected_property], "population"),
+                    "children": density_image(population_fc, CHILDREN_PROPS, "children"),
+                    "elderly": density_image(population_fc, ELDERLY_PROPS, "elderly"),
+                }
+                exposure = exposure_by_depth(flood_raster, exposure_layers, settlement_geom, eco_crs, eco_scale)
+                totals, exposed = summarize_exposure(exposure)
+
+                proportion_affected = exposed.get("area", 0) / totals["area"] if totals.get("area") else 0
+
+                # Step 3: Totals for the full settlement
+                total_pop = totals.get("population", 0)
+                total_children = totals.get("children", 0)
+                total_elderly = totals.get("elderly", 0)
+                total_road_km = cached_info(filtered_roads.geometry().length().divide(1000))
+                total_buildings = cached_info(filtered_buildings.size())
+
+                # Step 4: People inside the flood extent; assets still scale by flooded area
+                exposed_pop = exposed.get("population", 0) # exposed population
+                exposed_children = exposed.get("children", 0) # exposed children
+                exposed_elderly = exposed.get("elderly", 0) # exposed elderly
+                exposed_roads_km = total_road_km * proportion_affected # exposed roads in km
+                exposed_buildings_count = total_buildings * proportion_affected # exposed buildings
+
+            # Step 5: Percentages
+            pct_pop = (exposed_pop / total_pop * 100) if total_pop else 0
+            pct_children = (exposed_children / total_children * 100) if total_children else 0
+            pct_elderly = (exposed_elderly / total_elderly * 100) if total_elderly else 0
+            pct_roads = (exposed_roads_km / total_road_km * 100) if total_road_km else 0
+            pct_buildings = (exposed_buildings_count / total_buildings * 100) if total_buildings else 0
+
+            # Step 6: Display results
+            st.metric(f"Population at Risk ({selected_year})", f"{int(exposed_pop):,}", f"{pct_pop:.1f}%")
+            st.metric("Children (0–10) at Risk", f"{int(exposed_children):,}", f"{pct_children:.1f}%")
+            st.metric("Elderly at Risk (65+)", f"{int(exposed_elderly):,}", f"{pct_elderly:.1f}%")
+            st.metric("Roads at Risk", f"{exposed_roads_km:.2f} km", f"{pct_roads:.1f}%")
+            st.metric("Buildings at Risk", f"{int(exposed_buildings_count):,}", f"{pct_buildings:.1f}%")
+
+            depth_df = pd.DataFrame([
+                {
+                    "Depth Class": flood_depth_classes.get(depth_class, depth_class),
+                    "Population": values["population"],
+                    "Children (0–10)": values["children"],
+                    "Elderly (65+)": values["elderly"],
+                    "Flooded Area (ha)": values["area"] / 10000,
+                }
+                for depth_class, values in sorted(exposure.items()) if depth_class > 0
+            ])
+            if exposure and not depth_df.empty:
+                st.markdown("**Exposure by Flood Depth**")
+                st.dataframe(depth_df.round(1), use_container_width=True, hide_index=True)
+
+            st.success(f"✔ Risk assessment for {scenario} flood scenario using {selected_year} population and 2020 vulnerability data completed.")
+        except Exception as e:
+            st.error(f"⚠️ Error during risk summary: {str(e)}")
+
+
+
+    with st.expander(" Risk Summary", expanded=True):
+        st.markdown("Visual breakdown of exposure indicators, actual values at risk, and composite risk index dynamics.")
+
+        # Data prep
+        indicators = ['Exposed Population', 'Vulnerable Children (0–10)', 'Vulnerable Elderly (65+)', 'Roads at Risk', 'Buildings at Risk']
+        raw_values = [exposed_pop, exposed_children, exposed_elderly, exposed_roads_km, exposed_buildings_count]
+        percentages = [pct_pop, pct_children, pct_elderly, pct_roads, pct_buildings]
+        weights = [0.3, 0.2, 0.2, 0.15, 0.15]
+        weighted_contrib = [p * w for p, w in zip(percentages, weights)]
+        risk_index = sum(weighted_contrib)
+
+        df = pd.DataFrame({
+            "Indicator": indicators,
+            "Exposed Value": raw_values,
+            "Exposure (%)": percentages,
+            "Weight": weights,
+            "Weighted Contribution": weighted_contrib
+        })
+
+        # Row 1: Bar of exposed values and Pie
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.markdown("** Actual Values at Risk**")
+            fig_val = px.bar(df, x="Indicator", y="Exposed Value", color="Indicator",
+                             title="Quantity of Assets/People at Risk", text_auto='.2s')
+            st.plotly_chart(fig_val, use_container_width=True)
+
+        with col2:
+            st.markdown("** Contribution to Risk Index**")
+            fig_pie = px.pie(df, names="Indicator", values="Weighted Contribution",
+                             title="Weighted Share of Composite Risk Index")
+            st.plotly_chart(fig_pie, use_container_width=True)
+
+        # Row 2: Violin and new Total vs At-Risk comparison
+        col3, col4 = st.columns(2)
+
+        with col3:
+            st.markdown("** Risk Distribution by Indicator**")
+
+            # Simulate data for violin plot
+            noise_scale = 0.4
+            num_points = 50
+            use_facet = False
+
+            violin_data = []
+            for i, indicator in enumerate(indicators):
+                raw_sim = np.random.normal(loc=percentages[i], scale=noise_scale, size=num_points)
+                weighted_sim = np.random.normal(loc=weighted_contrib[i], scale=noise_scale, size=num_points)
+
+                for val in raw_sim:
+                    violin_data.append({
+                        "Indicator": indicator,
+                        "Risk Type": "Raw %",
+                        "Value": val,
+                        "Settlement": settlement_name,
+                        "Flood Scenario": scenario,
+                        "Year": selected_year
+                    })
+                for val in weighted_sim:
+                    violin_data.append({
+                        "Indicator": indicator,
+                        "Risk Type": "Weighted %",
+                        "Value": val,
+                        "Settlement": settlement_name,
+                        "Flood Scenario": scenario,
+                        "Year": selected_year
+                    })
+
+            violin_df = pd.DataFrame(violin_data)
+
+            fig_violin = px.violin(
+                violin_df,
+                x="Indicator",
+                y="Value",
+                color="Risk Type",
+                box=True,
+                points="all",
+                hover_data=["Settlement", "Flood Scenario", "Year"],
+                facet_col="Risk Type" if use_facet else None,
+                title="Distribution of Raw vs Weighted Risk per Indicator",
+                color_discrete_map={
+                    "Raw %": "orange",
+                    "Weighted %": "crimson"
+                }
+            )
+
+            st.plotly_chart(fig_violin, use_container_width=True)
+
+        with col4:
+            st.markdown("** People/Assets at Risk**")
+
+            # Simulate total population/assets for demo: reverse-calculate
+            total_values = [raw * (100 / pct) if pct else raw for raw, pct in zip(raw_values, percentages)]
+
+            fig_exposure = go.Figure()
+            fig_exposure.add_trace(go.Bar(x=indicators, y=total_values, name="Total Exposed (Estimate)", marker_color="lightgrey"))
+            fig_exposure.add_trace(go.Bar(x=indicators, y=raw_values, name="At Risk", marker_color="firebrick"))
+
+            fig_exposure.update_layout(
+                barmode='group',
+                title="Comparison of Total Exposed vs People/Assets Actually at Risk",
+                yaxis_title="Count or Length (km)",
+                legend_title="Exposure Type"
+            )
+
+            st.plotly_chart(fig_exposure, use_container_width=True)
+
+        # Composite Risk Index metric
+        # risk_level = "Low" if risk_index <= 5 else "Moderate" if risk_index <= 10 else "High"
+        # st.metric(" Composite Risk Index", f"{risk_index:.1f}", help=f"Risk Level: {risk_level}")
+
+        # Export CSV
+        df["Settlement"] = settlement_name
+        df["Flood Scenario"] = scenario
+        df["Year"] = selected_year
+        df["Risk Index"] = risk_index
+
+        csv = df.to_csv(index=False).encode('utf-8')
+        st.download_button(" Download Risk Summary CSV", csv, file_name=f"{settlement_name}_risk_summary.csv", mime="text/csv")
 
-        # Simulate total population/assets for demo: reverse-calculate
-        total_values = [raw * (100 / pct) if pct else raw for raw, pct in zip(raw_values, percentages)]
 
-        fig_exposure = go.Figure()
-        fig_exposure.add_trace(go.Bar(x=indicators, y=total_values, name="Total Exposed (Estimate)", marker_color="lightgrey"))
-        fig_exposure.add_trace(go.Bar(x=indicators, y=raw_values, name="At Risk", marker_color="firebrick"))
+# ---------------------- Settlement Selection ----------------------
+# Fragments: a settlement change reruns the panels but not the map, and a
+# choice inside a panel reruns only that panel
+@st.fragment
+def settlement_panels():
+    with st.expander("📍 Select Settlement", expanded=True):
+        if risk_cube is not None:
+            settlement_names = sorted(risk_cube["settlement"].unique())
+        else:
+            settlement_names = cached_info(population_fc.aggregate_array("NA_IME").distinct().sort())
+        settlement_name = st.selectbox("Select a Settlement", ["All Settlements"] + settlement_names)
+
+        if settlement_name != "All Settlements":
+            settlement_fc = population_fc.filter(ee.Filter.eq("NA_IME", settlement_name))
+            settlement_geom = settlement_fc.first().geometry()
+            filtered_buildings = split_buildings.filterBounds(settlement_geom)
+            filtered_roads = split_roads.filterBounds(settlement_geom)
+        else:
+            settlement_fc = population_fc
+            settlement_geom = settlement_fc.geometry()
+            filtered_buildings = split_buildings
+            filtered_roads = split_roads
 
-        fig_exposure.update_layout(
-            barmode='group',
-            title="Comparison of Total Exposed vs People/Assets Actually at Risk",
-            yaxis_title="Count or Length (km)",
-            legend_title="Exposure Type"
-        )
+    exposure_panels(settlement_name, settlement_fc, filtered_roads, filtered_buildings)
+    risk_panels(settlement_name, settlement_geom, filtered_roads, filtered_buildings)
 
-        st.plotly_chart(fig_exposure, use_container_width=True)
 
-    # Composite Risk Index metric
-    # risk_level = "Low" if risk_index <= 5 else "Moderate" if risk_index <= 10 else "High"
-    # st.metric(" Composite Risk Index", f"{risk_index:.1f}", help=f"Risk Level: {risk_level}")
+settlement_panels()
 
-    # Export CSV
-    df["Settlement"] = settlement_name
-    df["Flood Scenario"] = scenario
-    df["Year"] = selected_year
-    df["Risk Index"] = risk_index
 
-    csv = df.to_csv(index=False).encode('utf-8')
-    st.download_button(" Download Risk Summary CSV", csv, file_name=f"{settlement_name}_risk_summary.csv", mime="text/csv")
 
 # ---------------------- Sidebar Footer ----------------------
 
 
-import streamlit as st
-import datetime
 from zoneinfo import ZoneInfo  # Requires Python 3.9+
 
 logo = "https://www.desirmed.eu/theme17/img/logos/6_Deltares.png"
@@ -670,4 +702,7 @@ current_time = amsterdam_time.strftime("%H:%M:%S")
 st.sidebar.markdown(f"**Last Updated:** {last_updated}")
 
 # st.sidebar.markdown(f"**Last Updated:** {last_updated} | {current_time}")
-# st.sidebar.markdown(f"**Local Time (Amsterdam):** {current_time}")
\ No newline at end of file
+# st.sidebar.markdown(f"**Local Time (Amsterdam):** {current_time}")
+
+# Earth Engine calls of this run, when tracing is enabled (EE_TRACE=1)
+trace_panel()
@@ -1,10 +1,14 @@
 import ee
+from utils_trace import trace_panel
 import geemap.foliumap as geemap
-import geopandas as gpd
 import streamlit as st
+from utils_countries import load_country_index, region_names, region_info, region_bbox, msbuildings_id, has_msbuildings
+from utils_layers import map_view, view_center, render_map, buildings_layer, fit_zoom
 
 st.set_page_config(layout="wide")
 
+MAP_KEY = "es_map"
+
 
 def ee_authenticate(token_name="EARTHENGINE_TOKEN"):
     geemap.ee_initialize(token_name=token_name)
@@ -22,26 +26,10 @@ st.title("Biodiversity and Ecosystem Services")
 col1, col2 = st.columns([8, 2])
 
 
-@st.cache_data
-def read_data(url):
-    return gpd.read_file(url)
-
-
-countries = (
-    "https://github.com/giswqs/geemap/raw/master/examples/data/countries.geojson"
-)
-states = "https://github.com/giswqs/geemap/raw/master/examples/data/us_states.json"
-
-countries_gdf = read_data(countries)
-states_gdf = read_data(states)
-
-country_names = countries_gdf["NAME"].values.tolist()
-country_names.remove("United States of America")
-country_names.append("USA")
-country_names.sort()
-country_names = [name.replace(".", "").replace(" ", "_") for name in country_names]
-
-state_names = states_gdf["name"].values.tolist()
+# Bundled country/state index (names, extents, centres), see utils_countries
+region_index = load_country_index()
+country_names = region_names(region_index, "country")
+state_names = region_names(region_index, "state")
 
 basemaps = list(geemap.basemaps)
 
@@ -61,23 +49,23 @@ with col2:
             "Select a state", state_names, index=state_names.index("Florida")
         )
         layer_name = state
-
-        try:
-            fc = ee.FeatureCollection(
-                f"projects/sat-io/open-datasets/MSBuildings/US/{state}"
-            )
-        except:
-            st.error("No data available for the selected state.")
+        pyramid_name = f"msb_US_{state}"
+        info = region_info(region_index, state, level="state")
 
     else:
-        try:
-            fc = ee.FeatureCollection(
-                f"projects/sat-io/open-datasets/MSBuildings/{country}"
-            )
-        except:
-            st.error("No data available for the selected country.")
-
         layer_name = country
+        pyramid_name = f"msb_{country}"
+        info = region_info(region_index, country)
+
+    # Most index rows carry no availability flag, so check before the
+    # collection is read; a missing one would fail every layer request
+    available = has_msbuildings(info)
+    if available:
+        fc = ee.FeatureCollection(msbuildings_id(info))
+    else:
+        st.error(f"No building footprints available for {layer_name}.")
+
+    region = ee.Geometry.BBox(*region_bbox(info))
 
     color = st.color_picker("Select a color", "#FF5500")
 
@@ -85,14 +73,26 @@ with col2:
 
     split = st.checkbox("Split-panel map")
 
-    if split:
-        left = geemap.ee_tile_layer(fc.style(**style), {}, "Left")
-        right = left
-        Map.split_map(left, right)
+    # Footprints for the visible extent when zoomed in, density pyramid otherwise.
+    # The view resets to the region extent from the index whenever the selection changes.
+    selection = (country, layer_name)
+    view = map_view(MAP_KEY) if st.session_state.get("es_selection") == selection else None
+    st.session_state["es_selection"] = selection
+    if view is None:
+        view_bounds = region_bbox(info)
+        zoom = fit_zoom(view_bounds)
+        Map.setCenter(info["lon"], info["lat"], zoom)
     else:
-        Map.addLayer(fc.style(**style), {}, layer_name)
+        view_bounds, zoom = view
+        longitude, latitude = view_center(view_bounds)
+        Map.setCenter(longitude, latitude, zoom)
 
-    Map.centerObject(fc.first(), zoom=16)
+    if available and split:
+        left = buildings_layer(fc, view_bounds, zoom, pyramid_name, region, style, "Left")
+        right = left
+        Map.split_map(left, right)
+    elif available:
+        Map.add_child(buildings_layer(fc, view_bounds, zoom, pyramid_name, region, style, layer_name))
 
     with st.expander("Data Sources"):
         st.info(
@@ -104,7 +104,8 @@ with col2:
 
 with col1:
 
-    Map.to_streamlit(height=1000)
+    Map.add_layer_control()
+    render_map(Map, MAP_KEY, height=1000)
 
 
 import streamlit as st
@@ -128,4 +129,7 @@ last_updated = amsterdam_time.strftime("%B %d, %Y")
 current_time = amsterdam_time.strftime("%H:%M:%S")
 
 st.sidebar.markdown(f"**Last Updated:** {last_updated}")
-# st.sidebar.markdown(f"**Local Time (Amsterdam):** {current_time}")
\ No newline at end of file
+# st.sidebar.markdown(f"**Local Time (Amsterdam):** {current_time}")
+
+# Earth Engine calls of this run, when tracing is enabled (EE_TRACE=1)
+trace_panel()
@@ -4,22 +4,72 @@ Adapted and Modified: Desmond Lartey
 """
 import numpy as np
 import streamlit as st
-from openai import OpenAI
 import os
 import sys
+import uuid
 from dotenv import load_dotenv, dotenv_values
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from config import CACHE_PATH
+from utils_ratelimit import RateLimiter, QuotaExceeded
+from utils_chat_cache import cache_scope, lookup, store, replay
+from utils_retrieval import context_block
+from utils_chat import build_context, context_budget, chat_endpoints, stream_chat, stream_many, latency_stats, provider_name
 load_dotenv()
 
 
 
 
 API_CALL_LIMIT = 10 # Define the limit
+# Shared-key calls per client address and day; everyone behind one router or
+# proxy shares it, so it is a few sessions' worth
+IP_CALL_LIMIT = 3 * API_CALL_LIMIT
+
+# Limits of the shared Groq key (free tier), enforced across all sessions
+GROQ_REQUESTS_PER_MINUTE = 30
+GROQ_REQUESTS_PER_DAY = 14400
 
 if 'api_call_count' not in st.session_state:
     st.session_state.api_call_count = 0
     st.session_state.remaining_calls = API_CALL_LIMIT
 
 
+@st.cache_resource
+def shared_key_limiter():
+    """Rate limiter of the shared Groq key, common to all sessions and worker processes."""
+    return RateLimiter(
+        rate=GROQ_REQUESTS_PER_MINUTE / 60,
+        burst=5,
+        client_quota=IP_CALL_LIMIT,
+        daily_quota=GROQ_REQUESTS_PER_DAY,
+        path=CACHE_PATH / "groq_rate_limit.json",
+    )
+
+
+def client_key():
+    """
+    Key the shared-key quota is counted on: the first X-Forwarded-For hop, else the
+    connecting address. Unlike the browser session it survives a reload, so the
+    IP_CALL_LIMIT quota holds; API_CALL_LIMIT still applies per session on top.
+    Without an address (AppTest sessions) the session id is used, and only the
+    global daily quota protects the key across reloads.
+    """
+    # st.context needs the server runtime, which AppTest sessions (benchmark, load test) lack
+    try:
+        forwarded = st.context.headers.get("X-Forwarded-For", "").split(",")[0].strip()
+        ip = st.context.ip_address
+    except RuntimeError:
+        forwarded = ip = None
+    if forwarded or ip:
+        return forwarded or ip
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is not None:
+        return ctx.session_id
+    return st.session_state.setdefault("client_id", uuid.uuid4().hex)
+
+
+client_id = client_key()
+
+
 
 model_links_hf ={
       "Gemma-3-27B-it":{
@@ -185,15 +235,31 @@ elif "HF-Token" in client_select:
 
 
 
-# Define the available models
-models =[key for key in model_links.keys()]
+# Define the available models; "Auto" routes each question to the fastest healthy endpoint
+AUTO_MODEL = "Auto (fastest)"
+models =[AUTO_MODEL] + [key for key in model_links.keys()]
 
 # Create the sidebar with the dropdown for model selection
-selected_model = st.sidebar.selectbox("Select Model", models)
+selected_model = st.sidebar.selectbox("Select Model", models, index=1)
 
 #Create a temperature slider
 temp_values = st.sidebar.slider('Select a temperature value', 0.0, 1.0, (0.5))
 
+# Add the most relevant rows of the project ecosystem-service tables to each question
+grounded = st.sidebar.checkbox("Ground answers in project data", value=True)
+
+# Ask several models the same question at once; the conversation is kept
+compare = st.sidebar.toggle("Compare models", help="Send each question to 2-4 models at once and show the answers side by side.")
+compare_models = []
+if compare:
+    if len(models) < 3:
+        st.sidebar.info("Comparing needs at least two models; use an HF-Token for more models.")
+    else:
+        compare_models = st.sidebar.multiselect("Models to compare", models[1:], default=models[1:3], max_selections=4)
+        if len(compare_models) < 2:
+            st.sidebar.warning("Select at least two models to compare.")
+comparing = len(compare_models) >= 2
+
 
 
 #Add reset button to clear conversation
@@ -203,9 +269,29 @@ st.sidebar.divider() # Add a visual separator
 
 # Create model description
 st.sidebar.subheader(f"About {selected_model}")
-st.sidebar.write(f"You're now chatting with **{selected_model}**")
-st.sidebar.markdown(model_info[selected_model]['description'])
-st.sidebar.image(model_info[selected_model]['logo'])
+if selected_model == AUTO_MODEL:
+    st.sidebar.write("Each question goes to the fastest model that is currently answering reliably.")
+else:
+    st.sidebar.write(f"You're now chatting with **{selected_model}**")
+    st.sidebar.markdown(model_info[selected_model]['description'])
+    st.sidebar.image(model_info[selected_model]['logo'])
+
+# Response times measured on this server over the last week
+with st.sidebar.expander("Model response times"):
+    stats = latency_stats()
+    if stats.empty:
+        st.write("No calls recorded yet.")
+    else:
+        st.dataframe(
+            stats.round({"error_rate": 2, "ttft_s": 2, "total_s": 1, "tokens_per_s": 0}),
+            hide_index=True,
+            column_config={
+                "ttft_s": "first token (s)",
+                "total_s": "total (s)",
+                "tokens_per_s": "tokens/s",
+                "error_rate": "error rate",
+            },
+        )
 st.sidebar.markdown("*Generated content may be inaccurate or false.*")
 # st.sidebar.markdown("\nLearn how to build this chatbot [here](https://ngebodh.github.io/projects/2024-03-05/).")
 st.sidebar.markdown("\nRun into issues? \nTry coming back in a bit, GPU access might be limited or something is down.")
@@ -223,38 +309,192 @@ if st.session_state.prev_option != selected_model:
 
 
 
-#Pull in the model we want to use
-repo_id = model_links[selected_model]
 
-# initialize the client
-client = OpenAI(
-  base_url=model_links[selected_model]["inf_point"],#"https://api-inference.huggingface.co/v1",
-  api_key=st.session_state.API_token#os.environ.get('HUGGINGFACE_API_TOKEN')#"hf_xxx" # Replace with your token
-) 
+# Endpoints serving the selected model, tried in order of measured latency.
+# Hugging Face sessions fall back to the provided Groq key where it serves the model.
+providers = [(model_links, st.session_state.API_token)]
+shared_api_key = None
+if model_links is model_links_hf:
+    try:
+        shared_api_key = st.secrets["GROQ_API_KEY"]
+        providers.append((model_links_groq, shared_api_key))
+    except (KeyError, FileNotFoundError):
+        pass
+candidate_models = models[1:] if selected_model == AUTO_MODEL else selected_model
+endpoints = chat_endpoints(candidate_models, providers)
 
 
 # st.subheader(f'AI - {selected_model}')
 st.subheader(f'Find out about Hazard related Ecosystem Services')
 
-# Set a default model
-if selected_model not in st.session_state:
-    st.session_state[selected_model] = model_links[selected_model] 
-
 # Initialize chat history
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
 
+system_prompt = """
+You are an expert in hazard-risk assessment and ecosystem services for Nature-based Solutions (NbS).
+Provide detailed, technical answers based on established ecological and environmental knowledge.
+Tasks:
+- Identify risks/hazards (e.g., floods, fires, erosion).
+- Link hazards to ecosystem services that mitigate/regulate them (e.g., water retention, erosion control).
+- Specify which ecosystems/habitats provide those services (e.g., wetlands, forests).
+- Include abiotic flows (e.g., air ventilation, groundwater recharge).
+- Use structured, relational explanations. Emphasizing the relational nature between hazard types, ecosystem services, and habitat functions to reduce impacts and vulnerabilities
+Where helpful:
+- Present findings in markdown tables or bullet summaries.
+- Present findings in structured text and use clear, labeled tables to compare or relate key items or relational matrices to summarize relationships or scores across categories (e.g., hazard impact vs. ecosystem service strength).
+- Format relationships as labeled visual tables or matrices when comparing (e.g., risk x ecosystem).
+- Cite datasets, reports, or peer-reviewed sources.
+"""
+
+
 # Display chat messages from history on app rerun
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+        if "answers" in message:
+            for column, answer in zip(st.columns(len(message["answers"])), message["answers"]):
+                column.markdown(f"**{answer['model']}**")
+                column.markdown(answer["content"])
+                column.caption(answer["note"])
+        else:
+            st.markdown(message["content"])
+
+
 
 
 
+# Calls left for this visitor: per browser session, and on the provided key also
+# per client address by the shared limiter
+uses_shared_key = model_links is model_links_groq
 
 
-if prompt := st.chat_input(f"Hi, ask me a question about ecosystem services "):
+def remaining_calls():
+    session_left = API_CALL_LIMIT - st.session_state.api_call_count
+    if uses_shared_key:
+        return min(shared_key_limiter().remaining(client_id), session_left)
+    return session_left
+
+
+def on_rate_limit(endpoint, retry_after):
+    # a 429 on the shared key holds every session's queue, not just this one
+    if endpoint[1] == model_links_groq.get(endpoint[0], {}).get("inf_point"):
+        shared_key_limiter().backoff(retry_after)
+
+
+def admit_failover(endpoint):
+    """
+    Let a Hugging Face session fail over onto the shared key only when the
+    shared limiter grants a call; sessions on the shared key took theirs in
+    take_call() already.
+    """
+    if uses_shared_key or shared_api_key is None or endpoint[3] != shared_api_key:
+        return True
+    try:
+        shared_key_limiter().acquire(client_id)
+        return True
+    except (QuotaExceeded, TimeoutError):
+        return False
+
+
+def take_call():
+    """Count one API call for this visitor, waiting for a turn on the shared key."""
+    if uses_shared_key:
+        # Wait for a turn on the shared key instead of failing with a 429
+        wait_note = st.empty()
+        shared_key_limiter().acquire(
+            client_id,
+            on_wait=lambda position, eta: wait_note.info(
+                f"Many questions right now: you are number {position + 1} in line, about {eta:.0f} s to go."
+            ),
+        )
+        wait_note.empty()
+    st.session_state.api_call_count += 1
+
+
+def compare_answers(prompt):
+    '''
+    Ask each compared model the same question at once and stream the answers side by side.
+    Comparisons are kept out of the context sent with later questions.
+    '''
+    with st.chat_message("user"):
+        st.markdown(prompt)
+    # The question closes each model's context; earlier comparison turns are left out
+    question = {"role": "user", "content": prompt}
+    grounding = context_block(prompt) if grounded else ""
+
+    with st.chat_message("assistant"):
+        columns = st.columns(len(compare_models))
+        bodies, notes, answers, jobs = [], [], [], []
+        for model, column in zip(compare_models, columns):
+            column.markdown(f"**{model}**")
+            bodies.append(column.empty())
+            notes.append(column.empty())
+            answers.append({"model": model, "content": "", "note": ""})
+
+        scopes = []
+        for i, model in enumerate(compare_models):
+            system_content, history = build_context(system_prompt + grounding, st.session_state.messages + [question], model)
+            if not history or history[-1] != question:
+                history.append(question)
+            scope = cache_scope(model_links[model]["link"], temp_values, system_prompt, grounded)
+            scopes.append((scope, history))
+            cached = lookup(scope, history)
+            if cached is not None:
+                answers[i].update(content=cached, note="Cached answer, no API call used")
+            elif remaining_calls() <= 0:
+                answers[i].update(content="Sorry, you have reached the API call limit for this session.", note="Not asked")
+            else:
+                try:
+                    take_call()
+                except (QuotaExceeded, TimeoutError) as e:
+                    answers[i].update(content=f"Sorry, the shared API key is not available right now ({e}).", note="Not asked")
+                    continue
+                messages = [{"role": "system", "content": system_content}, *history]
+                jobs.append((i, chat_endpoints(model, providers), messages))
+            bodies[i].markdown(answers[i]["content"])
+            notes[i].caption(answers[i]["note"])
+
+        # All models stream at once: the wait is the slowest answer, not the sum
+        for j, kind, value in stream_many(
+            [(model_endpoints, messages) for _, model_endpoints, messages in jobs],
+            on_rate_limit=on_rate_limit,
+            admit=admit_failover,
+            temperature=temp_values,
+            max_tokens=3000,
+        ):
+            i = jobs[j][0]
+            answer = answers[i]
+            if kind == "first":
+                endpoint, ttft = value
+                answer["note"] = f"First token {ttft:.1f} s via {provider_name(endpoint[1])}"
+            elif kind == "text":
+                answer["content"] += value
+                bodies[i].markdown(answer["content"] + "▌")
+            elif kind == "done":
+                answer["note"] += f", complete in {value:.1f} s"
+                bodies[i].markdown(answer["content"])
+                if answer["content"].strip():
+                    store(*scopes[i], answer["content"])
+            else:
+                answer["content"] = f"Looks like someone unplugged something! This was the error message: {value}"
+                answer["note"] = "Failed"
+                bodies[i].markdown(answer["content"])
+            notes[i].caption(answer["note"])
+
+        st.markdown(f"\n\n <span style='float: right; font-size: 0.8em; color: gray;'>API calls:({remaining_calls()}/{API_CALL_LIMIT})</span>", unsafe_allow_html=True)
+
+    summary = "\n\n".join(f"**{a['model']}**: {a['content']}" for a in answers)
+    st.session_state.messages.append({**question, "comparison": True})
+    st.session_state.messages.append({"role": "assistant", "content": summary, "answers": answers, "comparison": True})
+
+
+prompt = st.chat_input(f"Hi, ask me a question about ecosystem services ")
+
+if prompt and comparing:
+    compare_answers(prompt)
+
+elif prompt:
 
     # Display user message in chat message container
     with st.chat_message("user"):
@@ -262,61 +502,73 @@ if prompt := st.chat_input(f"Hi, ask me a question about ecosystem services "):
     # Add user message to chat history
     st.session_state.messages.append({"role": "user", "content": prompt})
 
+    # Recent turns within the model's token budget (for Auto, the smallest budget
+    # of the models it may route to); older ones are summarized into the system
+    # prompt and failed turns are left out
+    grounding = context_block(prompt) if grounded else ""
+    system_content, history = build_context(
+        system_prompt + grounding, st.session_state.messages, budget=context_budget(candidate_models)
+    )
 
+    # Repeated questions are answered from the response cache without using an API call
+    cache_model = "auto" if selected_model == AUTO_MODEL else model_links[selected_model]["link"]
+    cache_scope_key = cache_scope(cache_model, temp_values, system_prompt, grounded)
+    cached_response = lookup(cache_scope_key, history)
 
-    if st.session_state.api_call_count >= API_CALL_LIMIT:
+    if cached_response is not None:
+        with st.chat_message("assistant"):
+            response = st.write_stream(replay(cached_response))
+            st.markdown(f"\n\n <span style='float: right; font-size: 0.8em; color: gray;'>Cached answer, no API call used</span>", unsafe_allow_html=True)
+        st.session_state.messages.append({"role": "assistant", "content": response})
+
+    elif remaining_calls() <= 0:
         
         # Add the warning to the displayed messages, but not to the history sent to the model
         response = f"LIMIT REACHED: Sorry, you have reached the API call limit for this session."
         # st.write(response)
         st.warning(f"Sorry, you have reached the API call limit for this session.")
-        st.session_state.messages.append({"role": "assistant", "content": response })
+        st.session_state.messages.append({"role": "assistant", "content": response, "failed": True})
 
 
     else:
         # Display assistant response in chat message container
+        failed = False
         with st.chat_message("assistant"):
             try:
-                st.session_state.api_call_count += 1
+                take_call()
                 # Add a spinner for better UX while waiting
                 with st.spinner(f"Asking {selected_model}..."):
 
-                    system_prompt = """
-                    You are an expert in hazard-risk assessment and ecosystem services for Nature-based Solutions (NbS). 
-                    Provide detailed, technical answers based on established ecological and environmental knowledge.
-                    Tasks:
-                    - Identify risks/hazards (e.g., floods, fires, erosion).
-                    - Link hazards to ecosystem services that mitigate/regulate them (e.g., water retention, erosion control).
-                    - Specify which ecosystems/habitats provide those services (e.g., wetlands, forests).
-                    - Include abiotic flows (e.g., air ventilation, groundwater recharge).
-                    - Use structured, relational explanations. Emphasizing the relational nature between hazard types, ecosystem services, and habitat functions to reduce impacts and vulnerabilities
-                    Where helpful:
-                    - Present findings in markdown tables or bullet summaries.
-                    - Present findings in structured text and use clear, labeled tables to compare or relate key items or relational matrices to summarize relationships or scores across categories (e.g., hazard impact vs. ecosystem service strength).
-                    - Format relationships as labeled visual tables or matrices when comparing (e.g., risk x ecosystem).
-                    - Cite datasets, reports, or peer-reviewed sources.
-                    """
-
                     messages = [
-                        {"role": "system", "content": system_prompt},
-                        *[{"role": m["role"], "content": m["content"]} for m in st.session_state.messages]
+                        {"role": "system", "content": system_content},
+                        *history
                     ]
 
-                    stream = client.chat.completions.create(
-                        model=model_links[selected_model]["link"],
-                        messages=messages,
+                    endpoint, stream = stream_chat(
+                        endpoints,
+                        messages,
+                        on_rate_limit=on_rate_limit,
+                        admit=admit_failover,
                         temperature=temp_values,
-                        stream=True,
                         max_tokens=3000,
                     )
 
 
                     response = st.write_stream(stream)
+                    if isinstance(response, str) and response.strip():
+                        store(cache_scope_key, history, response)
 
-                    remaining_calls = (API_CALL_LIMIT) - st.session_state.api_call_count
-                    st.markdown(f"\n\n <span style='float: right; font-size: 0.8em; color: gray;'>API calls:({remaining_calls}/{API_CALL_LIMIT})</span>", unsafe_allow_html=True)
+                    if endpoint[0] != selected_model or endpoint[1] != model_links[selected_model]["inf_point"]:
+                        st.caption(f"Answered by {endpoint[0]} via {provider_name(endpoint[1])}")
+                    st.markdown(f"\n\n <span style='float: right; font-size: 0.8em; color: gray;'>API calls:({remaining_calls()}/{API_CALL_LIMIT})</span>", unsafe_allow_html=True)
+
+            except (QuotaExceeded, TimeoutError) as e:
+                failed = True
+                response = f"LIMIT REACHED: Sorry, the shared API key is not available right now ({e})."
+                st.warning(response)
 
             except Exception as e:
+                failed = True
                 response = " Looks like someone unplugged something!\
                         \n Either the model space is being updated or something is down.\
                         \n\
@@ -332,7 +584,7 @@ if prompt := st.chat_input(f"Hi, ask me a question about ecosystem services "):
 
 
         
-        st.session_state.messages.append({"role": "assistant", "content": response})
+        st.session_state.messages.append({"role": "assistant", "content": response, "failed": failed})
 
 import streamlit as st
 import datetime
@@ -1,7 +1,11 @@
 import ee
+from utils_trace import trace_panel
 import json
 import streamlit as st
 import geemap.foliumap as geemap
+from utils_landcover import nlcd_layers, nlcd_tiles
+from utils_layers import add_time_slider
+from utils_catalog import catalog_index, ensure_catalog, refresh_error, search_catalog, snapshot_age, start_refresh
 
 st.set_page_config(layout="wide")
 
@@ -23,39 +27,28 @@ def nlcd():
 
     Map = geemap.Map(center=[40, -100], zoom=4)
 
-    # Select the seven NLCD epoches after 2000.
-    years = ["2001", "2004", "2006", "2008", "2011", "2013", "2016", "2019"]
-
-    # Get an NLCD image by year.
-    def getNLCD(year):
-        # Import the NLCD collection.
-        dataset = ee.ImageCollection("USGS/NLCD_RELEASES/2019_REL/NLCD")
-
-        # Filter the collection by year.
-        nlcd = dataset.filter(ee.Filter.eq("system:index", year)).first()
-
-        # Select the land cover band.
-        landcover = nlcd.select("landcover")
-        return landcover
+    # Tile URLs of every NLCD epoch come from one cached collection query
+    years = list(nlcd_tiles())
 
     with row1_col2:
-        selected_year = st.multiselect("Select a year", years)
+        time_slider = st.checkbox("Time slider (all years)", value=True)
+        if not time_slider:
+            selected_year = st.multiselect("Select a year", years)
         add_legend = st.checkbox("Show legend")
 
-    if selected_year:
-        for year in selected_year:
-            Map.addLayer(getNLCD(year), {}, "NLCD " + year)
-
-        if add_legend:
-            Map.add_legend(
-                legend_title="NLCD Land Cover Classification", builtin_legend="NLCD"
-            )
-        with row1_col1:
-            Map.to_streamlit(width=width, height=height)
-
+    if time_slider:
+        # The slider switches years in the browser, without a rerun
+        add_time_slider(Map, nlcd_layers(visible=years[-1]), years, "NLCD")
     else:
-        with row1_col1:
-            Map.to_streamlit(width=width, height=height)
+        for layer in nlcd_layers(selected_year):
+            layer.add_to(Map)
+
+    if add_legend:
+        Map.add_legend(
+            legend_title="NLCD Land Cover Classification", builtin_legend="NLCD"
+        )
+    with row1_col1:
+        Map.to_streamlit(width=width, height=height)
 
 
 def search_data():
@@ -64,6 +57,21 @@ def search_data():
 
     Map = geemap.Map()
 
+    # Searches run on a local catalog snapshot, refreshed in the background
+    start_refresh()
+    if catalog_index() is None and not st.session_state.get("catalog_download_failed"):
+        try:
+            with st.spinner("Downloading the Earth Engine catalog..."):
+                ensure_catalog()
+        except Exception as e:
+            st.session_state["catalog_download_failed"] = True
+            st.warning(f"Catalog snapshot not available, searching online instead ({e})")
+    elif catalog_index() is not None and refresh_error() is not None:
+        st.caption(
+            f"Catalog snapshot from {snapshot_age() / 86400:.0f} days ago; "
+            f"the last refresh failed ({refresh_error()})."
+        )
+
     if "ee_assets" not in st.session_state:
         st.session_state["ee_assets"] = None
     if "asset_titles" not in st.session_state:
@@ -75,7 +83,10 @@ def search_data():
     with col2:
         keyword = st.text_input("Enter a keyword to search (e.g., elevation)", "")
         if keyword:
-            ee_assets = geemap.search_ee_data(keyword)
+            if catalog_index() is not None:
+                ee_assets = search_catalog(keyword)
+            else:
+                ee_assets = geemap.search_ee_data(keyword)
             asset_titles = [x["title"] for x in ee_assets]
             asset_types = [x["type"] for x in ee_assets]
 
@@ -175,4 +186,7 @@ last_updated = amsterdam_time.strftime("%B %d, %Y")
 current_time = amsterdam_time.strftime("%H:%M:%S")
 
 st.sidebar.markdown(f"**Last Updated:** {last_updated}")
-# st.sidebar.markdown(f"**Local Time (Amsterdam):** {current_time}")
\ No newline at end of file
+# st.sidebar.markdown(f"**Local Time (Amsterdam):** {current_time}")
+
+# Earth Engine calls of this run, when tracing is enabled (EE_TRACE=1)
+trace_panel()
@@ -0,0 +1,24 @@
+"""
+Run the app with operational metrics.
+
+Installs the page, Earth Engine and cache metrics in the Streamlit server
+process and serves them in the Prometheus text format on METRICS_PORT:
+
+    python serve.py [streamlit options]
+    curl http://localhost:9464/metrics
+"""
+
+import sys
+
+from streamlit.web import cli
+
+import utils_metrics
+from config import METRICS_HOST, METRICS_PORT
+
+if __name__ == "__main__":
+    if not utils_metrics.install():
+        print("Page render timing is not supported by this Streamlit version.")
+    utils_metrics.start_server(METRICS_PORT, METRICS_HOST)
+    print(f"Metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    sys.argv = ["streamlit", "run", "Home.py", *sys.argv[1:]]
+    sys.exit(cli.main())
@@ -0,0 +1,180 @@
+"""
+Record/replay stand-in for the Earth Engine client.
+
+``record()`` lets every ee.data round trip through and stores its response,
+keyed by the call and its serialized arguments. ``replay()`` answers the
+same calls from the recording without any network access, including the
+algorithm list that initializing the client needs:
+
+    with standin_ee.record(path):
+        ee.Initialize(...)  # live Earth Engine
+        ...
+    with standin_ee.replay(path) as stats:
+        ...  # offline; stats counts served and missing calls
+"""
+
+import contextlib
+import hashlib
+import json
+import threading
+import time
+
+import ee
+
+from utils_trace import TRACED_CALLS
+
+# Round trips served from recordings, on top of the traced entry points
+CALLS = [
+    *TRACED_CALLS,
+    "getAlgorithms",
+    "getTaskStatus",
+    "getTaskList",
+    "newTaskId",
+    "getList",
+]
+
+
+def _canonical(value):
+    """JSON-able form of call arguments, with EE objects as their expressions."""
+    if isinstance(value, ee.ComputedObject):
+        return {"__ee__": value.serialize()}
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+
+def call_key(name, args, kwargs):
+    """Recording key of one call."""
+    text = json.dumps([name, _canonical(args), _canonical(kwargs)], sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _encode(value):
+    if isinstance(value, ee.data.TileFetcher):
+        # the map name is stored as the "mapid" next to it in getMapId() results
+        return {"__tile_fetcher__": value.url_format}
+    if isinstance(value, dict):
+        return {str(k): _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+
+def _decode(value, map_name=None):
+    if isinstance(value, dict):
+        if "__tile_fetcher__" in value:
+            return ee.data.TileFetcher(
+                value["__tile_fetcher__"], map_name=value.get("map_name", map_name)
+            )
+        map_name = value.get("mapid", map_name)
+        return {k: _decode(v, map_name) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v, map_name) for v in value]
+    return value
+
+
+@contextlib.contextmanager
+def _patched(make_wrapper):
+    originals = {
+        name: getattr(ee.data, name) for name in CALLS if hasattr(ee.data, name)
+    }
+    for name, func in originals.items():
+        setattr(ee.data, name, make_wrapper(name, func))
+    try:
+        yield
+    finally:
+        for name, func in originals.items():
+            setattr(ee.data, name, func)
+
+
+@contextlib.contextmanager
+def record(path):
+    """Store the responses of every Earth Engine call made inside the block."""
+    recording = {}
+    if path.exists():
+        recording = json.loads(path.read_text())
+    lock = threading.Lock()
+    active = threading.local()
+
+    def make_wrapper(name, func):
+        def wrapper(*args, **kwargs):
+            # only the outermost call is a round trip of the app
+            if getattr(active, "on", False):
+                return func(*args, **kwargs)
+            key = call_key(name, args, kwargs)
+            active.on = True
+            try:
+                result = func(*args, **kwargs)
+            except ee.EEException as e:
+                with lock:
+                    recording[key] = {"call": name, "error": str(e)}
+                raise
+            finally:
+                active.on = False
+            with lock:
+                recording[key] = {"call": name, "result": _encode(result)}
+            return result
+
+        return wrapper
+
+    with _patched(make_wrapper):
+        try:
+            yield recording
+        finally:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(recording, sort_keys=True))
+
+
+@contextlib.contextmanager
+def replay(path, latency=0.0):
+    """
+    Initialize Earth Engine offline and answer calls inside the block from a
+    recording made with record(), or from several (a list of paths).
+
+    Unrecorded calls raise ``ee.EEException``. ``latency`` seconds are added
+    to every call to mimic the round trip. Yields a stats dict with the
+    number of ``calls`` served and ``missing`` calls.
+    """
+    recording = {}
+    for part in path if isinstance(path, (list, tuple)) else [path]:
+        recording.update(json.loads(part.read_text()))
+    stats = {"calls": 0, "missing": 0}
+    lock = threading.Lock()
+
+    def make_wrapper(name, func):
+        def wrapper(*args, **kwargs):
+            entry = recording.get(call_key(name, args, kwargs))
+            if latency:
+                time.sleep(latency)
+            with lock:
+                stats["calls" if entry else "missing"] += 1
+            if entry is None:
+                raise ee.EEException(f"No recorded response for {name}")
+            if "error" in entry:
+                raise ee.EEException(entry["error"])
+            return _decode(entry["result"])
+
+        return wrapper
+
+    initialize = ee.data.initialize
+
+    def offline_initialize(*args, **kwargs):
+        ee.data._initialized = True
+
+    ee.data.initialize = offline_initialize
+    try:
+        with _patched(make_wrapper):
+            if any(entry["call"] == "getAlgorithms" for entry in recording.values()):
+                ee.Reset()
+                # a project skips the credential checks; nothing is sent anyway
+                ee.Initialize(credentials=None, project="standin")
+            stats.update(calls=0, missing=0)
+            yield stats
+    finally:
+        ee.data.initialize = initialize
@@ -0,0 +1,172 @@
+"""
+Local OpenAI-compatible stand-in for the EcoChat providers.
+
+Serves ``/v1/models`` and streaming or plain ``/v1/chat/completions`` with a
+configurable latency, token rate and error rate, so EcoChat can be exercised
+without spending provider quota:
+
+    python standin_llm.py --port 8808 --latency 0.3 --fail-rate 0.2
+    ECOCHAT_BASE_URL=http://127.0.0.1:8808/v1 streamlit run Home.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = (
+    "Wetlands, floodplain forests and coastal dunes regulate flood hazards by "
+    "retaining water, slowing runoff and buffering storm surges. "
+    "| Hazard | Ecosystem service | Habitat |\n|---|---|---|\n"
+    "| Flood | Water retention | Wetlands |\n| Erosion | Soil stabilisation | Forests |\n"
+)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # set by serve()
+    latency = 0.0
+    token_delay = 0.0
+    fail_rate = 0.0
+    fail_status = 503
+    stats = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._json(200, {"object": "list", "data": [{"id": "stand-in"}]})
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with self.stats["lock"]:
+            self.stats["requests"] += 1
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": "not found"}})
+
+        time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            with self.stats["lock"]:
+                self.stats["failures"] += 1
+            return self._json(
+                self.fail_status, {"error": {"message": "stand-in failure"}}
+            )
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = request.get("model", "stand-in")
+        words = ANSWER.split(" ")
+        limit = request.get("max_tokens") or len(words)
+        words = words[:limit]
+
+        if not request.get("stream"):
+            return self._json(
+                200,
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": " ".join(words),
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                },
+            )
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else " " + word}
+            self._event(completion_id, model, delta, None)
+            time.sleep(self.token_delay)
+        self._event(completion_id, model, {}, "stop")
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def _event(self, completion_id, model, delta, finish_reason):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self._chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+
+    def _chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def serve(port=8808, latency=0.0, token_delay=0.0, fail_rate=0.0, fail_status=503):
+    """
+    Start the stand-in on a background thread.
+
+    Returns the server; its ``stats`` dict counts requests and injected
+    failures. Call ``server.shutdown()`` to stop it.
+    """
+    stats = {"requests": 0, "failures": 0, "lock": threading.Lock()}
+    handler = type(
+        "Handler",
+        (StandInHandler,),
+        {
+            "latency": latency,
+            "token_delay": token_delay,
+            "fail_rate": fail_rate,
+            "fail_status": fail_status,
+            "stats": stats,
+        },
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument(
+        "--latency", type=float, default=0.2, help="seconds before answering"
+    )
+    parser.add_argument(
+        "--token-delay", type=float, default=0.02, help="seconds per streamed word"
+    )
+    parser.add_argument(
+        "--fail-rate", type=float, default=0.0, help="share of requests that fail"
+    )
+    parser.add_argument("--fail-status", type=int, default=503)
+    args = parser.parse_args()
+
+    server = serve(
+        args.port, args.latency, args.token_delay, args.fail_rate, args.fail_status
+    )
+    print(f"Stand-in LLM on http://127.0.0.1:{args.port}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,74 @@
+import time
+import types
+
+import pytest
+
+import utils_chat_cache
+from utils_chat_cache import cache_scope, lookup, store
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "chat_cache.sqlite"
+
+
+def ask(question):
+    return [{"role": "user", "content": question}]
+
+
+def test_stored_answer_is_found_after_normalization(path):
+    scope = cache_scope("model", 0.5, "You are helpful.")
+    store(scope, ask("What do wetlands regulate?"), "Floods.", path=path)
+    assert lookup(scope, ask("what do  wetlands regulate"), path=path) == "Floods."
+
+
+def test_scope_separates_models_temperatures_and_grounding(path):
+    scope = cache_scope("model", 0.5, "You are helpful.")
+    store(scope, ask("What do wetlands regulate?"), "Floods.", path=path)
+    for other in (
+        cache_scope("other", 0.5, "You are helpful."),
+        cache_scope("model", 1.0, "You are helpful."),
+        cache_scope("model", 0.5, "You are helpful.", grounded=True),
+    ):
+        assert lookup(other, ask("What do wetlands regulate?"), path=path) is None
+
+
+def test_close_temperatures_share_a_scope():
+    assert cache_scope("model", 0.5, "p") == cache_scope("model", 0.55, "p")
+
+
+def test_similar_first_question_matches_only_when_enabled(path):
+    scope = cache_scope("model", 0.5, "p")
+    store(
+        scope, ask("Which ecosystems reduce coastal flood risk?"), "Dunes.", path=path
+    )
+    similar = ask("Which ecosystems reduce the coastal flood risk, please?")
+    assert lookup(scope, similar, path=path) == "Dunes."
+    assert lookup(scope, similar, similar=False, path=path) is None
+    assert lookup(scope, ask("How do forests limit erosion?"), path=path) is None
+
+
+def test_follow_up_turns_must_match_exactly(path):
+    scope = cache_scope("model", 0.5, "p")
+    history = ask("What do wetlands regulate?") + [
+        {"role": "assistant", "content": "Floods."},
+        {"role": "user", "content": "And forests?"},
+    ]
+    store(scope, history, "Erosion.", path=path)
+    assert lookup(scope, history, path=path) == "Erosion."
+    assert (
+        lookup(
+            scope, history[:-1] + [{"role": "user", "content": "And dunes?"}], path=path
+        )
+        is None
+    )
+
+
+def test_entries_expire_after_the_ttl(path, monkeypatch):
+    scope = cache_scope("model", 0.5, "p")
+    store(scope, ask("What do wetlands regulate?"), "Floods.", path=path)
+    later = time.time() + utils_chat_cache.CACHE_TTL + 1
+    monkeypatch.setattr(
+        utils_chat_cache, "time", types.SimpleNamespace(time=lambda: later)
+    )
+    assert lookup(scope, ask("What do wetlands regulate?"), path=path) is None
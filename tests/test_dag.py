@@ -0,0 +1,88 @@
+from utils_dag import Graph
+
+
+def counting(func, calls):
+    def run(*args):
+        calls.append(args)
+        return func(*args)
+
+    return run
+
+
+def test_products_are_computed_lazily_and_memoized():
+    calls = []
+    graph = Graph()
+    graph.input("x", 2)
+    graph.node("y", ["x"], counting(lambda x: x + 1, calls))
+    graph.node("unread", ["x"], counting(lambda x: x * 100, calls))
+    assert calls == []
+    assert graph["y"] == 3
+    assert graph["y"] == 3
+    assert calls == [(2,)]
+
+
+def test_changed_input_recomputes_downstream_only():
+    calls = []
+    graph = Graph()
+    graph.input("x", 2)
+    graph.input("other", 1)
+    graph.node("y", ["x"], counting(lambda x: x + 1, calls))
+    graph.node("z", ["y"], counting(lambda y: y * 10, calls))
+    graph.node("w", ["other"], counting(lambda other: -other, calls))
+    graph["z"], graph["w"]
+    graph.input("x", 5)
+    assert graph["z"] == 60
+    assert graph["w"] == -1
+    assert calls == [(2,), (3,), (1,), (5,), (6,)]
+
+
+def test_input_key_overrides_value():
+    graph = Graph()
+    graph.input("x", [1], key="same")
+    graph.node("y", ["x"], lambda x: list(x))
+    assert graph["y"] == [1]
+    graph.input("x", [2], key="same")
+    assert graph["y"] == [1]
+
+
+def test_redefining_a_node_with_the_same_code_keeps_its_value():
+    calls = []
+    graph = Graph()
+    graph.input("x", 2)
+    for _ in range(2):  # like a page declaring its graph on every rerun
+        graph.node("y", ["x"], lambda x: calls.append(x) or [v + 1 for v in (x,)])
+        assert graph["y"] == [3]
+    assert calls == [2]
+
+
+def test_redefining_a_node_with_other_code_recomputes():
+    graph = Graph()
+    graph.input("x", 2)
+    graph.node("y", ["x"], lambda x: x + 1)
+    assert graph["y"] == 3
+    graph.node("y", ["x"], lambda x: x * 10)
+    assert graph["y"] == 20
+    graph.node("y", ["x"], lambda x: abs(x))
+    assert graph["y"] == 2
+    graph.node("y", ["x"], lambda x: str(x))  # same bytecode, other name
+    assert graph["y"] == "2"
+
+
+def test_failures_are_not_stored():
+    attempts = []
+
+    def flaky(x):
+        attempts.append(x)
+        if len(attempts) == 1:
+            raise RuntimeError("first call fails")
+        return x
+
+    graph = Graph()
+    graph.input("x", 2)
+    graph.node("y", ["x"], flaky)
+    try:
+        graph["y"]
+    except RuntimeError:
+        pass
+    assert graph["y"] == 2
+    assert len(attempts) == 2
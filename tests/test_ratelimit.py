@@ -0,0 +1,61 @@
+import pytest
+
+from utils_ratelimit import QuotaExceeded, RateLimiter
+
+
+def test_burst_is_admitted_without_waiting():
+    limiter = RateLimiter(rate=0.001, burst=3, client_quota=10)
+    for _ in range(3):
+        limiter.acquire("a", timeout=0.1)
+    assert limiter.remaining("a") == 7
+
+
+def test_empty_bucket_times_out_instead_of_failing_late():
+    limiter = RateLimiter(rate=0.001, burst=1, client_quota=10)
+    limiter.acquire("a", timeout=0.1)
+    with pytest.raises(TimeoutError):
+        limiter.acquire("a", timeout=0.1)
+
+
+def test_waiter_is_told_its_position_and_gets_its_turn():
+    limiter = RateLimiter(rate=50, burst=1, client_quota=10)
+    limiter.acquire("a")
+    waits = []
+    limiter.acquire("b", on_wait=lambda position, eta: waits.append(position))
+    assert waits and waits[0] == 0
+
+
+def test_client_quota_is_per_client():
+    limiter = RateLimiter(rate=100, burst=10, client_quota=2)
+    limiter.acquire("a")
+    limiter.acquire("a")
+    with pytest.raises(QuotaExceeded):
+        limiter.acquire("a")
+    limiter.acquire("b")
+    assert limiter.remaining("a") == 0
+
+
+def test_daily_quota_covers_all_clients():
+    limiter = RateLimiter(rate=100, burst=10, client_quota=10, daily_quota=2)
+    limiter.acquire("a")
+    limiter.acquire("b")
+    with pytest.raises(QuotaExceeded):
+        limiter.acquire("c")
+
+
+def test_backoff_holds_every_caller():
+    limiter = RateLimiter(rate=100, burst=10, client_quota=10)
+    limiter.backoff(60)
+    assert limiter.wait_estimate() > 50
+    with pytest.raises(TimeoutError):
+        limiter.acquire("a", timeout=0.1)
+
+
+def test_state_file_is_shared_between_limiters(tmp_path):
+    path = tmp_path / "limit.json"
+    first = RateLimiter(rate=100, burst=10, client_quota=2, path=path)
+    second = RateLimiter(rate=100, burst=10, client_quota=2, path=path)
+    first.acquire("a")
+    second.acquire("a")
+    with pytest.raises(QuotaExceeded):
+        first.acquire("a")
@@ -0,0 +1,280 @@
+import argparse
+import bisect
+import difflib
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+
+import streamlit as st
+
+from config import CACHE_PATH
+
+# Community-maintained dump of the Earth Engine data catalog (the list that
+# geemap.search_ee_data() fetches on every search)
+CATALOG_URL = (
+    "https://raw.githubusercontent.com/opengeos/Earth-Engine-Catalog/master/"
+    "gee_catalog.json"
+)
+CATALOG_PATH = CACHE_PATH / "ee_catalog.json"
+
+# The snapshot is refreshed in the background once it is older than a week;
+# the refresh thread checks every hour
+REFRESH_INTERVAL = 7 * 24 * 3600
+CHECK_INTERVAL = 3600
+DOWNLOAD_TIMEOUT = 30
+
+# Weight of a term by the field it occurs in
+FIELD_WEIGHTS = {
+    "id": 3.0,
+    "title": 3.0,
+    "tags": 2.0,
+    "provider": 1.0,
+    "description": 0.5,
+}
+# Score factor of a term matched as a prefix or fuzzily instead of exactly
+PREFIX_FACTOR = 0.7
+FUZZY_FACTOR = 0.5
+FUZZY_CUTOFF = 0.8
+MIN_FUZZY_LENGTH = 4
+MAX_RESULTS = 50
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Held while a snapshot is written, so the refresh thread and a page waiting
+# for the first snapshot do not download it twice
+_refresh_lock = threading.RLock()
+# Error of the last failed background refresh, cleared by a successful one
+_last_error = None
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text):
+    """Lower-case word tokens; ids split on ``/``, ``_`` and ``-``."""
+    return _TOKEN.findall(str(text).lower())
+
+
+def _tags(value):
+    if isinstance(value, str):
+        return [t.strip() for t in value.split(",") if t.strip()]
+    return list(value or [])
+
+
+def normalize_record(asset):
+    """
+    Catalog entry in the shape geemap.search_ee_data() returns, so it can be
+    passed to geemap.ee_data_html(), plus provider, tags and description.
+    """
+    ee_id = asset["id"]
+    uid = asset.get("uid") or ee_id.replace("/", "_")
+    start = str(asset.get("start_date") or "Unknown")[:10]
+    end = str(asset.get("end_date") or "Unknown")[:10]
+    return {
+        "uid": uid,
+        "title": asset.get("title") or ee_id,
+        "dates": asset.get("dates") or f"{start} - {end}",
+        "id": ee_id,
+        "type": asset.get("type") or "image",
+        "asset_url": asset.get("asset_url")
+        or f"https://developers.google.com/earth-engine/datasets/catalog/{uid}",
+        "thumbnail_url": asset.get("thumbnail_url")
+        or f"https://mw1.google.com/ges/dd/images/{uid}_sample.png",
+        "provider": asset.get("provider") or "",
+        "tags": _tags(asset.get("tags") or asset.get("keywords")),
+        "description": asset.get("description") or asset.get("snippet") or "",
+    }
+
+
+# ---------------------- Snapshot ----------------------
+
+
+def refresh_catalog(source=CATALOG_URL, path=CATALOG_PATH):
+    """
+    Download (or read from a local file) the catalog and save a normalized
+    snapshot. The file is replaced atomically, so readers never see half of it.
+    """
+    with _refresh_lock:
+        if os.path.exists(source):
+            with open(source) as handle:
+                assets = json.load(handle)
+        else:
+            with urllib.request.urlopen(source, timeout=DOWNLOAD_TIMEOUT) as response:
+                assets = json.load(response)
+        records = [normalize_record(a) for a in assets if a.get("id")]
+        if not records:
+            raise ValueError(f"No catalog entries in {source}")
+
+        # a unique temporary file, as other processes may refresh at once
+        with tempfile.NamedTemporaryFile(
+            "w", dir=path.parent, suffix=".tmp", delete=False
+        ) as tmp:
+            tmp.write(json.dumps(records))
+        os.replace(tmp.name, path)
+        return len(records)
+
+
+def ensure_catalog(path=CATALOG_PATH):
+    """
+    Download the snapshot unless there is one. Waits for a refresh already
+    running in this process instead of starting a second download.
+    """
+    with _refresh_lock:
+        if snapshot_age(path) is None:
+            refresh_catalog(path=path)
+
+
+def snapshot_age(path=CATALOG_PATH):
+    """Seconds since the snapshot was written, or None without a snapshot."""
+    try:
+        return time.time() - path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def refresh_error():
+    """Error of the last failed background refresh, or None."""
+    return _last_error
+
+
+def _refresh_loop(path):
+    global _last_error
+    while True:
+        with _refresh_lock:
+            age = snapshot_age(path)
+            if age is None or age > REFRESH_INTERVAL:
+                try:
+                    refresh_catalog(path=path)
+                    _last_error = None
+                except Exception as e:  # offline: keep serving the old snapshot
+                    _last_error = e
+                    logger.warning("Catalog refresh failed: %s", e)
+        time.sleep(CHECK_INTERVAL)
+
+
+@st.cache_resource(show_spinner=False)
+def start_refresh(path=CATALOG_PATH):
+    """Start the background refresh thread once per server process."""
+    thread = threading.Thread(target=_refresh_loop, args=(path,), daemon=True)
+    thread.start()
+    return thread
+
+
+# ---------------------- Index ----------------------
+
+
+class CatalogIndex:
+    """
+    Inverted index over the ids, titles, tags, providers and descriptions of
+    the catalog records.
+
+    ``postings`` maps each term to ``{record: field-weighted count}`` and
+    ``terms`` is the sorted vocabulary, so prefixes are a bisect range.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        postings = defaultdict(lambda: defaultdict(float))
+        for i, record in enumerate(records):
+            for field, weight in FIELD_WEIGHTS.items():
+                value = record[field]
+                text = " ".join(value) if isinstance(value, list) else value
+                for term in tokenize(text):
+                    postings[term][i] += weight
+        self.postings = {term: dict(hits) for term, hits in postings.items()}
+        self.terms = sorted(self.postings)
+        self.idf = {
+            term: math.log(1 + len(records) / len(hits))
+            for term, hits in self.postings.items()
+        }
+
+    def _expand(self, term, last):
+        """Index terms a query term stands for, with their score factor."""
+        matches = {}
+        if term in self.postings:
+            matches[term] = 1.0
+        # while typing, the last word is usually incomplete
+        if last or not matches:
+            start = bisect.bisect_left(self.terms, term)
+            for candidate in self.terms[start:]:
+                if not candidate.startswith(term):
+                    break
+                matches.setdefault(candidate, PREFIX_FACTOR)
+        if not matches and len(term) >= MIN_FUZZY_LENGTH:
+            for candidate in difflib.get_close_matches(
+                term, self.terms, n=3, cutoff=FUZZY_CUTOFF
+            ):
+                matches[candidate] = FUZZY_FACTOR
+        return matches
+
+    def search(self, query, limit=MAX_RESULTS):
+        """
+        Records matching a query, best first.
+
+        Records matching more query words rank above records matching fewer;
+        within that, by the summed field weight x idf of the matched terms.
+        """
+        words = tokenize(query)
+        scores = defaultdict(float)
+        matched = defaultdict(int)
+        for n, word in enumerate(words):
+            best = {}
+            for term, factor in self._expand(word, n == len(words) - 1).items():
+                idf = self.idf[term]
+                for i, weight in self.postings[term].items():
+                    best[i] = max(best.get(i, 0), factor * weight * idf)
+            for i, score in best.items():
+                scores[i] += score
+                matched[i] += 1
+        ranked = sorted(scores, key=lambda i: (-matched[i], -scores[i]))
+        return [self.records[i] for i in ranked[:limit]]
+
+
+# one entry: a refreshed snapshot replaces the previous index
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _load_index(path, mtime):
+    return CatalogIndex(json.loads(path.read_text()))
+
+
+def catalog_index(path=CATALOG_PATH):
+    """Index of the current snapshot (rebuilt after a refresh), or None."""
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    return _load_index(path, mtime)
+
+
+def search_catalog(query, limit=MAX_RESULTS, path=CATALOG_PATH):
+    """Catalog records matching a query, best first; [] without a snapshot."""
+    index = catalog_index(path)
+    return index.search(query, limit) if index else []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Refresh the local Earth Engine catalog snapshot, or search it."
+    )
+    parser.add_argument("query", nargs="?", help="keywords to search for")
+    parser.add_argument(
+        "--source", default=CATALOG_URL, help="catalog URL or local JSON file"
+    )
+    args = parser.parse_args()
+
+    if args.query is None:
+        count = refresh_catalog(args.source)
+        print(f"Wrote {count} datasets to {CATALOG_PATH}")
+    else:
+        index = catalog_index()
+        started = time.perf_counter()
+        results = index.search(args.query) if index else []
+        elapsed = (time.perf_counter() - started) * 1000
+        for record in results[:20]:
+            print(f"{record['id']:60}  {record['title'][:60]}")
+        print(f"{len(results)} results in {elapsed:.2f} ms")
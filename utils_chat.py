@@ -0,0 +1,454 @@
+import contextlib
+import math
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+import httpx
+import openai
+import pandas as pd
+import streamlit as st
+from openai import OpenAI
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from config import CACHE_PATH, LLM_BASE_URL
+from utils_metrics import count_llm_call
+
+TELEMETRY_PATH = CACHE_PATH / "chat_telemetry.sqlite"
+
+# No tokenizer ships with the app; ~4 characters per token is close enough for
+# the Llama/Gemma/Mistral vocabularies to keep prompts inside a budget
+CHARS_PER_TOKEN = 4
+# Role markers and separators added per message by the chat templates
+MESSAGE_OVERHEAD = 4
+
+# Prompt token budget (system prompt, summary and recent turns) per model.
+# Kept well below the context windows so time-to-first-token stays flat.
+DEFAULT_CONTEXT_BUDGET = 3000
+CONTEXT_BUDGETS = {
+    "Gemma-2-2B-it": 1500,
+    "Zephyr-7B-β": 2000,
+    "Mistral-7B": 2000,
+}
+# Share of the budget the summary of older turns may use
+SUMMARY_SHARE = 0.25
+# Characters kept from each older turn in the summary
+SUMMARY_CHARS = 160
+
+FAILED_PREFIXES = ("LIMIT REACHED",)
+
+# Seconds to open a connection and to wait between streamed chunks
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+# Retries per endpoint on 429/5xx/timeouts, with full-jitter exponential backoff
+RETRIES = 2
+BACKOFF = 0.5
+
+# Routing looks at the last day of calls; the sidebar stats at the last week
+ROUTING_WINDOW = 24 * 3600
+STATS_WINDOW = 7 * 24 * 3600
+# Endpoints failing at least this share of their recent calls are tried last
+UNHEALTHY_ERROR_RATE = 0.5
+MIN_HEALTH_CALLS = 3
+
+
+def count_tokens(text):
+    """Approximate token count of a text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def message_tokens(message):
+    """Approximate token count of a chat message, including its overhead."""
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def is_failed(message):
+    """
+    Whether a history entry is a limit or error notice rather than an answer.
+    Only assistant entries are notices; a question is never dropped, whatever
+    it starts with.
+    """
+    return message.get("failed", False) or (
+        message["role"] == "assistant"
+        and message["content"].startswith(FAILED_PREFIXES)
+    )
+
+
+def _gist(text, limit=SUMMARY_CHARS):
+    """First sentence of a text, whitespace collapsed and cut to ``limit``."""
+    text = re.sub(r"\s+", " ", text).strip()
+    text = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    return text if len(text) <= limit else text[: limit - 1].rstrip() + "…"
+
+
+def summarize_turns(messages, budget):
+    """
+    Compact older turns into a bullet summary of at most ``budget`` tokens.
+
+    Each turn is reduced to its first sentence; when that is still too long
+    the most recent turns are kept.
+    """
+    lines = []
+    used = count_tokens("Earlier in this conversation:\n")
+    for message in reversed(messages):
+        who = "User asked" if message["role"] == "user" else "Assistant answered"
+        line = f"- {who}: {_gist(message['content'])}"
+        if used + count_tokens(line) > budget:
+            break
+        lines.insert(0, line)
+        used += count_tokens(line)
+    if not lines:
+        return ""
+    return "Earlier in this conversation:\n" + "\n".join(lines)
+
+
+def context_budget(models):
+    """
+    Prompt budget of a model, or of a list of candidate models: the smallest
+    of their budgets, so the context fits whichever one answers.
+    """
+    if models is None or isinstance(models, str):
+        models = [models]
+    return min(CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET) for model in models)
+
+
+def build_context(system_prompt, messages, model=None, budget=None):
+    """
+    System prompt and recent turns that fit a model's prompt budget.
+
+    Failed turns and model comparisons are dropped. The newest turns are kept verbatim while they
+    fit; older ones are compacted into a summary appended to the system
+    prompt. Returns ``(system_content, window)`` where ``window`` is a list of
+    ``{"role", "content"}`` dicts ending with the latest user message.
+    """
+    if budget is None:
+        budget = context_budget(model)
+    history = [
+        {"role": m["role"], "content": m["content"]}
+        for m in messages
+        if not is_failed(m) and not m.get("comparison")
+    ]
+
+    available = budget - count_tokens(system_prompt) - MESSAGE_OVERHEAD
+    if sum(message_tokens(m) for m in history) <= available:
+        return system_prompt, history
+
+    summary_budget = int(available * SUMMARY_SHARE)
+    window, used = [], 0
+    for message in reversed(history):
+        tokens = message_tokens(message)
+        # the latest message is always sent, whatever its size
+        if window and used + tokens > available - summary_budget:
+            break
+        window.insert(0, message)
+        used += tokens
+
+    # a window should not open with a dangling assistant answer
+    while len(window) > 1 and window[0]["role"] == "assistant":
+        window.pop(0)
+
+    older = history[: len(history) - len(window)]
+    summary = summarize_turns(older, summary_budget)
+    if summary:
+        return f"{system_prompt}\n{summary}", window
+    return system_prompt, window
+
+
+# ---------------------- Clients ----------------------
+
+
+@st.cache_resource(show_spinner=False)
+def get_client(base_url, api_key):
+    """
+    OpenAI-compatible client shared by all sessions using an endpoint and token.
+
+    The underlying HTTP pool keeps connections alive between requests.
+    Retries are done by stream_chat() so failover can be ordered.
+    """
+    http_client = httpx.Client(
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60),
+    )
+    return OpenAI(
+        base_url=LLM_BASE_URL or base_url,
+        api_key=api_key,
+        max_retries=0,
+        http_client=http_client,
+    )
+
+
+def chat_endpoints(models, providers):
+    """
+    Endpoints serving one or more models, as ``(model, base_url, link, api_key)``.
+
+    ``providers`` is a list of ``(model_links, api_key)`` pairs; providers
+    without a token or without the model are skipped.
+    """
+    if isinstance(models, str):
+        models = [models]
+    return [
+        (model, links[model]["inf_point"], links[model]["link"], api_key)
+        for model in models
+        for links, api_key in providers
+        if api_key and model in links
+    ]
+
+
+def _retryable(error):
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and (
+        error.status_code == 429 or error.status_code >= 500
+    )
+
+
+def _retry_after(error):
+    """Seconds a 429 response asks to wait, defaulting to the backoff base."""
+    try:
+        return float(error.response.headers.get("retry-after", BACKOFF))
+    except (AttributeError, TypeError, ValueError):
+        return BACKOFF
+
+
+def rank_endpoints(endpoints):
+    """
+    Endpoints ordered for routing: healthy before unhealthy, then by median
+    time-to-first-token. Never-measured endpoints come first (in the given
+    order) so they get measured.
+    """
+    stats = endpoint_stats()
+
+    def key(endpoint):
+        entry = stats.get((endpoint[1], endpoint[2]))
+        if entry is None:
+            return (False, 0)
+        return (not entry["healthy"], entry["ttft"] or READ_TIMEOUT)
+
+    return sorted(endpoints, key=key)
+
+
+def _text(chunks):
+    for chunk in chunks:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def _timed(endpoint, started, ttft, first, chunks):
+    """Yield a stream and record its latency and token rate once it ends."""
+    text, ok = [first], False
+    try:
+        yield first
+        for piece in chunks:
+            text.append(piece)
+            yield piece
+        ok = True
+    finally:
+        record_call(
+            endpoint,
+            ttft=ttft,
+            total=time.perf_counter() - started,
+            tokens=count_tokens("".join(text)),
+            ok=ok,
+        )
+
+
+def stream_chat(endpoints, messages, on_rate_limit=None, admit=None, **params):
+    """
+    Stream a chat completion from the fastest healthy endpoint that answers.
+
+    Endpoints are tried in the order of rank_endpoints(). Each is retried on
+    rate limits, server errors and timeouts before failing over to the next.
+    Every attempt is recorded in the telemetry store. Returns
+    ``(endpoint, chunks)`` where ``chunks`` yields text once the first token
+    arrived; raises the last error if every endpoint failed.
+    ``on_rate_limit(endpoint, retry_after)`` is called on every 429 and
+    ``admit(endpoint)`` before an endpoint is first tried; endpoints it
+    returns False for are skipped.
+    """
+    error = None
+    for endpoint in rank_endpoints(endpoints):
+        if admit and not admit(endpoint):
+            continue
+        model, base_url, link, api_key = endpoint
+        client = get_client(base_url, api_key)
+        for attempt in range(RETRIES + 1):
+            if attempt:
+                time.sleep(random.uniform(0, BACKOFF * 2**attempt))
+            started = time.perf_counter()
+            try:
+                chunks = _text(
+                    client.chat.completions.create(
+                        model=link, messages=messages, stream=True, **params
+                    )
+                )
+                first = next(chunks, "")
+            except openai.OpenAIError as e:
+                record_call(endpoint, total=time.perf_counter() - started, ok=False)
+                if on_rate_limit and isinstance(e, openai.RateLimitError):
+                    on_rate_limit(endpoint, _retry_after(e))
+                error = e
+                if not _retryable(e):
+                    break
+                continue
+            ttft = time.perf_counter() - started
+            return endpoint, _timed(endpoint, started, ttft, first, chunks)
+    raise error or ValueError("No endpoint available for this model")
+
+
+def stream_many(jobs, on_rate_limit=None, admit=None, **params):
+    """
+    Run several stream_chat() calls at once, one thread per job.
+
+    ``jobs`` is a list of ``(endpoints, messages)``. Yields ``(i, kind, value)``
+    events in arrival order, where ``i`` is the job index and ``kind`` is
+    ``"first"`` (value: ``(endpoint, seconds to first token)``), ``"text"``
+    (a chunk), ``"done"`` (total seconds) or ``"error"`` (the exception).
+    Elements must be updated from the caller's thread, so the chunks are
+    handed over through a queue; the whole run takes as long as the slowest job.
+    """
+    events = queue.Queue()
+    ctx = get_script_run_ctx()
+
+    def run(i, endpoints, messages):
+        started = time.perf_counter()
+        try:
+            endpoint, chunks = stream_chat(
+                endpoints, messages, on_rate_limit=on_rate_limit, admit=admit, **params
+            )
+            events.put((i, "first", (endpoint, time.perf_counter() - started)))
+            for piece in chunks:
+                events.put((i, "text", piece))
+            events.put((i, "done", time.perf_counter() - started))
+        except Exception as e:
+            events.put((i, "error", e))
+
+    for i, (endpoints, messages) in enumerate(jobs):
+        thread = threading.Thread(
+            target=run, args=(i, endpoints, messages), daemon=True
+        )
+        add_script_run_ctx(thread, ctx)
+        thread.start()
+
+    running = len(jobs)
+    while running:
+        event = events.get()
+        if event[1] in ("done", "error"):
+            running -= 1
+        yield event
+
+
+# ---------------------- Telemetry ----------------------
+
+_TELEMETRY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    ts REAL NOT NULL,
+    model TEXT,
+    base_url TEXT NOT NULL,
+    link TEXT NOT NULL,
+    ttft REAL,
+    total REAL,
+    tokens INTEGER,
+    ok INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calls_ts ON calls (ts);
+"""
+
+
+@contextlib.contextmanager
+def _telemetry(path):
+    connection = sqlite3.connect(path, timeout=10)
+    try:
+        with connection:
+            connection.executescript(_TELEMETRY_SCHEMA)
+            yield connection
+    finally:
+        connection.close()
+
+
+def provider_name(base_url):
+    """Short provider label for an endpoint, e.g. ``api.groq.com/openai``."""
+    url = urlparse(base_url)
+    path = url.path.rstrip("/")
+    path = path[: -len("/v1")] if path.endswith("/v1") else path
+    return f"{url.netloc}{path}"[:60]
+
+
+def record_call(
+    endpoint, ttft=None, total=None, tokens=0, ok=True, path=TELEMETRY_PATH
+):
+    """Store the timings of one chat request."""
+    model, base_url, link = endpoint[:3]
+    with _telemetry(path) as connection:
+        connection.execute(
+            "INSERT INTO calls VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), model, base_url, link, ttft, total, tokens, int(ok)),
+        )
+        connection.execute(
+            "DELETE FROM calls WHERE ts < ?", (time.time() - STATS_WINDOW,)
+        )
+    count_llm_call(model, provider_name(base_url), ttft, total, ok)
+    if not ok:
+        endpoint_stats.clear()
+
+
+def _calls(window, path):
+    with _telemetry(path) as connection:
+        return pd.read_sql_query(
+            "SELECT * FROM calls WHERE ts >= ?",
+            connection,
+            params=(time.time() - window,),
+        )
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def endpoint_stats(window=ROUTING_WINDOW, path=TELEMETRY_PATH):
+    """Median time-to-first-token, error rate and health per endpoint."""
+    calls = _calls(window, path)
+    stats = {}
+    for (base_url, link), group in calls.groupby(["base_url", "link"]):
+        error_rate = 1 - group["ok"].mean()
+        ttft = group.loc[group["ok"] == 1, "ttft"].median()
+        stats[(base_url, link)] = {
+            "ttft": None if pd.isna(ttft) else ttft,
+            "error_rate": error_rate,
+            "healthy": len(group) < MIN_HEALTH_CALLS
+            or error_rate < UNHEALTHY_ERROR_RATE,
+        }
+    return stats
+
+
+def latency_stats(window=STATS_WINDOW, path=TELEMETRY_PATH):
+    """
+    Per model and provider: calls, error rate, median time-to-first-token,
+    median total latency (s) and streaming rate (tokens/s).
+    """
+    calls = _calls(window, path)
+    rows = []
+    for (model, base_url), group in calls.groupby(["model", "base_url"]):
+        done = group[group["ok"] == 1]
+        streaming = (done["total"] - done["ttft"]).sum()
+        rows.append(
+            {
+                "model": model,
+                "provider": provider_name(base_url),
+                "calls": len(group),
+                "error_rate": 1 - group["ok"].mean(),
+                "ttft_s": done["ttft"].median(),
+                "total_s": done["total"].median(),
+                "tokens_per_s": done["tokens"].sum() / streaming if streaming else None,
+            }
+        )
+    columns = [
+        "model",
+        "provider",
+        "calls",
+        "error_rate",
+        "ttft_s",
+        "total_s",
+        "tokens_per_s",
+    ]
+    return pd.DataFrame(rows, columns=columns)
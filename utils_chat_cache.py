@@ -0,0 +1,199 @@
+import contextlib
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from collections import Counter
+
+import numpy as np
+
+from config import CACHE_PATH
+from utils_metrics import count_cache
+
+CHAT_CACHE_PATH = CACHE_PATH / "chat_cache.sqlite"
+
+# Cached answers expire after a week and the table is trimmed to the most
+# recently used entries beyond MAX_ENTRIES
+CACHE_TTL = 7 * 24 * 3600
+MAX_ENTRIES = 5000
+
+# Temperatures are bucketed so 0.50 and 0.55 share answers
+TEMPERATURE_STEP = 0.25
+
+# Cosine similarity above which a first question counts as a repeat
+SIMILARITY_THRESHOLD = 0.9
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Words ignored when comparing questions for similarity
+_STOPWORDS = set(
+    "a an and are as at be by can do does for from how i in is it me of on or "
+    "please the their there these this to what which with you".split()
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    question TEXT,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_hit REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope);
+"""
+
+
+@contextlib.contextmanager
+def _connect(path):
+    connection = sqlite3.connect(path, timeout=10)
+    try:
+        with connection:
+            connection.executescript(_SCHEMA)
+            yield connection
+    finally:
+        connection.close()
+
+
+def normalize(text):
+    """Lower-case a message and collapse whitespace and punctuation."""
+    return " ".join(_TOKEN.findall(text.lower()))
+
+
+def _hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def cache_scope(model, temperature, system_prompt, grounded=False):
+    """
+    Hash of everything except the conversation that shapes an answer.
+
+    Pass the base system prompt, not one with retrieved passages or a
+    summary appended: passages follow from the question, so they would only
+    split the scope whenever the corpus ranking shifts.
+    """
+    bucket = round(temperature / TEMPERATURE_STEP) * TEMPERATURE_STEP
+    return _hash([model, bucket, normalize(system_prompt), bool(grounded)])
+
+
+def cache_key(scope, messages):
+    """Key of a normalized conversation within a scope."""
+    turns = [[m["role"], normalize(m["content"])] for m in messages]
+    return _hash([scope, turns])
+
+
+def _first_question(messages):
+    """The user question of a single-turn conversation, else None."""
+    if len(messages) == 1 and messages[0]["role"] == "user":
+        return normalize(messages[0]["content"])
+    return None
+
+
+def _tfidf(documents):
+    """L2-normalized TF-IDF rows for a list of normalized texts."""
+    counts = [
+        Counter(word for word in doc.split() if word not in _STOPWORDS)
+        for doc in documents
+    ]
+    vocabulary = {term: i for i, term in enumerate(set().union(*counts))}
+    matrix = np.zeros((len(documents), len(vocabulary)))
+    for row, count in enumerate(counts):
+        for term, n in count.items():
+            matrix[row, vocabulary[term]] = n
+    idf = np.log((1 + len(documents)) / (1 + (matrix > 0).sum(axis=0))) + 1
+    matrix = np.log1p(matrix) * idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _similar(connection, scope, question, now):
+    rows = connection.execute(
+        "SELECT key, question FROM responses "
+        "WHERE scope = ? AND question IS NOT NULL AND created > ?",
+        (scope, now - CACHE_TTL),
+    ).fetchall()
+    if not rows:
+        return None
+    vectors = _tfidf([question] + [row[1] for row in rows])
+    scores = vectors[1:] @ vectors[0]
+    best = int(np.argmax(scores))
+    if scores[best] >= SIMILARITY_THRESHOLD:
+        return rows[best][0]
+    return None
+
+
+def lookup(scope, messages, similar=True, path=CHAT_CACHE_PATH):
+    """
+    Cached answer for a conversation, or None.
+
+    Conversations match exactly after normalization. With ``similar`` a
+    single-question conversation also matches a near-identical earlier
+    question (TF-IDF cosine over the cached first questions of the scope).
+    """
+    now = time.time()
+    key = cache_key(scope, messages)
+    with _connect(path) as connection:
+        row = connection.execute(
+            "SELECT response FROM responses WHERE key = ? AND created > ?",
+            (key, now - CACHE_TTL),
+        ).fetchone()
+        question = _first_question(messages)
+        if row is None and similar and question:
+            key = _similar(connection, scope, question, now)
+            if key:
+                row = connection.execute(
+                    "SELECT response FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+        count_cache("chat_response", row is not None)
+        if row is None:
+            return None
+        connection.execute(
+            "UPDATE responses SET hits = hits + 1, last_hit = ? WHERE key = ?",
+            (now, key),
+        )
+    return row[0]
+
+
+def store(scope, messages, response, path=CHAT_CACHE_PATH):
+    """Cache an answer and evict expired and least recently used entries."""
+    now = time.time()
+    with _connect(path) as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO responses "
+            "(key, scope, question, response, created, last_hit) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                cache_key(scope, messages),
+                scope,
+                _first_question(messages),
+                response,
+                now,
+                now,
+            ),
+        )
+        connection.execute(
+            "DELETE FROM responses WHERE created <= ?", (now - CACHE_TTL,)
+        )
+        connection.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY last_hit DESC LIMIT ?)",
+            (MAX_ENTRIES,),
+        )
+
+
+def replay(response, chunk_words=4):
+    """Yield a cached answer in small chunks, for st.write_stream."""
+    words = re.split(r"(\s+)", response)
+    step = chunk_words * 2
+    for start in range(0, len(words), step):
+        yield "".join(words[start : start + step])
+
+
+def cache_stats(path=CHAT_CACHE_PATH):
+    """Number of cached answers and total cache hits."""
+    with _connect(path) as connection:
+        entries, hits = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM responses"
+        ).fetchone()
+    return {"entries": entries, "hits": hits}
@@ -0,0 +1,185 @@
+"""CORINE, EUNIS and landscape archetype class tables shared by the pages and EcoChat."""
+
+# Crosswalk mapping from CORINE classes to EUNIS numeric codes
+corine_to_eunis = {
+    111: 1,
+    112: 2,
+    121: 3,
+    122: 4,
+    123: 5,
+    124: 6,
+    131: 7,
+    132: 8,
+    133: 9,
+    141: 10,
+    142: 1,
+    211: 11,
+    212: 12,
+    213: 13,
+    221: 14,
+    222: 15,
+    223: 16,
+    231: 17,
+    241: 18,
+    242: 19,
+    243: 20,
+    244: 21,
+    311: 22,
+    312: 23,
+    313: 24,
+    321: 25,
+    322: 26,
+    323: 27,
+    324: 28,
+    331: 29,
+    332: 30,
+    333: 31,
+    334: 32,
+    335: 33,
+    411: 34,
+    412: 35,
+    421: 36,
+    422: 37,
+    423: 38,
+    511: 39,
+    512: 40,
+    521: 41,
+    522: 42,
+    523: 43,
+}
+
+
+# Full CORINE class (44 values)
+corine_classes = {
+    111: "Continuous Urban Fabric",
+    112: "Discontinuous Urban Fabric",
+    121: "Industrial/Commercial Units",
+    122: "Road/rail networks",
+    123: "Port areas",
+    124: "Airports",
+    131: "Mineral extraction sites",
+    132: "Dump sites",
+    133: "Construction sites",
+    141: "Green urban areas",
+    142: "Sport/leisure facilities",
+    211: "Non-irrigated arable land",
+    212: "Permanently irrigated land",
+    213: "Rice fields",
+    221: "Vineyards",
+    222: "Fruit trees",
+    223: "Olive groves",
+    231: "Pastures",
+    241: "Annual crops associated with permanent crops",
+    242: "Complex cultivation patterns",
+    243: "Agro-forestry",
+    244: "Agro-natural mosaic",
+    311: "Broad-leaved forest",
+    312: "Coniferous forest",
+    313: "Mixed forest",
+    321: "Natural grasslands",
+    322: "Moors/heathland",
+    323: "Sclerophyllous vegetation",
+    324: "Transitional woodland-shrub",
+    331: "Beaches/dunes/sands",
+    332: "Bare rocks",
+    333: "Sparsely vegetated areas",
+    334: "Burnt areas",
+    335: "Glaciers and perpetual snow",
+    411: "Inland marshes",
+    412: "Peat bogs",
+    421: "Salt marshes",
+    422: "Salines",
+    423: "Intertidal flats",
+    511: "Water courses",
+    512: "Water bodies",
+    521: "Coastal lagoons",
+    522: "Estuaries",
+    523: "Sea and ocean",
+}
+
+
+# Reclassification logics
+landscape_archetypes = {
+    "1": {"classes": [111, 112, 121, 122], "color": "#636363", "description": "Urban"},
+    "2": {"classes": [123, 124], "color": "#969696", "description": "Coastal Urban"},
+    "3": {"classes": [131, 132, 133], "color": "#cccccc", "description": "Industrial"},
+    "4": {"classes": [141, 142], "color": "#91d700", "description": "Recreational"},
+    "5": {
+        "classes": [211, 212, 213],
+        "color": "#91d700",
+        "description": "Rural (Flat)",
+    },
+    "6": {
+        "classes": [221, 222, 223, 231],
+        "color": "#df9f00",
+        "description": "Rural (Hilly)",
+    },
+    "7": {
+        "classes": [311, 312, 313, 321, 322, 323, 324],
+        "color": "#80ff00",
+        "description": "Forested",
+    },
+    "8": {
+        "classes": [332, 333, 334, 335],
+        "color": "#a63603",
+        "description": "Mountainous",
+    },
+    "9": {"classes": [241, 242, 243, 244], "color": "#78c679", "description": "Rural"},
+    "10": {"classes": [331], "color": "#ffcc99", "description": "Coastal (Beach)"},
+    "11": {
+        "classes": [421, 422, 423],
+        "color": "#7fff00",
+        "description": "Coastal Rural",
+    },
+    "12": {"classes": [411, 412], "color": "#a6e6ff", "description": "Wetlands"},
+    "13": {"classes": [511, 512], "color": "#4da6ff", "description": "Inland Water"},
+    "14": {"classes": [521, 522, 523], "color": "#00bfff", "description": "Marine"},
+}
+
+
+# EUNIS habitat labels of the numeric codes used in the app (43 classes)
+eunis_labels = {
+    1: "Urban buildings",
+    2: "Suburban housing",
+    3: "Low density build",
+    4: "Transport",
+    5: "Ports",
+    6: "Airports",
+    7: "Extractive industry",
+    8: "Waste deposits",
+    9: "Construction",
+    10: "Parks",
+    11: "Arable land",
+    12: "Crops (intensive)",
+    13: "Rice fields",
+    14: "Vineyards",
+    15: "Fruit shrubs",
+    16: "Olive trees",
+    17: "Grassland",
+    18: "Mixed crops",
+    19: "Garden crops",
+    20: "Low-intensity crops",
+    21: "Wooded grassland",
+    22: "Broadleaf forest",
+    23: "Conifer forest",
+    24: "Mixed woodland",
+    25: "Dry grasslands",
+    26: "Shrub heath",
+    27: "Medit. brush",
+    28: "Fringes/clearings",
+    29: "Beaches/dunes",
+    30: "Littoral rock",
+    31: "Sparse inland",
+    32: "Burnt land",
+    33: "Snow/Ice",
+    34: "Inland shore",
+    35: "Peat bogs",
+    36: "Salt marshes",
+    37: "Saline artificial",
+    38: "Littoral sand",
+    39: "Rivers",
+    40: "Lakes",
+    41: "Lagoons",
+    42: "Estuaries",
+    43: "Marine sand",
+}
@@ -0,0 +1,166 @@
+import argparse
+
+import pandas as pd
+import streamlit as st
+
+from config import COUNTRY_INDEX_PATH, DATABASE_PATH
+
+NE_COUNTRIES_PATH = DATABASE_PATH / "ne_110m_admin_0_countries.zip"
+US_STATES_PATH = DATABASE_PATH / "us_states.csv"
+MSBUILDINGS_ROOT = "projects/sat-io/open-datasets/MSBuildings"
+
+# EEA39 member and cooperating countries covered by CORINE Land Cover (ADM0_A3)
+CORINE_COUNTRIES = {
+    "AUT", "BEL", "BGR", "HRV", "CYP", "CZE", "DNK", "EST", "FIN", "FRA", "DEU",
+    "GRC", "HUN", "IRL", "ITA", "LVA", "LTU", "LUX", "MLT", "NLD", "POL", "PRT",
+    "ROU", "SVK", "SVN", "ESP", "SWE", "ISL", "LIE", "NOR", "CHE", "TUR", "ALB",
+    "BIH", "KOS", "MNE", "MKD", "SRB", "GBR",
+}  # fmt: skip
+
+
+def msbuildings_name(name):
+    """MSBuildings collection name for a Natural Earth country name."""
+    if name == "United States of America":
+        return "USA"
+    return name.replace(".", "").replace(" ", "_")
+
+
+def _list_assets(parent):
+    import ee
+
+    names, params = set(), {"parent": parent}
+    while True:
+        page = ee.data.listAssets(params)
+        names |= {asset["id"].rsplit("/", 1)[-1] for asset in page.get("assets", [])}
+        if not page.get("nextPageToken"):
+            return names
+        params["pageToken"] = page["nextPageToken"]
+
+
+def build_country_index(path=COUNTRY_INDEX_PATH, check_ee=False):
+    """
+    Write the country/state index used to switch regions without server calls.
+
+    Countries come from the bundled Natural Earth 1:110m zip (bbox from the
+    geometry, centre from the label point) and US states from us_states.csv.
+    With ``check_ee`` the ``msbuildings`` flag is filled by listing the
+    MSBuildings folders; otherwise it is left empty (unknown).
+    """
+    import geopandas as gpd
+
+    countries = gpd.read_file(f"zip://{NE_COUNTRIES_PATH}")
+    rows = []
+    for _, country in countries.iterrows():
+        west, south, east, north = country.geometry.bounds
+        rows.append(
+            {
+                "level": "country",
+                "name": msbuildings_name(country["NAME"]),
+                "label": country["NAME"],
+                "parent": "",
+                "iso_a3": country["ADM0_A3"],
+                "west": west,
+                "south": south,
+                "east": east,
+                "north": north,
+                "lon": country["LABEL_X"],
+                "lat": country["LABEL_Y"],
+                "corine": country["ADM0_A3"] in CORINE_COUNTRIES,
+            }
+        )
+
+    states = pd.read_csv(US_STATES_PATH)
+    for _, state in states.iterrows():
+        rows.append(
+            {
+                "level": "state",
+                "name": state["name"],
+                "label": state["name"],
+                "parent": "USA",
+                "iso_a3": "USA",
+                **state[["west", "south", "east", "north", "lon", "lat"]].to_dict(),
+                "corine": False,
+            }
+        )
+
+    index = pd.DataFrame(rows).sort_values(["level", "name"])
+    index["msbuildings"] = pd.NA
+    if check_ee:
+        available = _list_assets(MSBUILDINGS_ROOT)
+        us_states = _list_assets(f"{MSBUILDINGS_ROOT}/US")
+        index["msbuildings"] = [
+            name in (us_states if level == "state" else available)
+            for level, name in zip(index["level"], index["name"])
+        ]
+
+    index.round(4).to_csv(path, index=False)
+    return index
+
+
+@st.cache_data
+def load_country_index(path=COUNTRY_INDEX_PATH):
+    """Bundled country/state index: names, bboxes, centres and dataset flags."""
+    return pd.read_csv(path, keep_default_na=False, na_values={"msbuildings": [""]})
+
+
+def region_names(index, level="country"):
+    """Sorted region names of one level."""
+    return sorted(index.loc[index["level"] == level, "name"])
+
+
+def region_info(index, name, level="country"):
+    """Index row for a region, as a dict."""
+    rows = index[(index["level"] == level) & (index["name"] == name)]
+    return rows.iloc[0].to_dict()
+
+
+def region_bbox(info):
+    """``(west, south, east, north)`` of an index row."""
+    return info["west"], info["south"], info["east"], info["north"]
+
+
+def msbuildings_id(info):
+    """MSBuildings collection id of an index row."""
+    if info["level"] == "state":
+        return f"{MSBUILDINGS_ROOT}/US/{info['name']}"
+    return f"{MSBUILDINGS_ROOT}/{info['name']}"
+
+
+@st.cache_data(ttl=24 * 3600, show_spinner=False)
+def _collection_exists(asset_id):
+    import ee
+
+    try:
+        ee.data.getAsset(asset_id)
+        return True
+    except ee.EEException:
+        return False
+
+
+def has_msbuildings(info):
+    """
+    Whether MSBuildings has footprints for an index row.
+
+    Uses the index flag when it was filled with ``--check-ee`` and otherwise
+    looks the collection up once a day.
+    """
+    if pd.notna(info["msbuildings"]):
+        return bool(info["msbuildings"])
+    return _collection_exists(msbuildings_id(info))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild database/country_index.csv.")
+    parser.add_argument(
+        "--check-ee",
+        action="store_true",
+        help="fill MSBuildings availability flags from Earth Engine",
+    )
+    args = parser.parse_args()
+
+    if args.check_ee:
+        from utils_ee import initialize_earth_engine
+
+        initialize_earth_engine()
+    index = build_country_index(check_ee=args.check_ee)
+    print(f"Wrote {len(index)} regions to {COUNTRY_INDEX_PATH}")
@@ -0,0 +1,79 @@
+"""
+Lazily computed, memoized page products, kept per session.
+
+A page sets its inputs and declares how each product derives from other
+nodes on every run; products are only computed when read:
+
+    graph = session_graph("step1")
+    graph.input("aoi", final_aoi, key=expression_hash(final_aoi))
+    graph.node("centroid", ["aoi"], lambda aoi: aoi.centroid().getInfo())
+    graph["centroid"]  # computed once, then reused until the AOI changes
+
+A product is keyed by its name, the code of its function and the keys of
+its inputs, so it is recomputed only when one of its upstream inputs or its
+definition changed. Products nobody reads are never built.
+"""
+
+import hashlib
+import types
+
+import streamlit as st
+
+from utils_metrics import count_cache
+
+
+def code_hash(code):
+    """Hash of a code object's bytecode, constants and referenced names."""
+    digest = hashlib.sha1(code.co_code)
+    digest.update(repr(code.co_names).encode("utf-8"))
+    for const in code.co_consts:
+        # nested functions: their repr holds a memory address
+        text = code_hash(const) if isinstance(const, types.CodeType) else repr(const)
+        digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class Graph:
+    """Named inputs and derived products with their last computed values."""
+
+    def __init__(self):
+        self._inputs = {}  # name: (key, value)
+        self._nodes = {}  # name: (deps, func, code hash)
+        self._values = {}  # name: (key, value)
+
+    def input(self, name, value, key=None):
+        """Set an input; ``key`` identifies its value and defaults to the value."""
+        self._inputs[name] = (value if key is None else key, value)
+
+    def node(self, name, deps, func):
+        """Declare a product computed as ``func(*values of deps)``."""
+        self._nodes[name] = (tuple(deps), func, code_hash(func.__code__))
+
+    def key(self, name):
+        """
+        Key of a node: its own key for inputs; its name, code and inputs' keys
+        otherwise.
+        """
+        if name in self._inputs:
+            return self._inputs[name][0]
+        deps, _, code = self._nodes[name]
+        return (name, code, tuple(self.key(dep) for dep in deps))
+
+    def __getitem__(self, name):
+        if name in self._inputs:
+            return self._inputs[name][1]
+        key = self.key(name)
+        cached = self._values.get(name)
+        count_cache("session_graph", cached is not None and cached[0] == key)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        deps, func, _ = self._nodes[name]
+        value = func(*(self[dep] for dep in deps))
+        # only the latest value is kept; failures are not stored
+        self._values[name] = (key, value)
+        return value
+
+
+def session_graph(name):
+    """The graph of a page for the current session."""
+    return st.session_state.setdefault(f"graph_{name}", Graph())
@@ -1,3 +1,5 @@
+import hashlib
+
 import ee
 import streamlit as st
 from google.oauth2 import service_account 
@@ -29,3 +31,8 @@ def initialize_earth_engine():
         st.success("Earth Engine initialized successfully!")
     except Exception as e:
         st.error(f"Earth Engine initialization failed: {e}")
+
+
+def expression_hash(obj):
+    """Stable hash of an EE object's serialized expression graph."""
+    return hashlib.sha1(obj.serialize().encode("utf-8")).hexdigest()
@@ -0,0 +1,192 @@
+"""
+Cross-session disk cache for getInfo() results of deterministic EE computations.
+
+Results live in SQLite next to the other caches, so every session and
+server process shares them. An entry is keyed by a hash of the object's
+serialized expression graph plus the update time of every asset the graph
+loads; re-ingesting an asset therefore invalidates the results built on it.
+Entries expire after a TTL and the least recently used ones are evicted
+beyond MAX_BYTES.
+
+Only use cached_info() for computations whose result depends on nothing
+but the expression and its assets (no ee.Date.now(), random sampling, ...).
+"""
+
+import contextlib
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import ee
+
+from config import CACHE_PATH
+from utils_metrics import count_cache
+
+EE_CACHE_PATH = CACHE_PATH / "ee_cache.sqlite"
+
+# Results expire after a week; beyond MAX_BYTES of stored results the least
+# recently used ones are evicted
+CACHE_TTL = 7 * 24 * 3600
+MAX_BYTES = 256 * 1024 * 1024
+
+# Asset update times are looked up again after this many seconds
+ASSET_CHECK_INTERVAL = 3600
+
+# Functions of the expression graph that load an asset, and their id argument
+_LOADERS = {
+    "Image.load": "id",
+    "ImageCollection.load": "id",
+    "Collection.loadTable": "tableId",
+    "FeatureCollection.loadBigQueryTable": "table",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    expires REAL NOT NULL,
+    last_hit REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS assets (
+    id TEXT PRIMARY KEY,
+    update_time TEXT NOT NULL,
+    checked REAL NOT NULL
+);
+"""
+
+_lock = threading.Lock()
+# One lock per key being computed, so concurrent sessions wait for the first
+# computation instead of repeating it
+_inflight = {}
+
+
+@contextlib.contextmanager
+def _connect(path):
+    connection = sqlite3.connect(path, timeout=30)
+    try:
+        with connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+            yield connection
+    finally:
+        connection.close()
+
+
+def loaded_assets(expression):
+    """Ids of the assets a serialized expression graph (as JSON) loads."""
+    assets = set()
+
+    def walk(node):
+        if isinstance(node, dict):
+            invocation = node.get("functionInvocationValue")
+            if invocation and invocation.get("functionName") in _LOADERS:
+                argument = invocation.get("arguments", {}).get(
+                    _LOADERS[invocation["functionName"]], {}
+                )
+                if isinstance(argument.get("constantValue"), str):
+                    assets.add(argument["constantValue"])
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(json.loads(expression))
+    return sorted(assets)
+
+
+def _asset_versions(connection, assets, now):
+    """Update time of every asset, from the table or Earth Engine."""
+    versions = {}
+    for asset in assets:
+        row = connection.execute(
+            "SELECT update_time FROM assets WHERE id = ? AND checked > ?",
+            (asset, now - ASSET_CHECK_INTERVAL),
+        ).fetchone()
+        if row is None:
+            try:
+                update_time = ee.data.getAsset(asset).get("updateTime") or ""
+            except ee.EEException:  # no metadata access; the expression decides
+                update_time = ""
+            connection.execute(
+                "INSERT OR REPLACE INTO assets (id, update_time, checked) "
+                "VALUES (?, ?, ?)",
+                (asset, update_time, now),
+            )
+            row = (update_time,)
+        versions[asset] = row[0]
+    return versions
+
+
+def cache_key(expression, versions):
+    """Key of an expression graph at the given asset versions."""
+    text = json.dumps([expression, versions], sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _evict(connection, now, max_bytes):
+    connection.execute("DELETE FROM results WHERE expires <= ?", (now,))
+    connection.execute(
+        "DELETE FROM results WHERE key IN (SELECT key FROM ("
+        "SELECT key, SUM(size) OVER (ORDER BY last_hit DESC) AS total "
+        "FROM results) WHERE total > ?)",
+        (max_bytes,),
+    )
+
+
+def cached_info(obj, ttl=CACHE_TTL, path=EE_CACHE_PATH, max_bytes=MAX_BYTES):
+    """``obj.getInfo()``, answered from the shared cache when possible."""
+    expression = obj.serialize()
+    now = time.time()
+    with _connect(path) as connection:
+        key = cache_key(
+            expression, _asset_versions(connection, loaded_assets(expression), now)
+        )
+
+    with _lock:
+        key_lock = _inflight.setdefault(key, threading.Lock())
+    try:
+        with key_lock:
+            with _connect(path) as connection:
+                row = connection.execute(
+                    "SELECT value FROM results WHERE key = ? AND expires > ?",
+                    (key, now),
+                ).fetchone()
+                count_cache("ee_info", row is not None)
+                if row is not None:
+                    connection.execute(
+                        "UPDATE results SET hits = hits + 1, last_hit = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+                    return json.loads(row[0])
+
+            value = obj.getInfo()
+            text = json.dumps(value)
+            now = time.time()
+            with _connect(path) as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO results "
+                    "(key, value, size, created, expires, last_hit) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, text, len(text), now, now + ttl, now),
+                )
+                _evict(connection, now, max_bytes)
+            return value
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def cache_stats(path=EE_CACHE_PATH):
+    """Number of cached results, their size in bytes and total cache hits."""
+    with _connect(path) as connection:
+        entries, size, hits = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) "
+            "FROM results"
+        ).fetchone()
+    return {"entries": entries, "bytes": size, "hits": hits}
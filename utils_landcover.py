@@ -0,0 +1,226 @@
+import argparse
+import calendar
+import datetime
+
+import ee
+import folium
+import geemap.foliumap as geemap
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+from config import REGIONS
+from utils_materialize import materialize
+from utils_ee_cache import cached_info
+
+# Transition codes are encoded as from * TRANSITION_BASE + to, so every
+# class scheme used in the app (archetypes, EUNIS, raw CORINE) fits.
+TRANSITION_BASE = 1000
+
+# Earth Engine map ids stay valid for hours; refresh cached tile URLs well before
+DW_TILE_TTL = 6 * 3600
+
+NLCD_COLLECTION = "USGS/NLCD_RELEASES/2019_REL/NLCD"
+
+
+def transition_image(from_img, to_img):
+    """Encode a pair of classified images into a single transition band."""
+    return (
+        from_img.toInt()
+        .multiply(TRANSITION_BASE)
+        .add(to_img.toInt())
+        .rename("transition")
+    )
+
+
+@st.cache_data(show_spinner=False)
+def transition_matrix(aoi_key, level, _from_img, _to_img, _geometry, scale=100):
+    """
+    Full from/to transition table for an AOI in a single reduction.
+
+    The pixel area is grouped by the encoded transition code, so all class
+    pairs come back from one reduceRegion call. ``aoi_key`` and ``level`` form
+    the cache key; the underscored EE arguments are not hashed.
+    """
+    codes = transition_image(_from_img, _to_img)
+    reducer = (
+        ee.Reducer.sum()
+        .combine(ee.Reducer.count(), sharedInputs=True)
+        .group(groupField=1, groupName="transition")
+    )
+    stats = cached_info(
+        ee.Image.pixelArea()
+        .addBands(codes)
+        .reduceRegion(
+            reducer=reducer,
+            geometry=_geometry,
+            scale=scale,
+            maxPixels=1e13,
+        )
+    )
+
+    rows = []
+    for group in stats.get("groups", []):
+        code = int(group["transition"])
+        rows.append(
+            {
+                "from": code // TRANSITION_BASE,
+                "to": code % TRANSITION_BASE,
+                "pixels": int(group["count"]),
+                "area_ha": group["sum"] / 10000,
+            }
+        )
+    return pd.DataFrame(rows, columns=["from", "to", "pixels", "area_ha"])
+
+
+def transition_sankey(df, labels, from_year, to_year, colors=None):
+    """Sankey chart of a transition table produced by transition_matrix()."""
+    classes = sorted(set(df["from"]) | set(df["to"]))
+    index = {c: i for i, c in enumerate(classes)}
+    node_labels = [f"{from_year}: {labels.get(c, c)}" for c in classes] + [
+        f"{to_year}: {labels.get(c, c)}" for c in classes
+    ]
+    node_colors = None
+    if colors:
+        node_colors = [colors.get(c, "#999999") for c in classes] * 2
+
+    fig = go.Figure(
+        go.Sankey(
+            node=dict(label=node_labels, color=node_colors, pad=12, thickness=14),
+            link=dict(
+                source=[index[c] for c in df["from"]],
+                target=[index[c] + len(classes) for c in df["to"]],
+                value=df["area_ha"].tolist(),
+            ),
+        )
+    )
+    fig.update_layout(title=f"Land cover flows {from_year} → {to_year} (ha)")
+    return fig
+
+
+# ---------------------- Dynamic World composites ----------------------
+
+
+def month_bucket(start, end):
+    """Snap a date range outward to whole months so sessions share composites."""
+    start = start.replace(day=1)
+    if end.day != 1:
+        days = calendar.monthrange(end.year, end.month)[1]
+        end = end.replace(day=1) + datetime.timedelta(days=days)
+    return start, end
+
+
+def _is_single_month(start, end):
+    return (
+        start.day == 1
+        and (end - start).days == calendar.monthrange(start.year, start.month)[1]
+    )
+
+
+def dynamic_world_image(
+    region_name, start, end, return_type="hillshade", start_export=False
+):
+    """
+    Dynamic World composite over a configured case-study region.
+
+    Single-month composites precomputed with ``python utils_landcover.py``
+    are served from their assets; other ranges are computed on the fly.
+    ``start_export`` starts the export of a missing single-month asset.
+    """
+    region = ee.Geometry.BBox(*REGIONS[region_name])
+    image = geemap.dynamic_world(
+        region, start.isoformat(), end.isoformat(), clip=True, return_type=return_type
+    )
+    if _is_single_month(start, end):
+        image = materialize(
+            image,
+            f"dw_{return_type}_{region_name}_{start:%Y_%m}",
+            region,
+            start=start_export,
+            scale=10,
+        )
+    return image
+
+
+@st.cache_data(ttl=DW_TILE_TTL, show_spinner=False)
+def dynamic_world_tiles(region_name, start, end, return_type="hillshade"):
+    """Tile URL of a Dynamic World composite, cached per region and month range."""
+    image = dynamic_world_image(region_name, start, end, return_type)
+    return image.getMapId({})["tile_fetcher"].url_format
+
+
+def dynamic_world_layer(region_name, start, end, return_type="hillshade"):
+    """Folium tile layer for a month-snapped Dynamic World composite."""
+    start, end = month_bucket(start, end)
+    return folium.raster_layers.TileLayer(
+        tiles=dynamic_world_tiles(region_name, start, end, return_type),
+        attr="Google Earth Engine",
+        name="Dynamic World Land Cover",
+        overlay=True,
+        control=True,
+    )
+
+
+# ---------------------- NLCD time series ----------------------
+
+
+@st.cache_data(ttl=DW_TILE_TTL, show_spinner=False)
+def nlcd_tiles():
+    """
+    Tile URL of every NLCD epoch, as ``{year: url}``.
+
+    The epochs come from one query on the collection; the map ids are then
+    generated once and shared by all sessions until they are refreshed.
+    """
+    collection = ee.ImageCollection(NLCD_COLLECTION)
+    years = collection.aggregate_array("system:index").getInfo()
+    tiles = {}
+    for year in sorted(y for y in years if y.isdigit()):
+        image = collection.filter(ee.Filter.eq("system:index", year)).first()
+        tiles[year] = (
+            ee.Image(image).select("landcover").getMapId({})["tile_fetcher"].url_format
+        )
+    return tiles
+
+
+def nlcd_layers(years=None, visible=None):
+    """
+    Folium tile layers of NLCD epochs (all by default) from the cached URLs.
+
+    With ``visible`` only that year starts on the map and the layers are left
+    out of the layer control, for switching with add_time_slider().
+    """
+    tiles = nlcd_tiles()
+    return [
+        folium.raster_layers.TileLayer(
+            tiles=tiles[year],
+            attr="Google Earth Engine",
+            name=f"NLCD {year}",
+            overlay=True,
+            control=visible is None,
+            show=visible is None or year == visible,
+        )
+        for year in (tiles if years is None else years)
+    ]
+
+
+def precompute_monthly_composites(region_name, year, return_type="hillshade"):
+    """Start (or check) the monthly composite exports for one region and year."""
+    for month in range(1, 13):
+        start = datetime.date(year, month, 1)
+        start, end = month_bucket(start, start + datetime.timedelta(days=1))
+        dynamic_world_image(region_name, start, end, return_type, start_export=True)
+
+
+if __name__ == "__main__":
+    from utils_ee import initialize_earth_engine
+
+    parser = argparse.ArgumentParser(
+        description="Precompute monthly Dynamic World composites."
+    )
+    parser.add_argument("region", choices=sorted(REGIONS))
+    parser.add_argument("year", type=int)
+    args = parser.parse_args()
+
+    initialize_earth_engine()
+    precompute_monthly_composites(args.region, args.year)
@@ -0,0 +1,300 @@
+import argparse
+import math
+
+import ee
+import folium
+import streamlit as st
+from branca.element import MacroElement
+from jinja2 import Template
+from streamlit_folium import st_folium
+
+from utils_ee import expression_hash
+from utils_materialize import materialize
+
+# Below this zoom buildings are drawn as a density surface instead of footprints
+FOOTPRINT_MIN_ZOOM = 14
+# Below this zoom only primary roads (GRIP4 type 1-3) are drawn
+ROADS_DETAIL_ZOOM = 12
+
+# Screen pixels per density cell, so cells keep the same on-screen size
+DENSITY_CELL_PX = 8
+# Cell sizes (m) of the pre-aggregated building density pyramid
+DENSITY_LEVELS = [100, 500, 2000]
+
+BUILDING_STYLE = {"color": "FF5500", "fillColor": "00000000", "width": 1}
+ROAD_STYLE = {"color": "FF5500", "width": 1}
+
+# Viewport layers are built for the view snapped outward to a grid this many
+# tiles wide, so pans inside a grid cell reuse the same tile URL
+VIEW_GRID_TILES = 8
+# Earth Engine map ids stay valid for hours; reuse them for this long
+TILE_TTL = 6 * 3600
+
+# Density surfaces are shown as buildings per hectare, whatever the cell size
+DENSITY_VIS = {
+    "min": 0,
+    "max": 30,
+    "palette": ["#ffffb2", "#fecc5c", "#fd8d3c", "#f03b20", "#bd0026"],
+}
+
+
+def _parse_view(output):
+    bounds = (output or {}).get("bounds") or {}
+    south_west, north_east = bounds.get("_southWest"), bounds.get("_northEast")
+    if not (south_west and north_east) or output.get("zoom") is None:
+        return None
+    return (
+        (south_west["lng"], south_west["lat"], north_east["lng"], north_east["lat"]),
+        output["zoom"],
+    )
+
+
+def map_view(key):
+    """
+    Bounds ``(west, south, east, north)`` and zoom the user is looking at.
+
+    streamlit-folium stores the last reported view under the map's widget key
+    before the rerun starts, so layers can be built for the current viewport.
+    Returns None before the map has reported anything.
+    """
+    return _parse_view(st.session_state.get(key))
+
+
+class TimeSlider(MacroElement):
+    """Leaflet control with a range input that shows one of several layers."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var map = {{ this._parent.get_name() }};
+            var layers = [{% for layer in this.layers %}{{ layer.get_name() }},{% endfor %}];
+            var labels = {{ this.labels|tojson }};
+            var control = L.control({position: "{{ this.position }}"});
+            control.onAdd = function () {
+                var div = L.DomUtil.create("div", "leaflet-bar");
+                div.style.cssText = "background: white; padding: 6px 10px;";
+                div.innerHTML = "<b>{{ this.title }}</b> <span></span><br>"
+                    + "<input type='range' min='0' step='1' style='width: 220px'>";
+                L.DomEvent.disableClickPropagation(div);
+                L.DomEvent.disableScrollPropagation(div);
+                var label = div.querySelector("span");
+                var slider = div.querySelector("input");
+                slider.max = layers.length - 1;
+                slider.value = {{ this.start }};
+                function show(i) {
+                    layers.forEach(function (layer, j) {
+                        if (j === i) { map.addLayer(layer); } else { map.removeLayer(layer); }
+                    });
+                    label.textContent = labels[i];
+                }
+                slider.addEventListener("input", function () { show(+this.value); });
+                show({{ this.start }});
+                return div;
+            };
+            control.addTo(map);
+        })();
+        {% endmacro %}
+        """)
+
+    def __init__(self, layers, labels, title="", start=-1, position="bottomleft"):
+        if not layers:
+            raise ValueError("TimeSlider needs at least one layer")
+        super().__init__()
+        self._name = "TimeSlider"
+        self.layers = layers
+        self.labels = [str(label) for label in labels]
+        self.title = title
+        self.start = start % len(layers)
+        self.position = position
+
+
+def add_time_slider(Map, layers, labels, title="", start=-1):
+    """
+    Add tile layers with a slider that switches between them in the browser.
+
+    Switching needs no rerun and no Earth Engine call: every layer already
+    has its tile URL, only the tiles of the shown layer are fetched. Without
+    layers the map is returned unchanged.
+    """
+    if not layers:
+        return Map
+    for layer in layers:
+        layer.add_to(Map)
+    Map.add_child(TimeSlider(layers, labels, title, start))
+    return Map
+
+
+def render_map(Map, key, height=600):
+    """
+    Render a map with streamlit-folium, rerunning only on bounds/zoom changes.
+
+    Every pan or zoom still reruns the script (or the fragment holding the
+    map), but layers from cached_tile_layer() and the viewport layers below
+    make no Earth Engine call until the view leaves its snapped grid cell or
+    crosses a zoom threshold.
+    """
+    return st_folium(
+        Map,
+        key=key,
+        height=height,
+        use_container_width=True,
+        returned_objects=["bounds", "zoom"],
+    )
+
+
+def view_center(bounds):
+    """Centre ``(lon, lat)`` of a bounds tuple."""
+    west, south, east, north = bounds
+    return (west + east) / 2, (south + north) / 2
+
+
+def fit_zoom(bounds, width_px=800, min_zoom=2, max_zoom=18):
+    """Web Mercator zoom level at which a bounds tuple fits ``width_px`` pixels."""
+    west, south, east, north = bounds
+    span = max(east - west, north - south, 1e-6)
+    zoom = math.floor(math.log2(width_px * 360 / (256 * span)))
+    return max(min_zoom, min(max_zoom, zoom))
+
+
+def snap_bounds(bounds, zoom):
+    """Bounds grown outward to a grid VIEW_GRID_TILES tiles wide at ``zoom``."""
+    step = 360 / 2**zoom * VIEW_GRID_TILES
+    west, south, east, north = bounds
+    return (
+        round(math.floor(west / step) * step, 6),
+        round(max(-90, math.floor(south / step) * step), 6),
+        round(math.ceil(east / step) * step, 6),
+        round(min(90, math.ceil(north / step) * step), 6),
+    )
+
+
+@st.cache_data(ttl=TILE_TTL, show_spinner=False)
+def tile_url(image_key, _image, vis_params):
+    """Tile URL of an image; ``image_key`` identifies the unhashed image."""
+    return _image.getMapId(vis_params)["tile_fetcher"].url_format
+
+
+def cached_tile_layer(image, vis_params, name):
+    """
+    Folium tile layer of an EE image, with its map id shared by reruns and
+    sessions as long as the expression graph is the same.
+    """
+    return folium.raster_layers.TileLayer(
+        tiles=tile_url(expression_hash(image), image, vis_params or {}),
+        attr="Google Earth Engine",
+        name=name,
+        overlay=True,
+        control=True,
+    )
+
+
+def density_scale(zoom):
+    """Ground size in metres of a density cell at a Web Mercator zoom level."""
+    return 156543.03 / 2**zoom * DENSITY_CELL_PX
+
+
+def pyramid_scale(zoom):
+    """Pyramid cell size closest to the on-screen cell size at a zoom level."""
+    target = density_scale(zoom)
+    return min(DENSITY_LEVELS, key=lambda scale: abs(math.log(scale / target)))
+
+
+def building_density(fc, scale):
+    """Building count per cell, from footprint centroids."""
+
+    def to_centroid(feature):
+        return ee.Feature(feature.geometry().centroid(1), {"count": 1})
+
+    return (
+        fc.map(to_centroid)
+        .reduceToImage(["count"], ee.Reducer.sum())
+        .rename("count")
+        .reproject("EPSG:3857", None, scale)
+    )
+
+
+def density_pyramid(fc, name, region, zoom):
+    """
+    Buildings per hectare from the pyramid level that suits a zoom level.
+
+    A level is read from its asset when ``python utils_layers.py`` exported
+    it, and computed on the fly otherwise; page renders never start exports.
+    """
+    scale = pyramid_scale(zoom)
+    image = materialize(building_density(fc, scale), f"{name}_density_{scale}m", region)
+    # Mercator cells shrink on the ground by cos²(latitude): divide by their
+    # true area rather than scale², or densities read low away from the equator
+    hectares = ee.Image.pixelArea().reproject("EPSG:3857", None, scale).divide(10000)
+    return image.select("count").divide(hectares).selfMask()
+
+
+def build_density_pyramid(fc, name, region):
+    """Start (or check) the exports of every pyramid level for a collection."""
+    for scale in DENSITY_LEVELS:
+        materialize(
+            building_density(fc, scale),
+            f"{name}_density_{scale}m",
+            region,
+            start=True,
+            crs="EPSG:3857",
+            scale=scale,
+        )
+
+
+def buildings_layer(
+    fc, bounds, zoom, name, region, style=None, layer_name="Buildings (Microsoft)"
+):
+    """
+    Footprints inside the viewport, or the density pyramid when zoomed out.
+
+    ``name`` and ``region`` identify the collection's density pyramid.
+    """
+    if zoom >= FOOTPRINT_MIN_ZOOM:
+        # one grid for all footprint zooms, so zooming in reuses the layer
+        bbox = ee.Geometry.BBox(*snap_bounds(bounds, FOOTPRINT_MIN_ZOOM))
+        visible = fc.filterBounds(bbox)
+        return cached_tile_layer(
+            visible.style(**(style or BUILDING_STYLE)), {}, layer_name
+        )
+    density = density_pyramid(fc, name, region, zoom)
+    return cached_tile_layer(density, DENSITY_VIS, f"{layer_name} density")
+
+
+def roads_layer(fc, bounds, zoom, name="Roads (GRIP4)"):
+    """GRIP4 roads inside the viewport, primary roads only when zoomed out."""
+    snap_zoom = min(zoom, ROADS_DETAIL_ZOOM)
+    visible = fc.filterBounds(ee.Geometry.BBox(*snap_bounds(bounds, snap_zoom)))
+    if zoom < ROADS_DETAIL_ZOOM:
+        visible = visible.filter(ee.Filter.lte("GP_RTP", 3))
+    return cached_tile_layer(visible.style(**ROAD_STYLE), {}, name)
+
+
+if __name__ == "__main__":
+    from utils_countries import (
+        MSBUILDINGS_ROOT,
+        load_country_index,
+        region_bbox,
+        region_info,
+    )
+    from utils_ee import initialize_earth_engine
+
+    parser = argparse.ArgumentParser(
+        description="Build the Microsoft Buildings density pyramid for a country."
+    )
+    parser.add_argument("country", help="MSBuildings collection name, e.g. Croatia")
+    parser.add_argument(
+        "--state", help="US state, with country USA (MSBuildings/US/<state>)"
+    )
+    args = parser.parse_args()
+
+    initialize_earth_engine()
+    index = load_country_index()
+    if args.state:
+        fc = ee.FeatureCollection(f"{MSBUILDINGS_ROOT}/US/{args.state}")
+        info = region_info(index, args.state, level="state")
+        name = f"msb_US_{args.state}"
+    else:
+        fc = ee.FeatureCollection(f"{MSBUILDINGS_ROOT}/{args.country}")
+        info = region_info(index, args.country)
+        name = f"msb_{args.country}"
+    build_density_pyramid(fc, name, ee.Geometry.BBox(*region_bbox(info)))
@@ -0,0 +1,185 @@
+import contextlib
+import json
+import threading
+import time
+
+import ee
+
+try:
+    import fcntl
+except ImportError:  # Windows: starts are coordinated within the process only
+    fcntl = None
+
+from config import CACHE_PATH, MATERIALIZE_ROOT
+from utils_ee import expression_hash
+from utils_metrics import count_cache
+
+REGISTRY_PATH = CACHE_PATH / "materialized.json"
+
+# Seconds between task status checks for an export that is still running
+POLL_INTERVAL = 60
+
+# A failed export is retried after RETRY_BACKOFF seconds, doubling with every
+# attempt, and given up after MAX_ATTEMPTS (quota, bad region, ...)
+RETRY_BACKOFF = 15 * 60
+MAX_ATTEMPTS = 3
+
+_lock = threading.Lock()
+_checked = {}
+
+
+def _load_registry():
+    if REGISTRY_PATH.exists():
+        try:
+            return json.loads(REGISTRY_PATH.read_text())
+        except ValueError:
+            return {}
+    return {}
+
+
+@contextlib.contextmanager
+def _registry_lock():
+    """Exclusive lock so server processes do not start the same export twice."""
+    if fcntl is None:
+        yield
+        return
+    with open(REGISTRY_PATH.with_suffix(".lock"), "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _save_registry(registry):
+    tmp = REGISTRY_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(registry, indent=2))
+    tmp.replace(REGISTRY_PATH)
+
+
+def _asset_exists(asset_id):
+    try:
+        ee.data.getAsset(asset_id)
+        return True
+    except ee.EEException:
+        return False
+
+
+def asset_id_for(image, name):
+    """Asset id that a derived image is (or will be) materialized to."""
+    return f"{MATERIALIZE_ROOT}/{name}_{expression_hash(image)[:16]}"
+
+
+def _refresh(asset_id, registry):
+    entry = registry.get(asset_id)
+    if entry is None or entry["state"] in ("FAILED", "CANCELLED"):
+        # another process (or an earlier retry) may have written the asset
+        if _asset_exists(asset_id):
+            registry[asset_id] = {**(entry or {}), "state": "COMPLETED"}
+        return
+    if entry["state"] in ("READY", "RUNNING") and entry.get("task_id"):
+        status = ee.data.getTaskStatus(entry["task_id"])[0]
+        entry["state"] = status["state"]
+        if status["state"] == "FAILED":
+            entry["error"] = status.get("error_message")
+
+
+def _should_start(entry, now):
+    """Whether to (re)start the export of a registry entry."""
+    if entry is None:
+        return True
+    if entry["state"] not in ("FAILED", "CANCELLED"):
+        return False
+    attempts = entry.get("attempts", 1)
+    backoff = RETRY_BACKOFF * 2 ** (attempts - 1)
+    return attempts < MAX_ATTEMPTS and now - entry.get("started", 0) >= backoff
+
+
+def _grid_args(crs, scale):
+    """Export arguments for an output grid given as EE objects or plain values."""
+    args = {}
+    if crs is not None:
+        args["crs"] = crs.getInfo()["crs"] if isinstance(crs, ee.Projection) else crs
+    if scale is not None:
+        args["scale"] = (
+            ee.Number(scale).getInfo()
+            if isinstance(scale, ee.ComputedObject)
+            else scale
+        )
+    return args
+
+
+def materialize(
+    image,
+    name,
+    region,
+    pyramiding="mean",
+    start=False,
+    crs=None,
+    scale=None,
+    **export_args,
+):
+    """
+    Substitute a derived image by its exported asset once that exists.
+
+    The asset is named by a hash of the image's expression graph, so any change
+    to the recipe yields a new asset. Calls check the asset (at most once per
+    ``POLL_INTERVAL``) and return ``ee.Image(asset_id)`` once it exists, else
+    the original image. Only with ``start`` (maintenance scripts, never page
+    reruns) is a missing asset exported on the grid given by ``crs`` (a CRS
+    string or ee.Projection) and ``scale``; failed exports are then retried
+    with a growing backoff, at most MAX_ATTEMPTS times. Extra keyword
+    arguments are passed to ``Export.image.toAsset``.
+    """
+    asset_id = asset_id_for(image, name)
+
+    with _lock:
+        now = time.time()
+        if _checked.get(asset_id) == "COMPLETED":
+            count_cache("materialized", True)
+            return ee.Image(asset_id)
+        if now - _checked.get(f"{asset_id}@", 0) < POLL_INTERVAL:
+            count_cache("materialized", False)
+            return image
+        _checked[f"{asset_id}@"] = now
+
+        with _registry_lock():
+            registry = _load_registry()
+            try:
+                _refresh(asset_id, registry)
+            except ee.EEException:
+                return image
+
+            entry = registry.get(asset_id)
+            if start and _should_start(entry, now):
+                try:
+                    task = ee.batch.Export.image.toAsset(
+                        image=image,
+                        description=f"materialize_{name}"[:100],
+                        assetId=asset_id,
+                        region=region,
+                        maxPixels=1e13,
+                        pyramidingPolicy={".default": pyramiding},
+                        **_grid_args(crs, scale),
+                        **export_args,
+                    )
+                    task.start()
+                except ee.EEException:
+                    return image
+                entry = {
+                    "state": "READY",
+                    "task_id": task.id,
+                    "name": name,
+                    "attempts": (entry or {}).get("attempts", 0) + 1,
+                    "started": now,
+                }
+                registry[asset_id] = entry
+
+            _save_registry(registry)
+        state = entry["state"] if entry else None
+        _checked[asset_id] = state
+
+    count_cache("materialized", state == "COMPLETED")
+    if state == "COMPLETED":
+        return ee.Image(asset_id)
+    return image
@@ -0,0 +1,305 @@
+"""
+Operational metrics in the Prometheus text format.
+
+Counters and histograms live in the Streamlit server process and are served
+on ``/metrics`` from a small HTTP server on a daemon thread (``METRICS_PORT``).
+Start the app through ``python serve.py`` to install the hooks and the server.
+"""
+
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Sessions that reran within this many seconds count as active
+ACTIVE_WINDOW = 300
+
+# Streamlit releases whose private script runner install() was checked against;
+# on others page renders are not timed
+TIMED_STREAMLIT_VERSIONS = ((1, 66),)
+
+# Histogram buckets (s) for page renders and remote calls
+RENDER_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CALL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.RLock()
+_metrics = []
+_sessions = {}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=CALL_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with _lock:
+            counts, total, n = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(counts):
+                counts[i] += 1
+            self.values[key] = (counts, total + value, n + 1)
+
+    def samples(self):
+        names = self.labelnames + ("le",)
+        for key, (counts, total, n) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {n}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {n}"
+
+
+class Gauge:
+    """Value computed when the metrics are scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), collect=None):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self.collect = collect
+        _metrics.append(self)
+
+    def samples(self):
+        for key, value in sorted(self.collect().items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {value}"
+
+
+# ---------------------- Metrics ----------------------
+
+page_renders = Counter(
+    "app_page_renders_total", "Script runs per page and outcome.", ["page", "outcome"]
+)
+page_render_seconds = Histogram(
+    "app_page_render_seconds",
+    "Script run duration per page.",
+    ["page"],
+    buckets=RENDER_BUCKETS,
+)
+ee_calls = Counter(
+    "app_ee_calls_total",
+    "Earth Engine round trips per call and outcome.",
+    ["call", "outcome"],
+)
+ee_call_seconds = Histogram(
+    "app_ee_call_seconds", "Earth Engine round-trip latency per call.", ["call"]
+)
+cache_requests = Counter(
+    "app_cache_requests_total",
+    "Cache lookups per cache and result.",
+    ["cache", "result"],
+)
+llm_calls = Counter(
+    "app_llm_calls_total",
+    "Chat completion requests per model, provider and outcome.",
+    ["model", "provider", "outcome"],
+)
+llm_first_token_seconds = Histogram(
+    "app_llm_first_token_seconds",
+    "Time to the first streamed token per model.",
+    ["model"],
+)
+llm_call_seconds = Histogram(
+    "app_llm_call_seconds", "Chat completion duration per model.", ["model"]
+)
+
+
+def _cache_hit_ratio():
+    totals, hits = {}, {}
+    for (cache, result), n in list(cache_requests.values.items()):
+        totals[cache] = totals.get(cache, 0) + n
+        if result == "hit":
+            hits[cache] = hits.get(cache, 0) + n
+    return {(cache,): hits.get(cache, 0) / n for cache, n in totals.items() if n}
+
+
+def _active_sessions():
+    now = time.time()
+    with _lock:
+        for session, seen in list(_sessions.items()):
+            if now - seen > ACTIVE_WINDOW:
+                del _sessions[session]
+        return {(): len(_sessions)}
+
+
+Gauge(
+    "app_cache_hit_ratio",
+    "Share of cache lookups answered from the cache.",
+    ["cache"],
+    _cache_hit_ratio,
+)
+Gauge(
+    "app_active_sessions",
+    f"Sessions with a script run in the last {ACTIVE_WINDOW} s.",
+    collect=_active_sessions,
+)
+
+
+def count_cache(cache, hit):
+    """Record one lookup of a named cache."""
+    cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def session_seen(session_id):
+    """Mark a session as active."""
+    with _lock:
+        _sessions[session_id] = time.time()
+
+
+def count_llm_call(model, provider, ttft=None, total=None, ok=True):
+    """Record one chat completion request."""
+    llm_calls.inc(model=model, provider=provider, outcome="ok" if ok else "error")
+    if ok and ttft is not None:
+        llm_first_token_seconds.observe(ttft, model=model)
+    if ok and total is not None:
+        llm_call_seconds.observe(total, model=model)
+
+
+def _count_ee_call(record):
+    ee_calls.inc(call=record["call"], outcome="error" if record["error"] else "ok")
+    ee_call_seconds.observe(record["latency"], call=record["call"])
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for metric in _metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------- Hooks ----------------------
+
+
+def _page_name(ctx):
+    try:
+        page = ctx.pages_manager.get_pages()[ctx.pages_manager.current_page_script_hash]
+        return page["page_name"] or Path(page["script_path"]).stem
+    except (AttributeError, KeyError):
+        return Path(ctx.main_script_path).stem
+
+
+def _timed_run(func):
+    def run(script, ctx):
+        started = time.perf_counter()
+        result = func(script, ctx)
+        # (value, run_without_errors, rerun, stopped, error) in Streamlit 1.66
+        if not (isinstance(result, tuple) and len(result) == 5):
+            return result
+        _, _, rerun, stopped, error = result
+        page = _page_name(ctx)
+        outcome = (
+            "error" if error else "rerun" if rerun else "stopped" if stopped else "ok"
+        )
+        page_renders.inc(page=page, outcome=outcome)
+        page_render_seconds.observe(time.perf_counter() - started, page=page)
+        session_seen(ctx.session_id)
+        return result
+
+    return run
+
+
+def _timing_supported(script_runner):
+    import streamlit
+
+    version = tuple(int(part) for part in streamlit.__version__.split(".")[:2])
+    return version in TIMED_STREAMLIT_VERSIONS and callable(
+        getattr(script_runner, "exec_func_with_error_handling", None)
+    )
+
+
+def install():
+    """
+    Time every script run and count Earth Engine calls.
+
+    Script runs are timed by wrapping Streamlit's private script execution
+    function, only on the TIMED_STREAMLIT_VERSIONS it was checked against;
+    Earth Engine calls are counted through the utils_trace wrappers. Returns
+    whether script runs are timed.
+    """
+    from streamlit.runtime.scriptrunner import script_runner
+
+    import utils_trace
+
+    timed = _timing_supported(script_runner)
+    if timed and not getattr(
+        script_runner.exec_func_with_error_handling, "timed", False
+    ):
+        run = _timed_run(script_runner.exec_func_with_error_handling)
+        run.timed = True
+        script_runner.exec_func_with_error_handling = run
+    utils_trace.add_listener(_count_ee_call)
+    utils_trace.install()
+    return timed
+
+
+# ---------------------- Server ----------------------
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(port, host="127.0.0.1"):
+    """
+    Serve ``/metrics`` on a daemon thread; returns the server. Listens on
+    loopback unless another ``host`` is passed.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
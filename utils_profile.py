@@ -0,0 +1,190 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+from collections import Counter
+
+import ee
+from ee import serializer
+
+# ee.data entry points that send an expression to the server, and where the
+# expression sits in their arguments.
+SERVER_CALLS = {
+    "computeValue": lambda args: args[0],
+    "getMapId": lambda args: args[0].get("image"),
+    "getDownloadId": lambda args: args[0].get("image"),
+    "getThumbId": lambda args: args[0].get("image"),
+}
+
+# Minimum number of nested calls for a repeated subtree to be worth reporting
+MIN_REPEAT_SIZE = 3
+
+
+def _invocations(node):
+    """Yield every functionInvocationValue in an expanded expression tree."""
+    if isinstance(node, dict):
+        if "functionInvocationValue" in node:
+            yield node["functionInvocationValue"]
+        for value in node.values():
+            yield from _invocations(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _invocations(value)
+
+
+def _calls(node):
+    return [call["functionName"] for call in _invocations(node)]
+
+
+def _numbers(node):
+    if isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield node
+    elif isinstance(node, dict):
+        for value in node.values():
+            yield from _numbers(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _numbers(value)
+
+
+# ---------------------- Lint rules ----------------------
+
+
+def _double_clip(call):
+    if call["functionName"] == "Image.clip":
+        if "Image.clip" in _calls(call["arguments"].get("input")):
+            return "clip() applied to an image that is already clipped"
+
+
+def _reproject(call):
+    if call["functionName"] == "Image.reproject":
+        if any("reduceToImage" in name for name in _calls(call["arguments"])):
+            return "reproject() after reduceToImage forces a full rasterization per request"
+        return "reproject() pins the computation scale; let the output drive it where possible"
+
+
+def _global_geometry(call):
+    if call["functionName"].startswith("GeometryConstructors."):
+        coords = list(_numbers(call["arguments"]))
+        xs, ys = coords[0::2], coords[1::2]
+        if xs and ys and (max(xs) - min(xs) >= 180 or max(ys) - min(ys) >= 90):
+            return f"near-global {call['functionName'].split('.')[-1]} region"
+
+
+def _unfiltered_style(call):
+    if call["functionName"].endswith(".style"):
+        names = _calls(call["arguments"])
+        if not any("filter" in name.lower() for name in names):
+            return "style() on an unfiltered collection renders every feature"
+
+
+RULES = [_double_clip, _reproject, _global_geometry, _unfiltered_style]
+
+
+def graph_report(obj):
+    """
+    Size, repeated subexpressions and lint findings for one EE object.
+
+    The expanded (non-compound) encoding is walked so shared subtrees show up
+    as repeats; the compact encoding gives the size actually sent.
+    """
+    tree = serializer.encode(obj, is_compound=False)
+    compact = obj.serialize()
+
+    calls = list(_invocations(tree))
+    repeats = Counter()
+    names = {}
+    for call in calls:
+        if len(_calls(call["arguments"])) + 1 < MIN_REPEAT_SIZE:
+            continue
+        key = hashlib.sha1(json.dumps(call, sort_keys=True).encode()).hexdigest()
+        repeats[key] += 1
+        names[key] = call["functionName"]
+
+    findings = []
+    for call in calls:
+        for rule in RULES:
+            message = rule(call)
+            if message and message not in findings:
+                findings.append(message)
+
+    return {
+        "hash": hashlib.sha1(compact.encode()).hexdigest()[:12],
+        "bytes": len(compact),
+        "nodes": len(calls),
+        "functions": Counter(call["functionName"] for call in calls).most_common(5),
+        "repeated": [(names[k], n) for k, n in repeats.most_common() if n > 1],
+        "findings": findings,
+    }
+
+
+@contextlib.contextmanager
+def capture(profile=False):
+    """
+    Record the expressions of every server call made inside the block.
+
+    Yields a list of ``(call, ee_object)`` tuples that fills as calls happen.
+    With ``profile=True`` the Earth Engine server profile for the block is
+    appended as ``("profile", text)`` when the block exits.
+    """
+    captured = []
+    originals = {name: getattr(ee.data, name) for name in SERVER_CALLS}
+
+    def wrap(name, func):
+        def wrapper(*args, **kwargs):
+            expr = SERVER_CALLS[name](args) if args else None
+            if isinstance(expr, ee.ComputedObject):
+                captured.append((name, expr))
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    for name, func in originals.items():
+        setattr(ee.data, name, wrap(name, func))
+    buffer = io.StringIO()
+    try:
+        with ee.profilePrinting(buffer) if profile else contextlib.nullcontext():
+            yield captured
+    finally:
+        for name, func in originals.items():
+            setattr(ee.data, name, func)
+        if profile:
+            captured.append(("profile", buffer.getvalue()))
+
+
+def print_report(captured):
+    """Print graph reports for captured calls, largest graphs first."""
+    reports = [
+        (name, graph_report(expr)) for name, expr in captured if name != "profile"
+    ]
+    reports.sort(key=lambda item: item[1]["bytes"], reverse=True)
+    print(f"{len(reports)} server calls")
+    for name, report in reports:
+        print(
+            f"\n{name:14} {report['hash']}  {report['nodes']} nodes  {report['bytes']:,} bytes"
+        )
+        print(f"  top functions: {report['functions']}")
+        for func, count in report["repeated"]:
+            print(f"  repeated: {func} x{count}")
+        for finding in report["findings"]:
+            print(f"  ! {finding}")
+    for name, text in captured:
+        if name == "profile":
+            print("\nServer profile\n" + text)
+
+
+if __name__ == "__main__":
+    from streamlit.testing.v1 import AppTest
+
+    parser = argparse.ArgumentParser(
+        description="Lint and profile the Earth Engine graphs a page builds."
+    )
+    parser.add_argument("page", help="path to a page script, e.g. pages/3_...py")
+    parser.add_argument("--profile", action="store_true", help="fetch server profiles")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    with capture(profile=args.profile) as captured:
+        AppTest.from_file(args.page, default_timeout=args.timeout).run()
+    print_report(captured)
@@ -0,0 +1,182 @@
+import contextlib
+import itertools
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: limits are shared within the process only
+    fcntl = None
+
+# Waiters that stopped polling (closed tab, stopped script) leave the queue
+HEARTBEAT_TIMEOUT = 10
+# Longest sleep between queue checks, so the wait estimate stays fresh
+POLL_INTERVAL = 0.5
+
+
+class QuotaExceeded(Exception):
+    """The client used up its calls for the current window."""
+
+
+class RateLimiter:
+    """
+    Token bucket with per-client quotas and a first-come-first-served queue.
+
+    ``rate`` calls per second are admitted on average, bursts up to ``burst``.
+    Each client (IP address or session) gets ``client_quota`` calls per
+    ``client_window`` seconds, and the key as a whole ``daily_quota`` per day.
+    Callers that find the bucket empty wait their turn instead of failing.
+
+    State is kept in memory, or with ``path`` in a JSON file guarded by an
+    exclusive file lock so every worker process shares the same budget.
+    """
+
+    def __init__(
+        self,
+        rate,
+        burst,
+        client_quota,
+        client_window=24 * 3600,
+        daily_quota=None,
+        path=None,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.client_quota = client_quota
+        self.client_window = client_window
+        self.daily_quota = daily_quota
+        self.path = path if fcntl else None
+        self._lock = threading.Lock()
+        self._memory = None
+        self._tickets = itertools.count()
+
+    # ---------------------- State ----------------------
+
+    def _empty(self):
+        return {
+            "tokens": self.burst,
+            "updated": time.time(),
+            "blocked_until": 0,
+            "queue": [],
+            "clients": {},
+            "day": [],
+        }
+
+    @contextlib.contextmanager
+    def _state(self):
+        with self._lock:
+            if self.path is None:
+                if self._memory is None:
+                    self._memory = self._empty()
+                yield self._memory
+                return
+            with open(self.path, "a+") as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    handle.seek(0)
+                    try:
+                        state = json.loads(handle.read())
+                    except ValueError:  # new or unreadable file: start afresh
+                        state = self._empty()
+                    try:
+                        yield state
+                    finally:
+                        text = json.dumps(state)
+                        handle.seek(0)
+                        handle.truncate()
+                        handle.write(text)
+                        handle.flush()
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _refill(self, state, now):
+        elapsed = max(0, now - state["updated"])
+        state["tokens"] = min(self.burst, state["tokens"] + elapsed * self.rate)
+        state["updated"] = now
+        state["queue"] = [
+            w for w in state["queue"] if now - w["heartbeat"] < HEARTBEAT_TIMEOUT
+        ]
+        for client, calls in list(state["clients"].items()):
+            calls = [t for t in calls if now - t < self.client_window]
+            if calls:
+                state["clients"][client] = calls
+            else:
+                del state["clients"][client]
+        state["day"] = [t for t in state["day"] if now - t < 24 * 3600]
+
+    def _eta(self, state, position, now):
+        """Seconds until the waiter at ``position`` (0 = head) gets a token."""
+        missing = position + 1 - state["tokens"]
+        blocked = max(0, state["blocked_until"] - now)
+        return max(blocked, missing / self.rate if missing > 0 else 0)
+
+    # ---------------------- Public ----------------------
+
+    def remaining(self, client):
+        """Calls the client has left in its current window."""
+        client = str(client)
+        with self._state() as state:
+            self._refill(state, time.time())
+            return max(0, self.client_quota - len(state["clients"].get(client, [])))
+
+    def wait_estimate(self):
+        """Seconds a new request would wait for its turn."""
+        with self._state() as state:
+            now = time.time()
+            self._refill(state, now)
+            return self._eta(state, len(state["queue"]), now)
+
+    def backoff(self, seconds):
+        """Hold all calls for ``seconds``, e.g. after a provider 429."""
+        with self._state() as state:
+            state["blocked_until"] = max(state["blocked_until"], time.time() + seconds)
+            state["tokens"] = min(state["tokens"], 0)
+
+    def acquire(self, client, on_wait=None, timeout=120):
+        """
+        Take one call for ``client``, waiting in the queue when needed.
+
+        ``on_wait(position, eta_seconds)`` is called while waiting. Raises
+        QuotaExceeded when the client or the daily quota is used up and
+        TimeoutError when the turn did not come within ``timeout`` seconds.
+        """
+        client = str(client)
+        ticket = f"{os.getpid()}-{next(self._tickets)}"
+        deadline = time.time() + timeout
+        while True:
+            with self._state() as state:
+                now = time.time()
+                self._refill(state, now)
+                queue = state["queue"]
+                if len(state["clients"].get(client, [])) >= self.client_quota:
+                    queue[:] = [w for w in queue if w["ticket"] != ticket]
+                    raise QuotaExceeded("client quota used up")
+                if self.daily_quota and len(state["day"]) >= self.daily_quota:
+                    queue[:] = [w for w in queue if w["ticket"] != ticket]
+                    raise QuotaExceeded("daily quota used up")
+
+                position = next(
+                    (i for i, w in enumerate(queue) if w["ticket"] == ticket), None
+                )
+                if position is None:
+                    queue.append({"ticket": ticket, "client": client, "heartbeat": now})
+                    position = len(queue) - 1
+                else:
+                    queue[position]["heartbeat"] = now
+
+                eta = self._eta(state, position, now)
+                if position == 0 and eta == 0:
+                    queue.pop(0)
+                    state["tokens"] -= 1
+                    state["clients"].setdefault(client, []).append(now)
+                    state["day"].append(now)
+                    return
+                if now + eta > deadline:
+                    queue[:] = [w for w in queue if w["ticket"] != ticket]
+                    raise TimeoutError(f"no turn within {timeout:.0f} s")
+
+            if on_wait:
+                on_wait(position, eta)
+            time.sleep(min(POLL_INTERVAL, max(eta, 0.01)))
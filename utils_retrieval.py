@@ -0,0 +1,225 @@
+import argparse
+import hashlib
+import json
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from config import CACHE_PATH, DATABASE_PATH
+from utils_classes import corine_classes, eunis_labels, landscape_archetypes
+
+ECOSYSTEM_DATA_PATH = DATABASE_PATH / "ecosystem_data.xlsx"
+RETRIEVAL_INDEX_PATH = CACHE_PATH / "retrieval_index.npz"
+
+# Sheets of ecosystem_data.xlsx that hold row-per-record tables, with the row
+# (0-based, blank rows included) that holds the column names
+SHEETS = {
+    "Relational table": 1,
+    "CORINE and ESS habitats (V)": 0,
+    "EUNIS and CORINE": 1,
+    "Some references": 1,
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Characters of a record passed to the model
+MAX_RECORD_CHARS = 500
+TOP_K = 5
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+_STOPWORDS = set(
+    "a an and are as at be by can do does for from how i in is it of on or that "
+    "the their these this to what which with".split()
+)
+
+
+def tokenize(text):
+    """Lower-case word and dotted-code (e.g. ``3.1.1``) tokens of a text."""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def _clean(value):
+    return re.sub(r"\s+", " ", str(value)).strip()
+
+
+def _blocks(table):
+    """Split a sheet into side-by-side tables separated by empty columns."""
+    empty = table.isna().all().values
+    start = None
+    for i, is_empty in enumerate(list(empty) + [True]):
+        if not is_empty and start is None:
+            start = i
+        elif is_empty and start is not None:
+            yield table.iloc[:, start:i]
+            start = None
+
+
+def _carry_down(table, columns):
+    """
+    Fill merged cells of the leading (grouping) columns.
+
+    A blank cell takes the value above only while no column to its left
+    starts a new group in that row.
+    """
+    original = table.iloc[:, :columns].notna().values
+    for j in range(columns):
+        continues = ~original[:, :j].any(axis=1)
+        filled = table.iloc[:, j].ffill()
+        table.iloc[:, j] = table.iloc[:, j].where(~continues, filled)
+    return table
+
+
+def _sheet_records(name, header_row):
+    sheet = pd.read_excel(ECOSYSTEM_DATA_PATH, sheet_name=name, header=None)
+    records = []
+    for table in _blocks(sheet):
+        header = table.iloc[header_row]
+        table = table.iloc[header_row + 1 :].dropna(how="all")
+        table.columns = [
+            _clean(h) if pd.notna(h) else f"column {i}" for i, h in enumerate(header)
+        ]
+        # drop lookup columns that repeat another column
+        table = table.loc[:, ~table.T.duplicated()]
+        filled = table.notna().mean().values
+        table = _carry_down(table, int(np.argmax(filled >= 0.8 * filled.max())))
+
+        for _, row in table.iterrows():
+            fields = [f"{col}: {_clean(v)}" for col, v in row.items() if pd.notna(v)]
+            if len(fields) > 1:
+                records.append(f"[{name}] " + "; ".join(fields))
+    return records
+
+
+def _class_records():
+    records = []
+    for archetype in landscape_archetypes.values():
+        classes = ", ".join(
+            f"{c} {corine_classes.get(c, '')}" for c in archetype["classes"]
+        )
+        records.append(
+            f"[Landscape archetypes] {archetype['description']}: CORINE classes {classes}"
+        )
+    for code, label in eunis_labels.items():
+        records.append(f"[EUNIS classes] EUNIS class {code}: {label}")
+    return records
+
+
+def source_records():
+    """Text records of the project ecosystem-service tables and class tables."""
+    records = []
+    for name, header_row in SHEETS.items():
+        records.extend(_sheet_records(name, header_row))
+    return records + _class_records()
+
+
+def _fingerprint():
+    stat = ECOSYSTEM_DATA_PATH.stat()
+    classes = json.dumps(
+        [corine_classes, eunis_labels, landscape_archetypes, SHEETS, K1, B],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(
+        f"{stat.st_size}:{stat.st_mtime_ns}:{classes}".encode()
+    ).hexdigest()
+
+
+def build_index(path=RETRIEVAL_INDEX_PATH):
+    """
+    Build and save the BM25 index of the source records.
+
+    The index is a dense records x terms matrix of BM25 term weights, so a
+    query is scored by summing the columns of its terms.
+    """
+    records = source_records()
+    tokens = [tokenize(record) for record in records]
+    vocabulary = sorted(set().union(*tokens))
+    column = {term: i for i, term in enumerate(vocabulary)}
+
+    counts = np.zeros((len(records), len(vocabulary)), dtype=np.float32)
+    for row, terms in enumerate(tokens):
+        for term in terms:
+            counts[row, column[term]] += 1
+
+    lengths = counts.sum(axis=1, keepdims=True)
+    frequency = (counts > 0).sum(axis=0)
+    idf = np.log(1 + (len(records) - frequency + 0.5) / (frequency + 0.5))
+    norm = K1 * (1 - B + B * lengths / lengths.mean())
+    weights = (counts * (K1 + 1) / (counts + norm) * idf).astype(np.float32)
+
+    np.savez_compressed(
+        path,
+        weights=weights,
+        vocabulary=np.array(vocabulary),
+        records=np.array(records),
+        fingerprint=np.array(_fingerprint()),
+    )
+    return path
+
+
+@st.cache_resource(show_spinner=False)
+def load_index(path=RETRIEVAL_INDEX_PATH):
+    """Load the saved index, rebuilding it when the source tables changed."""
+    if path.exists():
+        with np.load(path) as saved:
+            if str(saved["fingerprint"]) == _fingerprint():
+                index = {key: saved[key] for key in saved.files}
+                index["column"] = {t: i for i, t in enumerate(index["vocabulary"])}
+                return index
+    build_index(path)
+    return load_index.__wrapped__(path)
+
+
+def retrieve(query, k=TOP_K, index=None):
+    """The ``k`` best matching records for a query, as ``(score, text)``."""
+    index = index or load_index()
+    columns = [index["column"][t] for t in tokenize(query) if t in index["column"]]
+    if not columns:
+        return []
+    scores = index["weights"][:, columns].sum(axis=1)
+    top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(float(scores[i]), str(index["records"][i])) for i in top if scores[i] > 0]
+
+
+def context_block(query, k=TOP_K, index=None):
+    """Prompt section with the records most relevant to a question, or ''."""
+    hits = retrieve(query, k, index)
+    if not hits:
+        return ""
+    lines = [
+        "- "
+        + (text if len(text) <= MAX_RECORD_CHARS else text[:MAX_RECORD_CHARS] + "…")
+        for _, text in hits
+    ]
+    return (
+        "\nProject data relevant to the question (DesirMED ecosystem-service "
+        "tables); use it where it applies and say when you go beyond it:\n"
+        + "\n".join(lines)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild the EcoChat retrieval index, or query it."
+    )
+    parser.add_argument("query", nargs="?", help="question to retrieve records for")
+    parser.add_argument("-k", type=int, default=TOP_K)
+    args = parser.parse_args()
+
+    if args.query is None:
+        build_index()
+        print(f"Wrote {RETRIEVAL_INDEX_PATH}")
+    else:
+        index = load_index()
+        started = time.perf_counter()
+        hits = retrieve(args.query, args.k, index)
+        elapsed = (time.perf_counter() - started) * 1000
+        for score, text in hits:
+            print(f"{score:6.2f}  {text[:160]}")
+        print(f"{elapsed:.2f} ms")
@@ -0,0 +1,421 @@
+import argparse
+import json
+from pathlib import Path
+
+import ee
+import pandas as pd
+
+from config import REGIONS, RISK_CUBE_PATH
+from utils_ee_cache import cached_info
+from utils_materialize import materialize
+
+FLOOD_ASSETS = {
+    "High Probability": "projects/ee-desmond/assets/desirmed/floods_HP_2019",
+    "Medium Probability": "projects/ee-desmond/assets/desirmed/floods_MP_2019",
+    "Low Probability": "projects/ee-desmond/assets/desirmed/floods_LP_2019",
+}
+POPULATION_ASSET = (
+    "projects/ee-desmond/assets/desirmed/settlements_population_with_gender_age"
+)
+ECO_ASSET = "projects/ee-desmond/assets/desirmed/Ecosystem_Services_2018_Raster_Asset"
+BUILDINGS_ASSET = "projects/sat-io/open-datasets/MSBuildings/Croatia"
+ROADS_ASSET = "projects/sat-io/open-datasets/GRIP4/Europe"
+
+# Row of the cube for the whole case study
+ALL_SETTLEMENTS = "All Settlements"
+# Extents the case study's buildings and roads are counted in, by the live
+# panels and the cube alike
+BUILDINGS_BBOX = (16.3, 43.4, 16.6, 43.6)
+ROADS_BBOX = REGIONS["Split"]
+
+POP_YEARS = ["2011", "2021", "2025", "2030"]
+CHILDREN_PROPS = [
+    "female_F_0_2020",
+    "female_F_5_2020",
+    "female_F_10_2020",
+    "male_M_0_2020",
+    "male_M_5_2020",
+    "male_M_10_2020",
+]
+ELDERLY_PROPS = [
+    "female_F_65_2020",
+    "female_F_70_2020",
+    "female_F_75_2020",
+    "female_F_80_2020",
+    "male_M_65_2020",
+    "male_M_70_2020",
+    "male_M_75_2020",
+    "male_M_80_2020",
+]
+
+
+def eco_grid():
+    """Projection and scale of the ecosystem-services raster layers align to."""
+    projection = ee.Image(ECO_ASSET).projection()
+    return projection, projection.nominalScale()
+
+
+def flood_raster(scenario, start=False):
+    """
+    Flood depth classes of a scenario on the ecosystem-services grid, served
+    from its materialized asset once that exists. ``start`` exports it.
+    """
+    crs, scale = eco_grid()
+    fc = ee.FeatureCollection(FLOOD_ASSETS[scenario])
+    image = fc.reduceToImage(
+        properties=["M_KL_DUB"], reducer=ee.Reducer.first()
+    ).reproject(crs=crs, scale=scale)
+    name = "floods_" + "".join(word[0] for word in scenario.split())
+    return materialize(
+        image,
+        name,
+        fc.geometry().bounds(),
+        pyramiding="mode",
+        start=start,
+        crs=crs,
+        scale=scale,
+    )
+
+
+def population_raster(year, start=False):
+    """Settlement population of a year on the ecosystem-services grid."""
+    crs, scale = eco_grid()
+    fc = ee.FeatureCollection(POPULATION_ASSET)
+    image = fc.reduceToImage([f"pop_{year}"], ee.Reducer.first()).reproject(
+        crs=crs, scale=scale
+    )
+    return materialize(
+        image,
+        f"pop_{year}",
+        fc.geometry().bounds(),
+        start=start,
+        crs=crs,
+        scale=scale,
+    )
+
+
+def density_image(fc, props, band_name):
+    """
+    Rasterize per-feature totals as counts per pixel.
+
+    Each feature's summed properties are spread over its area, so summing the
+    image over any region yields the share of people living inside it rather
+    than repeating the settlement total in every pixel.
+    """
+
+    def per_m2(feature):
+        total = ee.Number(0)
+        for prop in props:
+            total = total.add(ee.Number(feature.get(prop)))
+        return feature.set(band_name, total.divide(feature.geometry().area(1)))
+
+    return (
+        fc.map(per_m2)
+        .reduceToImage([band_name], ee.Reducer.first())
+        .multiply(ee.Image.pixelArea())
+        .rename(band_name)
+    )
+
+
+def exposure_by_depth(depth_img, layers, geometry, crs, scale):
+    """
+    Sum every exposure layer per flood depth class in one reduceRegion.
+
+    ``layers`` maps a name to a counts-per-pixel image. Pixels outside the
+    flood extent fall in depth class 0, so the same call also returns the
+    totals for the whole geometry. Returns ``{depth_class: {name: value}}``
+    with an extra ``area`` entry in m².
+    """
+    names = list(layers) + ["area"]
+    bands = [layers[name].unmask(0).rename(name) for name in layers]
+    stack = ee.Image.cat(bands + [ee.Image.pixelArea().rename("area")]).addBands(
+        depth_img.unmask(0).toInt().rename("depth_class")
+    )
+    stats = cached_info(
+        stack.reduceRegion(
+            reducer=ee.Reducer.sum()
+            .repeat(len(names))
+            .group(groupField=len(names), groupName="depth_class"),
+            geometry=geometry,
+            crs=crs,
+            scale=scale,
+            maxPixels=1e13,
+        )
+    )
+
+    return {
+        int(group["depth_class"]): dict(zip(names, group["sum"]))
+        for group in stats.get("groups", [])
+    }
+
+
+def summarize_exposure(by_depth):
+    """Split an exposure_by_depth() result into (totals, exposed) dicts."""
+    totals, exposed = {}, {}
+    for depth_class, values in by_depth.items():
+        for name, value in values.items():
+            totals[name] = totals.get(name, 0) + value
+            if depth_class > 0:
+                exposed[name] = exposed.get(name, 0) + value
+    for name in totals:
+        exposed.setdefault(name, 0)
+    return totals, exposed
+
+
+# ---------------------- Precomputed risk cube ----------------------
+
+
+def _asset_versions():
+    assets = list(FLOOD_ASSETS.values()) + [
+        POPULATION_ASSET,
+        ECO_ASSET,
+        BUILDINGS_ASSET,
+        ROADS_ASSET,
+    ]
+    return {asset: ee.data.getAsset(asset).get("updateTime") for asset in assets}
+
+
+def _manifest_path(path):
+    return path.with_suffix(".json")
+
+
+def _paginate(fc, chunk_size):
+    """
+    Pages of a collection, each selected by its features' ids. The ids are
+    fetched once; slicing the collection with toList(count, offset) would
+    make the server rebuild the list prefix for every page.
+    """
+    ids = fc.aggregate_array("system:index").getInfo()
+    for offset in range(0, len(ids), chunk_size):
+        yield fc.filter(
+            ee.Filter.inList("system:index", ids[offset : offset + chunk_size])
+        )
+
+
+def _settlement_assets(chunk, roads, buildings):
+    def count(feature):
+        geom = feature.geometry()
+        return feature.set(
+            {
+                "roads_km": roads.filterBounds(geom).geometry().length(1).divide(1000),
+                "buildings": buildings.filterBounds(geom).size(),
+            }
+        )
+
+    return chunk.map(count).select(["NA_IME", "roads_km", "buildings"])
+
+
+def case_study_assets():
+    """Buildings and roads of the case study, as ``(buildings, roads)``."""
+    buildings = ee.FeatureCollection(BUILDINGS_ASSET).filterBounds(
+        ee.Geometry.BBox(*BUILDINGS_BBOX)
+    )
+    roads = ee.FeatureCollection(ROADS_ASSET).filterBounds(
+        ee.Geometry.BBox(*ROADS_BBOX)
+    )
+    return buildings, roads
+
+
+def _region_assets(roads, buildings):
+    """Road km and building count of the whole case study, counted once."""
+    return ee.Dictionary(
+        {
+            "roads_km": roads.geometry().length(1).divide(1000),
+            "buildings": buildings.size(),
+        }
+    ).getInfo()
+
+
+def _settlement_rows(name, scenario, props, counts):
+    """Cube rows of one settlement from its reduced sums and asset counts."""
+    share = props["area_exposed"] / props["area"] if props.get("area") else 0
+    rows = []
+    for year in POP_YEARS:
+        values = {
+            "population": (props[f"pop_{year}"], props[f"pop_{year}_exposed"]),
+            "children": (props["children"], props["children_exposed"]),
+            "elderly": (props["elderly"], props["elderly_exposed"]),
+            "roads_km": (counts["roads_km"], counts["roads_km"] * share),
+            "buildings": (counts["buildings"], counts["buildings"] * share),
+        }
+        for indicator, (total, exposed) in values.items():
+            rows.append(
+                {
+                    "settlement": name,
+                    "scenario": scenario,
+                    "year": year,
+                    "indicator": indicator,
+                    "total": total or 0,
+                    "exposed": exposed or 0,
+                }
+            )
+    return rows
+
+
+def _scenario_rows(
+    scenario, flood_fc, settlements, assets, region_assets, crs, scale, chunk_size
+):
+    """
+    Cube rows for one flood scenario; ``assets`` maps feature id to counts.
+
+    The ALL_SETTLEMENTS rows come from one reduction over the union of the
+    settlements, so assets shared by neighbouring settlements count once.
+    """
+    depth = flood_fc.reduceToImage(["M_KL_DUB"], ee.Reducer.first())
+    flooded = depth.unmask(0).gt(0)
+
+    layers = {
+        f"pop_{year}": density_image(settlements, [f"pop_{year}"], f"pop_{year}")
+        for year in POP_YEARS
+    }
+    layers["children"] = density_image(settlements, CHILDREN_PROPS, "children")
+    layers["elderly"] = density_image(settlements, ELDERLY_PROPS, "elderly")
+    layers["area"] = ee.Image.pixelArea().rename("area")
+
+    totals = ee.Image.cat([img.unmask(0).rename(name) for name, img in layers.items()])
+    stack = totals.addBands(
+        totals.multiply(flooded).rename([f"{n}_exposed" for n in layers])
+    )
+
+    rows = []
+    for chunk in _paginate(settlements, chunk_size):
+        stats = stack.reduceRegions(
+            collection=chunk.select(["NA_IME"]),
+            reducer=ee.Reducer.sum(),
+            crs=crs,
+            scale=scale,
+        ).getInfo()
+        for feature in stats["features"]:
+            props = feature["properties"]
+            rows += _settlement_rows(
+                props["NA_IME"], scenario, props, assets[feature["id"]]
+            )
+
+    union = stack.reduceRegion(
+        reducer=ee.Reducer.sum(),
+        geometry=settlements.geometry(),
+        crs=crs,
+        scale=scale,
+        maxPixels=1e13,
+    ).getInfo()
+    return rows + _settlement_rows(ALL_SETTLEMENTS, scenario, union, region_assets)
+
+
+def build_risk_cube(path=RISK_CUBE_PATH, chunk_size=200, force=False):
+    """
+    Compute (settlement × scenario × year × indicator) totals and exposure.
+
+    Settlements are reduced in pages of ``chunk_size`` with reduceRegions. Only
+    scenarios whose flood asset changed since the last build are recomputed,
+    unless one of the shared inputs changed or ``force`` is set. The cube is
+    stored as Parquet with a JSON manifest of asset update times next to it.
+    """
+    versions = _asset_versions()
+    manifest = _manifest_path(path)
+    previous = json.loads(manifest.read_text()) if manifest.exists() else {}
+    existing = pd.read_parquet(path) if path.exists() and not force else None
+
+    shared_changed = any(
+        versions[asset] != previous.get(asset)
+        for asset in [POPULATION_ASSET, ECO_ASSET, BUILDINGS_ASSET, ROADS_ASSET]
+    )
+    stale = [
+        scenario
+        for scenario, asset in FLOOD_ASSETS.items()
+        if existing is None or shared_changed or versions[asset] != previous.get(asset)
+    ]
+    if not stale:
+        print("Risk cube is up to date.")
+        return existing
+
+    settlements = ee.FeatureCollection(POPULATION_ASSET)
+    eco_img = ee.Image(ECO_ASSET)
+    crs = eco_img.projection()
+    scale = crs.nominalScale()
+
+    buildings, roads = case_study_assets()
+    assets = {}
+    for chunk in _paginate(settlements, chunk_size):
+        for feature in _settlement_assets(chunk, roads, buildings).getInfo()[
+            "features"
+        ]:
+            assets[feature["id"]] = feature["properties"]
+    region_assets = _region_assets(roads, buildings)
+
+    rows = []
+    for scenario in stale:
+        print(f"Computing {scenario} ...")
+        flood_fc = ee.FeatureCollection(FLOOD_ASSETS[scenario])
+        rows += _scenario_rows(
+            scenario,
+            flood_fc,
+            settlements,
+            assets,
+            region_assets,
+            crs,
+            scale,
+            chunk_size,
+        )
+
+    cube = pd.DataFrame(rows)
+    # Settlements sharing a name are merged, matching the name-based UI lookup
+    cube = cube.groupby(
+        ["settlement", "scenario", "year", "indicator"], as_index=False
+    )[["total", "exposed"]].sum()
+    if existing is not None:
+        cube = pd.concat(
+            [existing[~existing["scenario"].isin(stale)], cube], ignore_index=True
+        )
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cube.to_parquet(path, index=False)
+    manifest.write_text(json.dumps(versions, indent=2))
+    print(f"Wrote {len(cube)} rows to {path}")
+    return cube
+
+
+def load_risk_cube(path=RISK_CUBE_PATH):
+    """Read the precomputed risk cube, or None when it has not been built."""
+    if not path.exists():
+        return None
+    return pd.read_parquet(path)
+
+
+def cube_lookup(cube, settlement, scenario, year):
+    """
+    Return ``{indicator: (total, exposed)}`` for one panel selection.
+
+    ``"All Settlements"`` reads the row reduced over the whole case study;
+    cubes built before that row existed are summed over every settlement.
+    Returns None when the selection is not in the cube.
+    """
+    rows = cube[(cube["scenario"] == scenario) & (cube["year"] == year)]
+    if settlement != ALL_SETTLEMENTS or (rows["settlement"] == settlement).any():
+        rows = rows[rows["settlement"] == settlement]
+    if rows.empty:
+        return None
+    sums = rows.groupby("indicator")[["total", "exposed"]].sum()
+    return {ind: (row["total"], row["exposed"]) for ind, row in sums.iterrows()}
+
+
+if __name__ == "__main__":
+    from utils_ee import initialize_earth_engine
+
+    parser = argparse.ArgumentParser(description="Build the CRICS risk cube.")
+    parser.add_argument("--output", default=str(RISK_CUBE_PATH))
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--force", action="store_true", help="rebuild every scenario")
+    parser.add_argument(
+        "--materialize",
+        action="store_true",
+        help="also start (or check) the exports of the flood and population rasters",
+    )
+    args = parser.parse_args()
+
+    initialize_earth_engine()
+    if args.materialize:
+        for scenario in FLOOD_ASSETS:
+            flood_raster(scenario, start=True)
+        for year in POP_YEARS:
+            population_raster(year, start=True)
+    build_risk_cube(Path(args.output), chunk_size=args.chunk_size, force=args.force)
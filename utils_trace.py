@@ -0,0 +1,231 @@
+import collections
+import functools
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import ee
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from config import CACHE_PATH, EE_TRACE
+from utils_profile import SERVER_CALLS
+
+TRACE_LOG_PATH = CACHE_PATH / "ee_trace.jsonl"
+# The log is rotated to ee_trace.jsonl.1 beyond this size
+MAX_LOG_BYTES = 50 * 1024 * 1024
+# Calls kept per session between two debug panels
+MAX_RECORDS = 1000
+
+# ee.data functions that make a round trip, and where their expression sits
+TRACED_CALLS = {
+    **SERVER_CALLS,
+    "getTableDownloadId": lambda args: args[0].get("table"),
+    "getInfo": lambda args: None,
+    "getAsset": lambda args: None,
+    "listAssets": lambda args: None,
+    "listImages": lambda args: None,
+    "exportImage": lambda args: None,
+    "exportTable": lambda args: None,
+}
+
+ROOT = Path(__file__).resolve().parent
+_HERE = str(Path(__file__).resolve())
+
+_lock = threading.Lock()
+_local = threading.local()
+_sessions = collections.defaultdict(lambda: collections.deque(maxlen=MAX_RECORDS))
+_originals = {}
+_listeners = []
+
+
+def _caller():
+    """``(page, location)`` of the app code that made the call."""
+    page = location = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        path = frame.f_code.co_filename
+        if path != _HERE and path.startswith(str(ROOT)):
+            if location is None:
+                name = os.path.relpath(path, ROOT)
+                location = f"{name}:{frame.f_lineno} {frame.f_code.co_name}"
+            if "pages" in Path(path).parts or path.endswith("Home.py"):
+                page = os.path.relpath(path, ROOT)
+        frame = frame.f_back
+    return page, location
+
+
+def _size(value):
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return None
+
+
+def _write(record):
+    with _lock:
+        if TRACE_LOG_PATH.exists() and TRACE_LOG_PATH.stat().st_size > MAX_LOG_BYTES:
+            os.replace(TRACE_LOG_PATH, f"{TRACE_LOG_PATH}.1")
+        with open(TRACE_LOG_PATH, "a") as handle:
+            handle.write(json.dumps(record) + "\n")
+
+
+def _describe(name, args):
+    expr = TRACED_CALLS[name](args) if args else None
+    if isinstance(expr, ee.ComputedObject):
+        serialized = expr.serialize()
+        digest = hashlib.sha1(serialized.encode("utf-8")).hexdigest()[:12]
+        request_bytes = len(serialized)
+    else:
+        digest, request_bytes = None, _size(args)
+    page, location = _caller()
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return {
+        "ts": time.time(),
+        "session": ctx.session_id if ctx else None,
+        "page": page,
+        "location": location,
+        "call": name,
+        "hash": digest,
+        "request_bytes": request_bytes,
+    }
+
+
+def _traced(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # calls made by another traced call (e.g. getInfo inside a helper)
+        # belong to the outer one
+        if getattr(_local, "active", False):
+            return func(*args, **kwargs)
+
+        # without EE_TRACE only the call, its latency and error are kept
+        record = _describe(name, args) if EE_TRACE else {"call": name}
+        started = time.perf_counter()
+        _local.active = True
+        try:
+            result = func(*args, **kwargs)
+            if EE_TRACE:
+                record["response_bytes"] = _size(result)
+            record["error"] = None
+            return result
+        except Exception as e:
+            record["response_bytes"] = None
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _local.active = False
+            record["latency"] = time.perf_counter() - started
+            for listener in _listeners:
+                listener(record)
+            if EE_TRACE:
+                _write(record)
+                if record["session"]:
+                    with _lock:
+                        _sessions[record["session"]].append(record)
+
+    return wrapper
+
+
+def install():
+    """Wrap the Earth Engine client entry points; safe to call repeatedly."""
+    with _lock:
+        for name in TRACED_CALLS:
+            if name not in _originals and hasattr(ee.data, name):
+                _originals[name] = getattr(ee.data, name)
+                setattr(ee.data, name, _traced(name, _originals[name]))
+
+
+def add_listener(listener):
+    """Call ``listener(record)`` after every wrapped call, e.g. for metrics."""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def uninstall():
+    """Restore the original Earth Engine client functions."""
+    with _lock:
+        for name, func in _originals.items():
+            setattr(ee.data, name, func)
+        _originals.clear()
+
+
+def session_calls():
+    """Calls made by this session since the last call, oldest first."""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return pd.DataFrame()
+    with _lock:
+        records = list(_sessions.pop(ctx.session_id, []))
+    return pd.DataFrame(records)
+
+
+def waterfall(calls):
+    """Horizontal bars of each call's start and duration within the rerun."""
+    start = calls["ts"].min()
+    labels = [
+        f"{i + 1}. {row.call} {row.location or ''}"
+        for i, row in enumerate(calls.itertuples())
+    ]
+    fig = go.Figure(
+        go.Bar(
+            y=labels,
+            x=calls["latency"],
+            base=calls["ts"] - start,
+            orientation="h",
+            marker_color=["#d62728" if e else "#1f77b4" for e in calls["error"]],
+            customdata=calls[["hash", "request_bytes", "response_bytes", "error"]],
+            hovertemplate=(
+                "%{x:.2f} s<br>hash %{customdata[0]}<br>sent %{customdata[1]} B"
+                "<br>received %{customdata[2]} B<br>%{customdata[3]}<extra></extra>"
+            ),
+        )
+    )
+    fig.update_layout(
+        height=120 + 22 * len(calls),
+        margin=dict(l=10, r=10, t=30, b=10),
+        xaxis_title="seconds since the first call",
+        yaxis=dict(autorange="reversed"),
+    )
+    return fig
+
+
+def trace_panel():
+    """
+    Debug panel with the Earth Engine calls of this rerun.
+
+    Shown when tracing is enabled (``EE_TRACE=1``); call it at the end of a page.
+    """
+    if not EE_TRACE:
+        return
+    calls = session_calls()
+    with st.expander(f"Earth Engine calls this run ({len(calls)})"):
+        if calls.empty:
+            st.write("No Earth Engine calls.")
+            return
+        st.plotly_chart(waterfall(calls), use_container_width=True)
+        st.dataframe(
+            calls[
+                [
+                    "call",
+                    "location",
+                    "hash",
+                    "latency",
+                    "request_bytes",
+                    "response_bytes",
+                    "error",
+                ]
+            ].round({"latency": 3}),
+            hide_index=True,
+        )
+        st.caption(f"Every traced call is also logged to {TRACE_LOG_PATH}")
+
+
+if EE_TRACE:
+    install()